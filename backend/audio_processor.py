@@ -2,31 +2,112 @@ from moviepy.editor import VideoFileClip, AudioFileClip, concatenate_audioclips,
 from pathlib import Path
 import os
 
+from ffmpeg_utils import run_ffmpeg
+from media_info import get_media_cache
+from render_progress import render_logger
+from workspace import atomic_output, scratch_path
+
+# مرمز الصوت حسب حاوية الإخراج عند نسخ الفيديو كما هو
+AUDIO_CODECS = {".webm": "libopus", ".ogg": "libopus", ".ogv": "libopus"}
+FASTSTART_CONTAINERS = (".mp4", ".m4v", ".mov")
+
+# الحاويات التي تقبل كل مرمز صوت كما هو (الأولى هي الافتراضية)؛ mka تقبل كل شيء
+COPY_CONTAINERS = {
+    "aac": (".m4a", ".aac", ".mp4"),
+    "alac": (".m4a",),
+    "mp3": (".mp3",),
+    "opus": (".opus", ".webm", ".ogg"),
+    "vorbis": (".ogg", ".oga", ".webm"),
+    "flac": (".flac",),
+    "ac3": (".ac3",),
+    "eac3": (".eac3",),
+}
+# مرمز إعادة الترميز عندما تطلب صيغة لا تقبل المسار الأصلي
+AUDIO_ENCODERS = {
+    ".m4a": "aac",
+    ".aac": "aac",
+    ".mp4": "aac",
+    ".mp3": "libmp3lame",
+    ".opus": "libopus",
+    ".webm": "libopus",
+    ".ogg": "libvorbis",
+    ".oga": "libvorbis",
+    ".flac": "flac",
+    ".wav": "pcm_s16le",
+    ".ac3": "ac3",
+    ".mka": "aac",
+}
+
 class AudioProcessor:
     def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
         self.upload_dir = Path(upload_dir)
         self.processed_dir = Path(processed_dir)
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
     
-    def extract_audio(self, video_filename: str, output_filename: str):
-        """استخراج الصوت من الفيديو"""
+    def audio_streams(self, input_path) -> list:
+        """مسارات الصوت في الملف بترتيبها (الفهرس المستخدم في 0:a:N)"""
+        return [stream for stream in self.media_cache.get(input_path)["streams"] if stream["type"] == "audio"]
+    
+    def audio_output_filename(self, input_path, output_filename: str, stream_index: int = 0) -> str:
+        """إضافة امتداد الحاوية المطابقة لمرمز المسار إذا لم يحدد اسم الإخراج امتداداً"""
+        if Path(output_filename).suffix:
+            return output_filename
+        streams = self.audio_streams(input_path)
+        if not 0 <= stream_index < len(streams):
+            return output_filename
+        containers = COPY_CONTAINERS.get(streams[stream_index]["codec"], (".mka",))
+        return output_filename + containers[0]
+    
+    def extract_audio(self, video_filename: str, output_filename: str, stream_index: int = 0):
+        """استخراج مسار صوت من الفيديو
+        
+        ينسخ المسار كما هو (بت ببت) إذا كان امتداد الإخراج يقبل مرمزه
+        (AAC إلى m4a، Opus إلى opus/webm، MP3 إلى mp3...)، ولا يعيد الترميز إلا عند
+        طلب صيغة مختلفة. بدون امتداد تُستخدم الحاوية المطابقة للمرمز.
+        stream_index: ترتيب مسار الصوت في الملفات متعددة المسارات (0 للأول).
+        """
         try:
             input_path = self.upload_dir / video_filename
+            if not input_path.exists():
+                input_path = self.processed_dir / video_filename
+                if not input_path.exists():
+                    return {"success": False, "error": "الملف غير موجود"}
+            
+            streams = self.audio_streams(input_path)
+            if not streams:
+                return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
+            if not 0 <= stream_index < len(streams):
+                return {"success": False, "error": f"مسار الصوت {stream_index} غير موجود (عدد المسارات {len(streams)})"}
+            
+            codec = streams[stream_index]["codec"]
+            output_filename = self.audio_output_filename(input_path, output_filename, stream_index)
             output_path = self.processed_dir / output_filename
+            suffix = output_path.suffix.lower()
             
-            if not input_path.exists():
-                return {"success": False, "error": "الملف غير موجود"}
+            if suffix == ".mka" or suffix in COPY_CONTAINERS.get(codec, ()):
+                mode = "copy"
+                codec_args = ["-c:a", "copy"]
+            elif suffix in AUDIO_ENCODERS:
+                mode = "reencode"
+                codec_args = ["-c:a", AUDIO_ENCODERS[suffix]]
+            else:
+                return {"success": False, "error": "صيغة الصوت غير مدعومة"}
             
-            with VideoFileClip(str(input_path)) as video:
-                if video.audio is None:
-                    return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
-                
-                video.audio.write_audiofile(str(output_path))
+            args = ["-i", input_path, "-map", f"0:a:{stream_index}", "-vn", "-sn", "-dn"] + codec_args
+            if suffix in (".m4a", ".mp4"):
+                args += ["-movflags", "+faststart"]
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg(args + [tmp_output], duration=self.media_cache.get(input_path).get("duration"), stage="audio")
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": mode,
+                "codec": codec if mode == "copy" else AUDIO_ENCODERS[suffix],
+                "source_codec": codec,
+                "stream_index": stream_index
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -55,40 +136,49 @@ class AudioProcessor:
                 if not audio_path.exists():
                     return {"success": False, "error": "ملف الصوت غير موجود"}
             
+            info = self.media_cache.get(video_path)
+            music = f"[1:a:0]volume={music_volume}"
+            if info["has_audio"]:
+                # CompositeAudioClip يجمع المسارين دون تطبيع، وكذلك amix مع normalize=0
+                audio_filter = (f"{music}[m];[0:a:0]volume={original_volume}[o];"
+                                "[o][m]amix=inputs=2:duration=first:normalize=0[aout]")
+            else:
+                audio_filter = f"{music}[aout]"
+            if info.get("duration") and self.copy_video_with_audio(
+                ["-i", video_path, "-stream_loop", "-1", "-i", audio_path],
+                output_path,
+                audio_filter=audio_filter,
+                duration=info["duration"]
+            ):
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "size": os.path.getsize(output_path),
+                    "mode": "copy"
+                }
+            
             with VideoFileClip(str(video_path)) as video:
                 with AudioFileClip(str(audio_path)) as background_music:
-                    # تكرار الموسيقى إذا كانت أقصر من الفيديو
-                    if background_music.duration < video.duration:
-                        n_loops = int(video.duration / background_music.duration) + 1
-                        background_music = concatenate_audioclips([background_music] * n_loops)
-                    
-                    # قص الموسيقى لتناسب طول الفيديو
-                    background_music = background_music.subclipped(0, video.duration)
-                    
-                    # ضبط مستوى الصوت
-                    background_music = background_music.with_volume_scaled(music_volume)
-                    
-                    # دمج الصوت
-                    if video.audio is not None:
-                        original_audio = video.audio.with_volume_scaled(original_volume)
-                        final_audio = CompositeAudioClip([original_audio, background_music])
-                    else:
-                        final_audio = background_music
-                    
-                    final_video = video.with_audio(final_audio)
-                    final_video.write_videofile(
-                        str(output_path),
-                        codec='libx264',
-                        audio_codec='aac',
-                        temp_audiofile='temp-audio.m4a',
-                        remove_temp=True
+                    final_video = self.mix_background_music(
+                        video, background_music, music_volume, original_volume
                     )
+                    with atomic_output(output_path) as tmp_output:
+                        final_video.write_videofile(
+                            str(tmp_output),
+                            codec='libx264',
+                            audio_codec='aac',
+                            temp_audiofile=scratch_path('temp-audio.m4a'),
+                            remove_temp=True,
+                            logger=render_logger()
+                        )
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -109,6 +199,24 @@ class AudioProcessor:
                 if not input_path.exists():
                     return {"success": False, "error": "الملف غير موجود"}
             
+            info = self.media_cache.get(input_path)
+            if not info["has_audio"]:
+                return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
+            
+            if self.copy_video_with_audio(
+                ["-i", input_path],
+                output_path,
+                audio_filter=f"[0:a:0]volume={volume}[aout]",
+                progress_duration=info.get("duration")
+            ):
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "size": os.path.getsize(output_path),
+                    "mode": "copy"
+                }
+            
             with VideoFileClip(str(input_path)) as video:
                 if video.audio is None:
                     return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
@@ -116,19 +224,22 @@ class AudioProcessor:
                 adjusted_audio = video.audio.with_volume_scaled(volume)
                 final_video = video.with_audio(adjusted_audio)
                 
-                final_video.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    final_video.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -155,31 +266,41 @@ class AudioProcessor:
                 if not audio_path.exists():
                     return {"success": False, "error": "ملف الصوت غير موجود"}
             
+            # تكرار الصوت ثم قصه على طول الفيديو كما في fit_audio_duration
+            duration = self.media_cache.get(video_path).get("duration")
+            if duration and self.copy_video_with_audio(
+                ["-i", video_path, "-stream_loop", "-1", "-i", audio_path],
+                output_path,
+                audio_map="1:a:0",
+                duration=duration
+            ):
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "size": os.path.getsize(output_path),
+                    "mode": "copy"
+                }
+            
             with VideoFileClip(str(video_path)) as video:
                 with AudioFileClip(str(audio_path)) as new_audio:
-                    # قص/تمديد الصوت ليطابق طول الفيديو
-                    if new_audio.duration > video.duration:
-                        new_audio = new_audio.subclipped(0, video.duration)
-                    elif new_audio.duration < video.duration:
-                        # تكرار الصوت
-                        n_loops = int(video.duration / new_audio.duration) + 1
-                        new_audio = concatenate_audioclips([new_audio] * n_loops)
-                        new_audio = new_audio.subclipped(0, video.duration)
-                    
-                    final_video = video.with_audio(new_audio)
-                    final_video.write_videofile(
-                        str(output_path),
-                        codec='libx264',
-                        audio_codec='aac',
-                        temp_audiofile='temp-audio.m4a',
-                        remove_temp=True
-                    )
+                    final_video = video.with_audio(self.fit_audio_duration(new_audio, video.duration))
+                    with atomic_output(output_path) as tmp_output:
+                        final_video.write_videofile(
+                            str(tmp_output),
+                            codec='libx264',
+                            audio_codec='aac',
+                            temp_audiofile=scratch_path('temp-audio.m4a'),
+                            remove_temp=True,
+                            logger=render_logger()
+                        )
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -195,20 +316,37 @@ class AudioProcessor:
                 if not input_path.exists():
                     return {"success": False, "error": "الملف غير موجود"}
             
+            # إعادة تغليف فقط: لا فك ترميز ولا ترميز
+            if self.copy_video_with_audio(
+                ["-i", input_path],
+                output_path,
+                progress_duration=self.media_cache.get(input_path).get("duration")
+            ):
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "size": os.path.getsize(output_path),
+                    "mode": "copy"
+                }
+            
             with VideoFileClip(str(input_path)) as video:
                 video_without_audio = video.without_audio()
-                video_without_audio.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    video_without_audio.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -230,33 +368,131 @@ class AudioProcessor:
                 if not input_path.exists():
                     return {"success": False, "error": "الملف غير موجود"}
             
+            info = self.media_cache.get(input_path)
+            if not info["has_audio"]:
+                return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
+            
+            duration = info.get("duration")
+            fades = ["anull"]
+            if fade_in_duration > 0:
+                fades.append(f"afade=t=in:st=0:d={fade_in_duration}")
+            if fade_out_duration > 0 and duration:
+                fades.append(f"afade=t=out:st={max(duration - fade_out_duration, 0):.6f}:d={fade_out_duration}")
+            # بداية التلاشي في النهاية تحتاج مدة معروفة
+            can_copy = duration or fade_out_duration <= 0
+            if can_copy and self.copy_video_with_audio(
+                ["-i", input_path],
+                output_path,
+                audio_filter=f"[0:a:0]{','.join(fades)}[aout]",
+                progress_duration=duration
+            ):
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "size": os.path.getsize(output_path),
+                    "mode": "copy"
+                }
+            
             with VideoFileClip(str(input_path)) as video:
                 if video.audio is None:
                     return {"success": False, "error": "الفيديو لا يحتوي على صوت"}
                 
-                audio = video.audio
-                
-                if fade_in_duration > 0:
-                    audio = audio.with_effects_on_subclip(0, fade_in_duration, lambda c: c.with_volume_scaled(0))
-                
-                if fade_out_duration > 0:
-                    start_fade = video.duration - fade_out_duration
-                    audio = audio.with_effects_on_subclip(start_fade, video.duration, lambda c: c.with_volume_scaled(0))
-                
+                audio = self.apply_audio_fades(video.audio, video.duration, fade_in_duration, fade_out_duration)
                 final_video = video.with_audio(audio)
-                final_video.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    final_video.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "size": os.path.getsize(output_path)
+                "size": os.path.getsize(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
+    
+    def copy_video_with_audio(self, inputs: list, output_path, audio_map: str = None,
+                              audio_filter: str = None, duration: float = None,
+                              progress_duration: float = None):
+        """نسخ مسار الفيديو كما هو ومعالجة وترميز الصوت وحده عبر ffmpeg
+        
+        inputs: وسائط الإدخال (الفيديو دائماً هو الإدخال 0). audio_filter رسم فلاتر
+        ينتهي بـ [aout]، أو audio_map لمسار صوت يُرمَّز كما هو، أو لا شيء لإزالة الصوت.
+        duration يقص المخرج (-t)، و progress_duration مدة المخرج المتوقعة لتقارير
+        التقدم فقط دون قص.
+        يرجع False إذا تعذر نسخ الفيديو إلى الحاوية المطلوبة ليُستخدم مسار moviepy.
+        """
+        output_path = Path(output_path)
+        args = list(inputs)
+        if audio_filter:
+            args += ["-filter_complex", audio_filter]
+            audio_map = "[aout]"
+        args += ["-map", "0:v:0", "-c:v", "copy"]
+        if audio_map:
+            args += ["-map", audio_map, "-c:a", AUDIO_CODECS.get(output_path.suffix.lower(), "aac")]
+        else:
+            args += ["-an"]
+        if duration:
+            args += ["-t", f"{duration:.6f}"]
+        if output_path.suffix.lower() in FASTSTART_CONTAINERS:
+            args += ["-movflags", "+faststart"]
+        
+        try:
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg(args + [tmp_output], duration=duration or progress_duration, stage="audio")
+        except RuntimeError:
+            return False
+        return True
+    
+    def mix_background_music(self, video, background_music, music_volume: float = 0.3, original_volume: float = 1.0):
+        """دمج موسيقى خلفية مع صوت المقطع"""
+        # تكرار الموسيقى إذا كانت أقصر من الفيديو
+        if background_music.duration < video.duration:
+            n_loops = int(video.duration / background_music.duration) + 1
+            background_music = concatenate_audioclips([background_music] * n_loops)
+        
+        # قص الموسيقى لتناسب طول الفيديو
+        background_music = background_music.subclipped(0, video.duration)
+        
+        # ضبط مستوى الصوت
+        background_music = background_music.with_volume_scaled(music_volume)
+        
+        # دمج الصوت
+        if video.audio is not None:
+            original_audio = video.audio.with_volume_scaled(original_volume)
+            final_audio = CompositeAudioClip([original_audio, background_music])
+        else:
+            final_audio = background_music
+        
+        return video.with_audio(final_audio)
+    
+    def fit_audio_duration(self, audio, duration: float):
+        """قص/تمديد الصوت ليطابق طول الفيديو"""
+        if audio.duration > duration:
+            return audio.subclipped(0, duration)
+        if audio.duration < duration:
+            # تكرار الصوت
+            n_loops = int(duration / audio.duration) + 1
+            audio = concatenate_audioclips([audio] * n_loops)
+            return audio.subclipped(0, duration)
+        return audio
+    
+    def apply_audio_fades(self, audio, duration: float, fade_in_duration: float = 0, fade_out_duration: float = 0):
+        """تطبيق التلاشي على بداية ونهاية الصوت"""
+        if fade_in_duration > 0:
+            audio = audio.with_effects_on_subclip(0, fade_in_duration, lambda c: c.with_volume_scaled(0))
+        
+        if fade_out_duration > 0:
+            start_fade = duration - fade_out_duration
+            audio = audio.with_effects_on_subclip(start_fade, duration, lambda c: c.with_volume_scaled(0))
+        
+        return audio
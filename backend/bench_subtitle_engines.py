@@ -0,0 +1,48 @@
+"""مقارنة زمن حرق الترجمات بين المحركات على نفس الفيديو ونفس ملف SRT
+
+الاستخدام (من مجلد backend، والملفات داخل ../uploads):
+    python bench_subtitle_engines.py video.mp4 subtitles.srt --engines compositor libass
+"""
+from pathlib import Path
+import argparse
+import time
+
+from subtitle_processor import SubtitleProcessor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark subtitle burn-in engines")
+    parser.add_argument("video_filename")
+    parser.add_argument("subtitle_filename")
+    parser.add_argument("--engines", nargs="+", default=["compositor", "libass", "moviepy"])
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--fontsize", type=int, default=24)
+    parser.add_argument("--bg-color", default=None)
+    args = parser.parse_args()
+
+    processor = SubtitleProcessor()
+    subtitle_data = processor.load_srt_file(args.subtitle_filename)
+    if not subtitle_data.get("success"):
+        raise SystemExit(subtitle_data.get("error"))
+    subtitles = subtitle_data["subtitles"]
+
+    print(f"{len(subtitles)} cues, {args.runs} run(s) per engine")
+    for engine in args.engines:
+        output_filename = f"bench_{engine}_{Path(args.video_filename).stem}.mp4"
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = processor.add_subtitles_to_video(
+                args.video_filename, subtitles, output_filename,
+                fontsize=args.fontsize, bg_color=args.bg_color, engine=engine
+            )
+            timings.append(time.perf_counter() - start)
+            if not result.get("success"):
+                print(f"{engine:>10}: failed: {result.get('error')}")
+                break
+        else:
+            print(f"{engine:>10}: best {min(timings):.2f}s, mean {sum(timings) / len(timings):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip, ImageClip
 from pathlib import Path
 import os
-import numpy as np
+
+from frame_filters import (
+    ContrastStage, FilterChain, brightness_stage, grayscale_stage, sepia_stage, invert_stage
+)
+from text_shaping import shape_text
+from render_progress import render_logger
+from workspace import atomic_output, scratch_path
 
 class ContentLibrary:
     def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
@@ -24,6 +30,16 @@ class ContentLibrary:
             "blur": self.apply_blur_filter,
             "invert": self.apply_invert_filter
         }
+        
+        # دوال تُنشئ تحويل الإطار لكل فلتر (تُستخدم لبناء السلاسل المدمجة)
+        self.filter_stages = {
+            "brightness": brightness_stage,
+            "contrast": ContrastStage,
+            "grayscale": grayscale_stage,
+            "sepia": sepia_stage,
+            "blur": self.blur_stage,
+            "invert": invert_stage
+        }
     
     def apply_transition(
         self,
@@ -70,7 +86,15 @@ class ContentLibrary:
             clip2_with_fadein = clip2_with_fadein.with_start(clip1.duration - duration)
             
             final = CompositeVideoClip([clip1_with_fadeout, clip2_with_fadein])
-            final.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            with atomic_output(output_path) as tmp_output:
+                final.write_videofile(
+                    str(tmp_output),
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=scratch_path('temp-audio.m4a'),
+                    remove_temp=True,
+                    logger=render_logger()
+                )
         return True
     
     def apply_crossfade_transition(self, clip1_path, clip2_path, output_path, duration):
@@ -89,7 +113,15 @@ class ContentLibrary:
             clip2 = clip2.with_position(slide_left)
             
             final = CompositeVideoClip([clip1, clip2], size=(w, h))
-            final.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            with atomic_output(output_path) as tmp_output:
+                final.write_videofile(
+                    str(tmp_output),
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=scratch_path('temp-audio.m4a'),
+                    remove_temp=True,
+                    logger=render_logger()
+                )
         return True
     
     def apply_slide_right_transition(self, clip1_path, clip2_path, output_path, duration):
@@ -104,7 +136,15 @@ class ContentLibrary:
             clip2 = clip2.with_position(slide_right)
             
             final = CompositeVideoClip([clip1, clip2], size=(w, h))
-            final.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            with atomic_output(output_path) as tmp_output:
+                final.write_videofile(
+                    str(tmp_output),
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=scratch_path('temp-audio.m4a'),
+                    remove_temp=True,
+                    logger=render_logger()
+                )
         return True
     
     def apply_zoom_transition(self, clip1_path, clip2_path, output_path, duration):
@@ -118,17 +158,26 @@ class ContentLibrary:
             clip2_with_fadein = clip2_with_fadein.with_start(clip1.duration - duration)
             
             final = CompositeVideoClip([clip1_zoomed, clip2_with_fadein])
-            final.write_videofile(output_path, codec='libx264', audio_codec='aac')
+            with atomic_output(output_path) as tmp_output:
+                final.write_videofile(
+                    str(tmp_output),
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=scratch_path('temp-audio.m4a'),
+                    remove_temp=True,
+                    logger=render_logger()
+                )
         return True
     
     def apply_filter(
         self,
         video_filename: str,
         output_filename: str,
-        filter_type: str,
-        intensity: float = 1.0
+        filter_type: str = None,
+        intensity: float = 1.0,
+        chain: list = None
     ):
-        """تطبيق فلتر على الفيديو"""
+        """تطبيق فلتر أو سلسلة فلاتر [(filter, intensity), ...] في تمريرة واحدة"""
         try:
             input_path = self.upload_dir / video_filename
             output_path = self.processed_dir / output_filename
@@ -138,19 +187,22 @@ class ContentLibrary:
                 if not input_path.exists():
                     return {"success": False, "error": "الملف غير موجود"}
             
-            filter_func = self.filters.get(filter_type)
-            if not filter_func:
+            if chain is None:
+                chain = [(filter_type, intensity)]
+            if not chain or any(name not in self.filters for name, _ in chain):
                 return {"success": False, "error": "الفلتر غير مدعوم"}
             
             with VideoFileClip(str(input_path)) as video:
-                filtered_video = filter_func(video, intensity)
-                filtered_video.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                filtered_video = self.apply_filter_chain(video, chain)
+                with atomic_output(output_path) as tmp_output:
+                    filtered_video.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -161,55 +213,41 @@ class ContentLibrary:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def apply_filter_chain(self, video, chain: list):
+        """دمج الفلاتر اللونية المتجاورة في تحويل واحد وتطبيق السلسلة كاملة لكل إطار"""
+        stages = [self.filter_stages[name](intensity) for name, intensity in chain]
+        return video.image_transform(FilterChain(stages))
+    
+    def blur_stage(self, intensity):
+        from scipy.ndimage import gaussian_filter
+        def blur_effect(image):
+            blurred = gaussian_filter(image, sigma=intensity * 3)
+            return blurred.astype('uint8')
+        return blur_effect
+    
     def apply_brightness_filter(self, video, intensity):
         """فلتر السطوع"""
-        def brightness_effect(image):
-            return np.clip(image * (1 + (intensity - 1)), 0, 255).astype('uint8')
-        return video.image_transform(brightness_effect)
+        return video.image_transform(brightness_stage(intensity))
     
     def apply_contrast_filter(self, video, intensity):
         """فلتر التباين"""
-        def contrast_effect(image):
-            factor = intensity
-            mean = np.mean(image)
-            return np.clip((image - mean) * factor + mean, 0, 255).astype('uint8')
-        return video.image_transform(contrast_effect)
+        return video.image_transform(ContrastStage(intensity))
     
     def apply_grayscale_filter(self, video, intensity):
         """فلتر أبيض وأسود"""
-        def grayscale_effect(image):
-            gray = np.dot(image[...,:3], [0.299, 0.587, 0.114])
-            gray_rgb = np.stack([gray, gray, gray], axis=-1)
-            return (image * (1 - intensity) + gray_rgb * intensity).astype('uint8')
-        return video.image_transform(grayscale_effect)
+        return video.image_transform(grayscale_stage(intensity))
     
     def apply_sepia_filter(self, video, intensity):
         """فلتر سيبيا"""
-        def sepia_effect(image):
-            sepia_matrix = np.array([
-                [0.393, 0.769, 0.189],
-                [0.349, 0.686, 0.168],
-                [0.272, 0.534, 0.131]
-            ])
-            sepia_img = np.dot(image[...,:3], sepia_matrix.T)
-            sepia_img = np.clip(sepia_img, 0, 255)
-            return (image * (1 - intensity) + sepia_img * intensity).astype('uint8')
-        return video.image_transform(sepia_effect)
+        return video.image_transform(sepia_stage(intensity))
     
     def apply_blur_filter(self, video, intensity):
         """فلتر ضبابية"""
-        from scipy.ndimage import gaussian_filter
-        def blur_effect(image):
-            blurred = gaussian_filter(image, sigma=intensity * 3)
-            return blurred.astype('uint8')
-        return video.image_transform(blur_effect)
+        return video.image_transform(self.blur_stage(intensity))
     
     def apply_invert_filter(self, video, intensity):
         """فلتر عكس الألوان"""
-        def invert_effect(image):
-            inverted = 255 - image
-            return (image * (1 - intensity) + inverted * intensity).astype('uint8')
-        return video.image_transform(invert_effect)
+        return video.image_transform(invert_stage(intensity))
     
     def add_text_overlay(
         self,
@@ -232,23 +270,18 @@ class ContentLibrary:
                     return {"success": False, "error": "الملف غير موجود"}
             
             with VideoFileClip(str(input_path)) as video:
-                text_duration = duration if duration else video.duration
-                
-                txt_clip = TextClip(
-                    text=text,
-                    font_size=fontsize,
-                    color=color,
-                    duration=text_duration
-                ).with_position(position)
+                txt_clip = self.create_text_clip(video, text, position, fontsize, color, duration)
                 
                 final = CompositeVideoClip([video, txt_clip])
-                final.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    final.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -285,23 +318,18 @@ class ContentLibrary:
                     return {"success": False, "error": "ملف الملصق غير موجود"}
             
             with VideoFileClip(str(video_path)) as video:
-                sticker_duration = duration if duration else video.duration
-                
-                sticker = ImageClip(str(sticker_path), duration=sticker_duration)
-                
-                if size:
-                    sticker = sticker.resized(size)
-                
-                sticker = sticker.with_position(position)
+                sticker = self.create_sticker_clip(video, sticker_path, position, size, duration)
                 
                 final = CompositeVideoClip([video, sticker])
-                final.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    final.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -312,6 +340,30 @@ class ContentLibrary:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def create_text_clip(self, video, text: str, position: tuple = ('center', 'bottom'),
+                         fontsize: int = 50, color: str = 'white', duration: float = None):
+        """إنشاء مقطع نص بموضع ومدة محددين"""
+        text_duration = duration if duration else video.duration
+        
+        return TextClip(
+            text=shape_text(text),
+            font_size=fontsize,
+            color=color,
+            duration=text_duration
+        ).with_position(position)
+    
+    def create_sticker_clip(self, video, sticker_path, position: tuple = ('center', 'center'),
+                            size: tuple = None, duration: float = None):
+        """إنشاء مقطع ملصق من صورة"""
+        sticker_duration = duration if duration else video.duration
+        
+        sticker = ImageClip(str(sticker_path), duration=sticker_duration)
+        
+        if size:
+            sticker = sticker.resized(size)
+        
+        return sticker.with_position(position)
+    
     def get_available_transitions(self):
         """الحصول على قائمة الانتقالات المتاحة"""
         return list(self.transitions.keys())
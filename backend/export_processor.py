@@ -1,6 +1,26 @@
 from moviepy.editor import VideoFileClip
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
+import bisect
 import os
+import shutil
+import tempfile
+import time
+
+from ffmpeg_utils import kill_child_processes, run_ffmpeg, write_concat_list
+from media_info import get_media_cache
+from render_progress import render_logger, report as report_progress
+from workspace import atomic_output, disk_scratch, scratch_path
+
+# أقل مدة لكل جزء في التصدير المجزأ (بالثواني)
+MIN_SEGMENT_DURATION = 30
+
+# مدة أجزاء HLS/DASH؛ الإطارات المفتاحية تُفرض على حدودها في كل النسخ
+STREAMING_SEGMENT_DURATION = 6
+STREAMING_FORMATS = ("hls", "dash")
+# قائمة التشغيل الرئيسية في جذر مجلد كل تصدير HLS/DASH
+STREAMING_PLAYLISTS = {"hls": "master.m3u8", "dash": "manifest.mpd"}
 
 class ExportProcessor:
     def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
@@ -29,6 +49,8 @@ class ExportProcessor:
                 "bitrate": "16000k"
             }
         }
+        
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
     
     def export_video(
         self,
@@ -37,9 +59,18 @@ class ExportProcessor:
         quality: str = "1080p",
         format: str = "mp4",
         fps: int = None,
-        audio_bitrate: str = "192k"
+        audio_bitrate: str = "192k",
+        segmented: bool = False,
+        segments: int = None,
+        qualities: list = None,
+        formats: list = None
     ):
-        """تصدير الفيديو بجودة وصيغة محددة"""
+        """تصدير الفيديو بجودة وصيغة محددة
+
+        segmented: تقسيم المصدر عند الإطارات المفتاحية وترميز الأجزاء بالتوازي
+        qualities/formats: قوائم لتصدير عدة نسخ من فك ترميز واحد؛ كل تركيبة
+        تُحفظ باسم <اسم الإخراج>_<الجودة>.<الصيغة>
+        """
         try:
             input_path = self.upload_dir / input_filename
             output_path = self.processed_dir / output_filename
@@ -50,57 +81,51 @@ class ExportProcessor:
                 if not input_path.exists():
                     return {"success": False, "error": "الملف غير موجود"}
             
-            preset = self.quality_presets.get(quality)
+            if format in STREAMING_FORMATS:
+                return self._export_streaming(input_path, output_path, format, qualities, fps, audio_bitrate)
+            
+            if qualities or formats:
+                renditions = [
+                    {
+                        "quality": rendition_quality,
+                        "format": rendition_format,
+                        "output_file": f"{output_path.stem}_{rendition_quality}.{rendition_format}"
+                    }
+                    for rendition_quality in (qualities or [quality])
+                    for rendition_format in (formats or [format])
+                ]
+                return self._export_renditions(input_path, renditions, fps, audio_bitrate)
+            
+            if segmented:
+                result = self._export_segmented(
+                    input_path, output_path, quality, format, fps,
+                    audio_bitrate, segments
+                )
+                if result is not None:
+                    result.update({"output_file": output_filename, "format": format, "quality": quality})
+                    return result
             
             with VideoFileClip(str(input_path)) as video:
-                # تطبيق الجودة
-                if preset:
-                    # حساب الأبعاد مع الحفاظ على نسبة العرض
-                    target_width = preset["width"]
-                    target_height = preset["height"]
-                    
-                    aspect_ratio = video.w / video.h
-                    target_aspect = target_width / target_height
-                    
-                    if aspect_ratio > target_aspect:
-                        new_width = target_width
-                        new_height = int(target_width / aspect_ratio)
-                    else:
-                        new_height = target_height
-                        new_width = int(target_height * aspect_ratio)
-                    
-                    # تصغير/تكبير الفيديو
-                    if new_width != video.w or new_height != video.h:
-                        video_resized = video.resized((new_width, new_height))
-                    else:
-                        video_resized = video
-                else:
-                    video_resized = video
-                    preset = {"bitrate": "4000k"}
+                video_resized, bitrate = self.fit_to_quality(video, quality)
                 
                 # تحديد الـ FPS
                 final_fps = fps if fps else video.fps
                 
-                # تحديد codec حسب الصيغة
-                codec_map = {
-                    "mp4": "libx264",
-                    "webm": "libvpx-vp9",
-                    "avi": "mpeg4",
-                    "mov": "libx264"
-                }
-                codec = codec_map.get(format, "libx264")
+                codec, audio_codec = self.get_codecs(format)
                 
                 # تصدير الفيديو
-                video_resized.write_videofile(
-                    str(output_path),
-                    codec=codec,
-                    audio_codec='aac' if format in ['mp4', 'mov'] else 'libvorbis',
-                    bitrate=preset["bitrate"],
-                    audio_bitrate=audio_bitrate,
-                    fps=final_fps,
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    video_resized.write_videofile(
+                        str(tmp_output),
+                        codec=codec,
+                        audio_codec=audio_codec,
+                        bitrate=bitrate,
+                        audio_bitrate=audio_bitrate,
+                        fps=final_fps,
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             file_size = os.path.getsize(output_path)
             
@@ -138,23 +163,19 @@ class ExportProcessor:
             with VideoFileClip(str(input_path)) as video:
                 resized = video.resized((width, height))
                 
-                codec_map = {
-                    "mp4": "libx264",
-                    "webm": "libvpx-vp9",
-                    "avi": "mpeg4",
-                    "mov": "libx264"
-                }
-                codec = codec_map.get(format, "libx264")
+                codec, audio_codec = self.get_codecs(format)
                 
-                resized.write_videofile(
-                    str(output_path),
-                    codec=codec,
-                    audio_codec='aac' if format in ['mp4', 'mov'] else 'libvorbis',
-                    bitrate=bitrate,
-                    fps=fps,
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    resized.write_videofile(
+                        str(tmp_output),
+                        codec=codec,
+                        audio_codec=audio_codec,
+                        bitrate=bitrate,
+                        fps=fps,
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -165,10 +186,329 @@ class ExportProcessor:
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def target_size(self, width: int, height: int, quality: str):
+        """حساب الأبعاد المناسبة للجودة مع الحفاظ على نسبة العرض"""
+        preset = self.quality_presets.get(quality)
+        if not preset:
+            return width, height, "4000k"
+        
+        target_width = preset["width"]
+        target_height = preset["height"]
+        
+        aspect_ratio = width / height
+        target_aspect = target_width / target_height
+        
+        if aspect_ratio > target_aspect:
+            new_width = target_width
+            new_height = int(target_width / aspect_ratio)
+        else:
+            new_height = target_height
+            new_width = int(target_height * aspect_ratio)
+        
+        return new_width, new_height, preset["bitrate"]
+    
+    def fit_to_quality(self, video, quality: str):
+        """تغيير أبعاد المقطع ليناسب الجودة مع الحفاظ على نسبة العرض"""
+        new_width, new_height, bitrate = self.target_size(video.w, video.h, quality)
+        
+        # تصغير/تكبير الفيديو
+        if new_width != video.w or new_height != video.h:
+            return video.resized((new_width, new_height)), bitrate
+        return video, bitrate
+    
+    def split_at_keyframes(self, keyframes: list, duration: float, segments: int) -> list:
+        """تقسيم المدة إلى أجزاء متقاربة تبدأ كلها عند إطارات مفتاحية"""
+        boundaries = [0.0]
+        for i in range(1, segments):
+            target = duration * i / segments
+            index = bisect.bisect_left(keyframes, target)
+            candidates = keyframes[max(0, index - 1):index + 1]
+            if not candidates:
+                continue
+            keyframe = min(candidates, key=lambda k: abs(k - target))
+            if keyframe - boundaries[-1] >= MIN_SEGMENT_DURATION / 2:
+                boundaries.append(keyframe)
+        boundaries.append(duration)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+    
+    def _export_segmented(self, input_path, output_path, quality, format, fps,
+                          audio_bitrate, segments):
+        """ترميز أجزاء الفيديو بالتوازي ثم دمجها بدون إعادة ترميز
+        
+        يرجع None إذا كان المصدر أقصر من أن يستفيد من التقسيم
+        """
+        info = self.media_cache.get(input_path)
+        duration = info["duration"]
+        segments = segments or os.cpu_count() or 2
+        segments = min(segments, int(duration // MIN_SEGMENT_DURATION))
+        if segments < 2 or len(info["keyframes"]) < 2:
+            return None
+        
+        ranges = self.split_at_keyframes(info["keyframes"], duration, segments)
+        if len(ranges) < 2:
+            return None
+        
+        width, height, bitrate = self.target_size(info["width"], info["height"], quality)
+        # libx264/vp9 يتطلبان أبعاداً زوجية
+        width, height = width - width % 2, height - height % 2
+        codec, audio_codec = self.get_codecs(format)
+        video_args = [
+            "-vf", f"scale={width}:{height}",
+            "-c:v", codec,
+            "-b:v", bitrate,
+            "-pix_fmt", "yuv420p",
+        ]
+        if codec == "libx264":
+            video_args += ["-preset", "medium"]
+        if fps:
+            video_args += ["-r", fps]
+        # الأجزاء تعمل معاً، فتُقسم الأنوية بينها بدل أن يفتح كل مرمز خيطاً لكل نواة
+        video_args += ["-threads", max(1, (os.cpu_count() or 1) // len(ranges))]
+        
+        suffix = output_path.suffix or f".{format}"
+        started = time.time()
+        
+        with disk_scratch(self.processed_dir) as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            segment_paths = [tmp_dir / f"segment_{i:04d}{suffix}" for i in range(len(ranges))]
+            audio_path = tmp_dir / f"audio{'.m4a' if audio_codec == 'aac' else '.mka'}"
+            report = []
+            
+            def encode_segment(index):
+                start, end = ranges[index]
+                segment_started = time.time()
+                run_ffmpeg(["-ss", f"{start:.6f}", "-i", input_path,
+                            "-t", f"{end - start:.6f}",
+                            "-map", "0:v:0", "-an"] + video_args + [segment_paths[index]])
+                return {"index": index, "start": start, "end": end,
+                        "seconds": round(time.time() - segment_started, 3)}
+            
+            def encode_audio():
+                run_ffmpeg(["-i", input_path, "-map", "0:a:0", "-vn",
+                            "-c:a", audio_codec, "-b:a", audio_bitrate, audio_path])
+            
+            # كل جزء عملية ffmpeg مستقلة؛ الخيوط هنا تنتظر العمليات فقط
+            pool = ThreadPoolExecutor(max_workers=len(ranges) + 1)
+            try:
+                audio_future = pool.submit(encode_audio) if info["has_audio"] else None
+                futures = [pool.submit(encode_segment, i) for i in range(len(ranges))]
+                for future in as_completed(futures):
+                    report.append(future.result())
+                    report_progress(stage="segments", progress=len(report) / len(ranges))
+                if audio_future is not None:
+                    audio_future.result()
+            except BaseException:
+                # إلغاء أو مهلة أو فشل جزء: لا ننتظر بقية المرمزات بل ننهيها فوراً
+                pool.shutdown(wait=False, cancel_futures=True)
+                kill_child_processes()
+                raise
+            pool.shutdown()
+            
+            concat_list = write_concat_list(segment_paths, tmp_dir / "segments.txt")
+            args = ["-f", "concat", "-safe", "0", "-i", concat_list]
+            if info["has_audio"]:
+                args += ["-i", audio_path, "-map", "0:v:0", "-map", "1:a:0"]
+            args += ["-c", "copy"]
+            if format in ("mp4", "mov"):
+                args += ["-movflags", "+faststart"]
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg(args + [tmp_output])
+        
+        report.sort(key=lambda segment: segment["index"])
+        return {
+            "success": True,
+            "path": str(output_path),
+            "size": os.path.getsize(output_path),
+            "segmented": True,
+            "segments": report,
+            "elapsed": round(time.time() - started, 3)
+        }
+    
+    def _export_renditions(self, input_path, renditions: list, fps, audio_bitrate):
+        """فك ترميز المصدر مرة واحدة وتوزيع الإطارات على عدة مرمزات بأبعاد مختلفة
+        
+        عملية ffmpeg واحدة: split ثم scale لكل نسخة، وكل مخرج له مرمزه الخاص
+        فتعمل المرمزات بالتوازي على نفس الإطارات المفكوكة.
+        """
+        info = self.media_cache.get(input_path)
+        started = time.time()
+        
+        filters = [f"[0:v]split={len(renditions)}" + "".join(f"[s{i}]" for i in range(len(renditions)))]
+        # كل المخرجات تُكتب إلى ملفات مؤقتة وتُعاد تسميتها معاً بعد نجاح العملية
+        with ExitStack() as stack:
+            outputs = []
+            for i, rendition in enumerate(renditions):
+                width, height, bitrate = self.target_size(info["width"], info["height"], rendition["quality"])
+                width, height = width - width % 2, height - height % 2
+                filters.append(f"[s{i}]scale={width}:{height}[v{i}]")
+                
+                codec, audio_codec = self.get_codecs(rendition["format"])
+                output_path = self.processed_dir / rendition["output_file"]
+                tmp_output = stack.enter_context(atomic_output(output_path))
+                output_args = ["-map", f"[v{i}]", "-c:v", codec, "-b:v", bitrate, "-pix_fmt", "yuv420p"]
+                if codec == "libx264":
+                    output_args += ["-preset", "medium"]
+                if fps:
+                    output_args += ["-r", fps]
+                if info["has_audio"]:
+                    output_args += ["-map", "0:a:0", "-c:a", audio_codec, "-b:a", audio_bitrate]
+                if rendition["format"] in ("mp4", "mov"):
+                    output_args += ["-movflags", "+faststart"]
+                outputs += output_args + [tmp_output]
+                rendition.update({"path": str(output_path), "width": width, "height": height, "bitrate": bitrate})
+            
+            args = ["-i", input_path, "-filter_complex", ";".join(filters)] + outputs
+            run_ffmpeg(args, duration=info["duration"], stage="renditions")
+        
+        for rendition in renditions:
+            rendition["size"] = os.path.getsize(rendition["path"])
+        
+        # لا يوجد "path" واحد في النتيجة، لذلك لا تحفظها ذاكرة العرض كملف واحد
+        return {
+            "success": True,
+            "renditions": renditions,
+            "size": sum(rendition["size"] for rendition in renditions),
+            "elapsed": round(time.time() - started, 3)
+        }
+    
+    def _export_streaming(self, input_path, output_path, format: str, qualities: list, fps, audio_bitrate):
+        """تغليف HLS أو DASH: نسخ بجودات quality_presets من فك ترميز واحد
+        
+        الناتج مجلد processed/<اسم الإخراج>/ فيه master.m3u8 (أو manifest.mpd)
+        ومجلد لكل نسخة. الإطارات المفتاحية مفروضة كل STREAMING_SEGMENT_DURATION
+        ثانية فتتطابق حدود الأجزاء بين النسخ ويمكن التبديل بينها.
+        """
+        info = self.media_cache.get(input_path)
+        started = time.time()
+        
+        if not qualities:
+            # لا نكبّر المصدر: الجودات التي لا تتجاوز ارتفاعه، وأصغرها على الأقل
+            presets = sorted(self.quality_presets.items(), key=lambda item: item[1]["height"])
+            qualities = [name for name, preset in presets if preset["height"] <= info["height"]]
+            qualities = qualities or [presets[0][0]]
+        
+        output_dir = self.processed_dir / output_path.stem
+        playlist = STREAMING_PLAYLISTS[format]
+        tmp_dir = Path(tempfile.mkdtemp(prefix=f".{output_path.stem}-", dir=self.processed_dir))
+        try:
+            filters = [f"[0:v]split={len(qualities)}" + "".join(f"[s{i}]" for i in range(len(qualities)))]
+            maps = []
+            stream_args = []
+            renditions = []
+            for i, quality in enumerate(qualities):
+                width, height, bitrate = self.target_size(info["width"], info["height"], quality)
+                width, height = width - width % 2, height - height % 2
+                filters.append(f"[s{i}]scale={width}:{height}[v{i}]")
+                maps += ["-map", f"[v{i}]"]
+                stream_args += [f"-b:v:{i}", bitrate]
+                renditions.append({"quality": quality, "width": width, "height": height, "bitrate": bitrate})
+            
+            args = ["-i", input_path, "-filter_complex", ";".join(filters)] + maps
+            if info["has_audio"]:
+                # HLS: مسار صوت لكل نسخة؛ DASH: مسار صوت واحد في مجموعة مستقلة
+                audio_maps = len(qualities) if format == "hls" else 1
+                args += ["-map", "0:a:0"] * audio_maps
+                args += ["-c:a", "aac", "-b:a", audio_bitrate, "-ac", "2"]
+            args += stream_args + [
+                "-c:v", "libx264",
+                "-preset", "medium",
+                "-pix_fmt", "yuv420p",
+                "-force_key_frames", f"expr:gte(t,n_forced*{STREAMING_SEGMENT_DURATION})",
+                "-sc_threshold", "0"
+            ]
+            if fps:
+                args += ["-r", fps]
+            
+            if format == "hls":
+                if info["has_audio"]:
+                    stream_map = " ".join(
+                        f"v:{i},a:{i},name:{quality}" for i, quality in enumerate(qualities)
+                    )
+                else:
+                    stream_map = " ".join(f"v:{i},name:{quality}" for i, quality in enumerate(qualities))
+                args += [
+                    "-f", "hls",
+                    "-hls_time", STREAMING_SEGMENT_DURATION,
+                    "-hls_playlist_type", "vod",
+                    "-hls_flags", "independent_segments",
+                    "-hls_segment_filename", tmp_dir / "%v" / "segment_%05d.ts",
+                    "-master_pl_name", playlist,
+                    "-var_stream_map", stream_map,
+                    tmp_dir / "%v" / "index.m3u8"
+                ]
+                for rendition in renditions:
+                    rendition["playlist"] = f"{rendition['quality']}/index.m3u8"
+            else:
+                adaptation_sets = "id=0,streams=v" + (" id=1,streams=a" if info["has_audio"] else "")
+                args += [
+                    "-f", "dash",
+                    "-seg_duration", STREAMING_SEGMENT_DURATION,
+                    "-use_template", "1",
+                    "-use_timeline", "1",
+                    "-adaptation_sets", adaptation_sets,
+                    "-init_seg_name", "init-$RepresentationID$.m4s",
+                    "-media_seg_name", "chunk-$RepresentationID$-$Number%05d$.m4s",
+                    tmp_dir / playlist
+                ]
+            
+            run_ffmpeg(args, duration=info["duration"], stage=format)
+            
+            self._publish_directory(tmp_dir, output_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        
+        size = sum(path.stat().st_size for path in output_dir.rglob("*") if path.is_file())
+        # النتيجة مجلد وليست ملفاً واحداً، لذلك لا يوجد "path" لذاكرة العرض
+        return {
+            "success": True,
+            "output_file": f"{output_dir.name}/{playlist}",
+            "playlist_url": f"/api/stream/{output_dir.name}/{playlist}",
+            "directory": str(output_dir),
+            "format": format,
+            "segment_duration": STREAMING_SEGMENT_DURATION,
+            "renditions": renditions,
+            "size": size,
+            "elapsed": round(time.time() - started, 3)
+        }
+    
+    def _publish_directory(self, tmp_dir: Path, output_dir: Path):
+        """استبدال مجلد المخرجات بالمجلد الجديد بإعادتي تسمية دون حذف مسبق
+
+        المجلد القديم يُنقل جانباً أولاً ثم يُنقل الجديد مكانه، فلا يرى القراء
+        مجلداً نصف محذوف، ويُستعاد القديم إذا فشلت إعادة التسمية الثانية.
+        """
+        retired = None
+        if output_dir.exists():
+            retired = tmp_dir.with_name(f"{tmp_dir.name}.old")
+            os.rename(output_dir, retired)
+        try:
+            os.rename(tmp_dir, output_dir)
+        except BaseException:
+            if retired is not None:
+                os.rename(retired, output_dir)
+            raise
+        if retired is not None:
+            shutil.rmtree(retired, ignore_errors=True)
+    
+    def get_codecs(self, format: str):
+        """تحديد codec الفيديو والصوت حسب الصيغة"""
+        codec_map = {
+            "mp4": "libx264",
+            "webm": "libvpx-vp9",
+            "avi": "mpeg4",
+            "mov": "libx264",
+            "hls": "libx264",
+            "dash": "libx264"
+        }
+        codec = codec_map.get(format, "libx264")
+        audio_codec = 'aac' if format in ['mp4', 'mov', 'hls', 'dash'] else 'libvorbis'
+        return codec, audio_codec
+    
     def get_available_qualities(self):
         """الحصول على قائمة الجودات المتاحة"""
         return list(self.quality_presets.keys())
     
     def get_available_formats(self):
         """الحصول على قائمة الصيغ المتاحة"""
-        return ["mp4", "webm", "avi", "mov"]
+        return ["mp4", "webm", "avi", "mov", "hls", "dash"]
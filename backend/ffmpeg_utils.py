@@ -0,0 +1,151 @@
+from pathlib import Path
+import json
+import os
+import signal
+import subprocess
+import tempfile
+
+import render_progress
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+
+def run_ffmpeg(args: list, duration: float = None, stage: str = "encode"):
+    """تشغيل ffmpeg ورفع خطأ يحتوي على آخر سطور stderr عند الفشل
+
+    duration: مدة المخرج المتوقعة؛ عند تحديدها داخل مهمة يُقرأ تقدم ffmpeg
+    من -progress ويُرسل كتقدم للمرحلة stage.
+    """
+    cmd = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y"]
+    if duration and render_progress.reporting():
+        cmd += ["-progress", "pipe:1", "-nostats"]
+        cmd += [str(a) for a in args]
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+            try:
+                _read_progress(process.stdout, duration, stage)
+                returncode = process.wait()
+            except BaseException:
+                # إلغاء أو انتهاء مهلة: لا نترك ffmpeg يعمل بعدنا
+                process.kill()
+                process.wait()
+                raise
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+    else:
+        cmd += [str(a) for a in args]
+        process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        returncode, stderr = process.returncode, process.stderr
+    if returncode != 0:
+        stderr = stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffmpeg فشل: {stderr[-1000:]}")
+
+
+def _read_progress(stream, duration: float, stage: str):
+    """قراءة كتل key=value من -progress؛ كل كتلة تنتهي بسطر progress="""
+    values = {}
+    for line in stream:
+        key, _, value = line.decode("utf-8", errors="replace").strip().partition("=")
+        if key != "progress":
+            values[key] = value
+            continue
+        try:
+            frames = int(values.get("frame", 0)) or None
+            out_time = int(values.get("out_time_us", 0) or 0) / 1000000
+        except ValueError:
+            continue
+        render_progress.report(
+            stage=stage,
+            frames=frames,
+            progress=out_time / duration if duration else None,
+            force=value == "end"
+        )
+        values = {}
+
+
+def kill_child_processes() -> list:
+    """إنهاء كل العمليات الفرعية للعملية الحالية وجمعها
+
+    يُستخدم بعد إلغاء مهمة داخل عامل لضمان إنهاء قارئات وكاتبات ffmpeg التي
+    فتحتها moviepy ولم تُغلق. يعتمد على /proc (Linux) ولا يفعل شيئاً في غيره.
+    """
+    pid = os.getpid()
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+
+    killed = []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # الحقل الرابع هو ppid، بعد اسم الأمر الذي قد يحتوي على مسافات وأقواس
+        fields = stat.rsplit(b")", 1)[-1].split()
+        if len(fields) < 2 or int(fields[1]) != pid:
+            continue
+        try:
+            os.kill(int(entry), signal.SIGKILL)
+        except OSError:
+            continue
+        killed.append(int(entry))
+
+    for child in killed:
+        try:
+            os.waitpid(child, 0)
+        except ChildProcessError:
+            pass
+    return killed
+
+
+def run_ffprobe(args: list) -> str:
+    """تشغيل ffprobe وإرجاع المخرجات النصية"""
+    cmd = [FFPROBE_BINARY, "-v", "error"] + [str(a) for a in args]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        stderr = process.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffprobe فشل: {stderr[-1000:]}")
+    return process.stdout.decode("utf-8", errors="replace")
+
+
+def probe_streams(path) -> dict:
+    """قراءة بيانات الحاوية والمسارات بصيغة JSON"""
+    output = run_ffprobe([
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        str(path)
+    ])
+    return json.loads(output)
+
+
+def get_keyframe_times(path) -> list:
+    """أوقات الإطارات المفتاحية لمسار الفيديو الأول من الحزم دون فك الترميز"""
+    output = run_ffprobe([
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        str(path)
+    ])
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time))
+    times.sort()
+    return times
+
+
+def write_concat_list(paths: list, list_path) -> Path:
+    """كتابة ملف قائمة لـ concat demuxer"""
+    list_path = Path(list_path)
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = str(Path(path).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
@@ -0,0 +1,230 @@
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import quote
+import mimetypes
+import os
+import secrets
+
+import anyio
+from starlette.responses import Response
+
+CHUNK_SIZE = 1024 * 1024
+MAX_RANGES = 16
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def make_etag(stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def content_disposition(filename: str) -> str:
+    """ترويسة التنزيل: اسم ASCII احتياطي مع filename* بترميز RFC 5987 للأسماء غير اللاتينية"""
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    fallback = "".join(
+        c for c in filename.encode("ascii", "ignore").decode("ascii") if c.isprintable() and c not in '"\\'
+    ).strip()
+    base, dot, extension = fallback.rpartition(".")
+    if not dot:
+        base, extension = fallback, ""
+    if not base.strip(" ._-"):
+        fallback = "download" + (f".{extension}" if extension else "")
+    return f"attachment; filename=\"{fallback}\"; filename*=utf-8''{quoted}"
+
+
+def parse_range(header: str, size: int):
+    """تحليل ترويسة Range إلى قائمة (بداية، نهاية شاملة)
+
+    يرجع None إذا كانت الترويسة غير مفهومة (فتُتجاهل ويُرسل الملف كاملاً)،
+    وقائمة فارغة إذا لم يكن أي مدى قابلاً للتلبية (416)، ومنها كل مدى على ملف فارغ.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        start, sep, end = spec.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if not start:
+                # آخر N بايت
+                length = int(end)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(start)
+            end = int(end) if end else None
+        except ValueError:
+            return None
+        if end is not None and start > end:
+            return None
+        if start >= size:
+            continue
+        if end is None:
+            end = size - 1
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if size == 0:
+        return []
+
+    # دمج المدى المتداخلة أو المتجاورة
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class MediaFileResponse(Response):
+    """استجابة ملف تدعم Range/206 ومتعدد المدى و ETag/Last-Modified والطلبات الشرطية
+
+    إذا أعلن الخادم امتداد http.response.zerocopysend يُرسل الملف عبر sendfile
+    من النواة مباشرة، وإلا يُقرأ على أجزاء في خيط منفصل.
+    """
+
+    def __init__(
+        self,
+        path,
+        request_headers,
+        filename: str = None,
+        media_type: str = None,
+        cache_control: str = "no-cache",
+        method: str = "GET"
+    ):
+        self.path = Path(path)
+        stat_result = os.stat(self.path)
+        self.size = stat_result.st_size
+        self.send_body = method != "HEAD"
+        self.media_type = media_type or mimetypes.guess_type(str(self.path))[0] or "application/octet-stream"
+        self.background = None
+        self.body = b""
+
+        etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+            "cache-control": cache_control
+        }
+        if filename:
+            headers["content-disposition"] = content_disposition(filename)
+
+        # كل جزء من الجسم: (بايتات ثابتة) أو (إزاحة، طول) من الملف
+        self.parts = []
+
+        if self._not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            self.init_headers(headers)
+            return
+
+        ranges = None
+        range_header = request_headers.get("range")
+        if range_header and self._if_range_matches(request_headers.get("if-range"), etag, last_modified):
+            ranges = parse_range(range_header, self.size)
+
+        if ranges is None:
+            self.status_code = 200
+            headers["content-type"] = self.media_type
+            headers["content-length"] = str(self.size)
+            self.parts = [(0, self.size)] if self.size else []
+        elif not ranges:
+            self.status_code = 416
+            headers["content-range"] = f"bytes */{self.size}"
+            headers["content-length"] = "0"
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            headers["content-type"] = self.media_type
+            headers["content-range"] = f"bytes {start}-{end}/{self.size}"
+            headers["content-length"] = str(end - start + 1)
+            self.parts = [(start, end - start + 1)]
+        else:
+            boundary = secrets.token_hex(16)
+            self.status_code = 206
+            headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+            length = 0
+            for start, end in ranges:
+                part_header = (
+                    f"\r\n--{boundary}\r\n"
+                    f"Content-Type: {self.media_type}\r\n"
+                    f"Content-Range: bytes {start}-{end}/{self.size}\r\n\r\n"
+                ).encode("latin-1")
+                self.parts += [part_header, (start, end - start + 1)]
+                length += len(part_header) + end - start + 1
+            closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+            self.parts.append(closing)
+            headers["content-length"] = str(length + len(closing))
+
+        self.init_headers(headers)
+
+    def _not_modified(self, request_headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _if_range_matches(self, if_range: str, etag: str, last_modified: str) -> bool:
+        if not if_range:
+            return True
+        return if_range.strip() in (etag, last_modified)
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if not self.send_body or not self.parts:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+        async with await anyio.open_file(self.path, "rb") as f:
+            for index, part in enumerate(self.parts):
+                last_part = index == len(self.parts) - 1
+                if isinstance(part, bytes):
+                    await send({"type": "http.response.body", "body": part, "more_body": not last_part})
+                    continue
+
+                offset, count = part
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": f.wrapped.fileno(),
+                        "offset": offset,
+                        "count": count,
+                        "more_body": not last_part
+                    })
+                    continue
+
+                await f.seek(offset)
+                remaining = count
+                while remaining > 0:
+                    chunk = await f.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0 or not last_part
+                    })
+                if remaining > 0 and last_part:
+                    # الملف قُصّ أثناء الإرسال
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,191 @@
+import numpy as np
+
+# دقة الحساب بالأعداد الصحيحة: المعاملات مضروبة في 2^12
+FIXED_POINT_SHIFT = 12
+FIXED_POINT_ONE = 1 << FIXED_POINT_SHIFT
+
+_VALUES = np.arange(256, dtype=np.float64)
+
+
+def make_lut(func) -> np.ndarray:
+    """جدول 256 قيمة من دالة نقطية تعمل على مصفوفة float"""
+    return np.clip(func(_VALUES), 0, 255).astype(np.uint8)
+
+
+def _as_channel_luts(lut) -> np.ndarray:
+    lut = np.asarray(lut, dtype=np.uint8)
+    if lut.ndim == 1:
+        lut = np.stack([lut, lut, lut])
+    return lut
+
+
+class ColorStage:
+    """تحويل لوني نقطي: جدول إدخال لكل قناة ثم مصفوفة 3x3 مع مزج اختياري ثم جدول إخراج
+
+    out = output_lut[ floor(in' * (1 - blend) + clip(matrix · in') * blend) ]
+    حيث in' = input_lut[in]. كل الحسابات بجداول وأعداد صحيحة مع مخازن مؤقتة
+    تُعاد استخدامها بين الإطارات.
+    """
+
+    def __init__(self, input_lut=None, matrix=None, blend: float = 1.0, output_lut=None):
+        self.input_lut = _as_channel_luts(input_lut) if input_lut is not None else None
+        self.matrix = np.asarray(matrix, dtype=np.float64) if matrix is not None else None
+        self.blend = float(blend)
+        self.output_lut = _as_channel_luts(output_lut) if output_lut is not None else None
+        self._buffers = {}
+        self._prepare()
+
+    def _prepare(self):
+        """حساب الجداول الثابتة مرة واحدة بدلاً من كل إطار"""
+        self._lut_only = None
+        if self.matrix is None:
+            # تحويل نقطي بحت: جدول واحد لكل قناة
+            luts = self.input_lut if self.input_lut is not None else np.stack([np.arange(256, dtype=np.uint8)] * 3)
+            if self.output_lut is not None:
+                luts = np.stack([self.output_lut[c][luts[c]] for c in range(3)])
+            self._lut_only = luts
+            self._shared_lut = bool((luts == luts[0]).all())
+            return
+
+        levels = (self.input_lut.astype(np.float64) if self.input_lut is not None
+                  else np.stack([_VALUES] * 3))
+        # term_tables[c, j, v] = matrix[c, j] * input_lut[j][v]
+        self._term_tables = np.rint(
+            self.matrix[:, :, None] * levels[None, :, :] * FIXED_POINT_ONE
+        ).astype(np.int32)
+        self._keep_tables = np.rint(levels * (1 - self.blend) * FIXED_POINT_ONE).astype(np.int32)
+        self._mix_table = np.rint(_VALUES * self.blend * FIXED_POINT_ONE).astype(np.int32)
+        self._shared_rows = bool((self._term_tables == self._term_tables[0]).all())
+
+    def _get_buffers(self, shape):
+        buffers = self._buffers.get(shape)
+        if buffers is None:
+            height, width = shape[:2]
+            buffers = {
+                "out": np.empty((height, width, 3), dtype=np.uint8),
+                "acc": np.empty((height, width), dtype=np.int32),
+                "tmp": np.empty((height, width), dtype=np.int32),
+                "mat": np.empty((height, width), dtype=np.int32),
+            }
+            self._buffers = {shape: buffers}
+        return buffers
+
+    def __call__(self, image):
+        if image.dtype != np.uint8:
+            image = image.astype(np.uint8)
+        buffers = self._get_buffers(image.shape)
+        out = buffers["out"]
+
+        if self._lut_only is not None:
+            if self._shared_lut:
+                np.take(self._lut_only[0], image[..., :3], out=out, mode="clip")
+            else:
+                for c in range(3):
+                    np.take(self._lut_only[c], image[..., c], out=out[..., c], mode="clip")
+            return out
+
+        acc, tmp, mat = buffers["acc"], buffers["tmp"], buffers["mat"]
+        channels = [image[..., j] for j in range(3)]
+        for c in range(3):
+            # في التدرج الرمادي صفوف المصفوفة متطابقة فتُحسب مرة واحدة
+            if c == 0 or not self._shared_rows:
+                tables = self._term_tables[c]
+                np.take(tables[0], channels[0], out=mat, mode="clip")
+                np.take(tables[1], channels[1], out=tmp, mode="clip")
+                mat += tmp
+                np.take(tables[2], channels[2], out=tmp, mode="clip")
+                mat += tmp
+                mat >>= FIXED_POINT_SHIFT
+                np.clip(mat, 0, 255, out=mat)
+
+            result = mat
+            if self.blend < 1.0:
+                np.take(self._mix_table, mat, out=tmp, mode="clip")
+                np.take(self._keep_tables[c], channels[c], out=acc, mode="clip")
+                acc += tmp
+                acc >>= FIXED_POINT_SHIFT
+                np.clip(acc, 0, 255, out=acc)
+                result = acc
+
+            if self.output_lut is not None:
+                np.take(self.output_lut[c], result, out=out[..., c], mode="clip")
+            else:
+                out[..., c] = result
+        return out
+
+
+class ContrastStage:
+    """التباين يعتمد على متوسط الإطار، لذلك يُبنى جدوله لكل إطار (256 قيمة فقط)"""
+
+    def __init__(self, factor: float):
+        self.factor = float(factor)
+        self._out = None
+
+    def __call__(self, image):
+        mean = float(image.mean())
+        lut = make_lut(lambda v: (v - mean) * self.factor + mean)
+        if self._out is None or self._out.shape != image.shape:
+            self._out = np.empty(image.shape, dtype=np.uint8)
+        np.take(lut, image, out=self._out, mode="clip")
+        return self._out
+
+
+def brightness_stage(intensity: float) -> ColorStage:
+    return ColorStage(input_lut=make_lut(lambda v: v * intensity))
+
+
+def invert_stage(intensity: float) -> ColorStage:
+    return ColorStage(input_lut=make_lut(lambda v: v * (1 - intensity) + (255 - v) * intensity))
+
+
+def grayscale_stage(intensity: float) -> ColorStage:
+    weights = np.array([0.299, 0.587, 0.114])
+    return ColorStage(matrix=np.tile(weights, (3, 1)), blend=intensity)
+
+
+def sepia_stage(intensity: float) -> ColorStage:
+    sepia_matrix = np.array([
+        [0.393, 0.769, 0.189],
+        [0.349, 0.686, 0.168],
+        [0.272, 0.534, 0.131]
+    ])
+    return ColorStage(matrix=sepia_matrix, blend=intensity)
+
+
+def fuse_stages(first: ColorStage, second: ColorStage):
+    """دمج تحويلين متتاليين في تحويل واحد إن أمكن، وإلا يرجع None"""
+    if first.matrix is None and second.matrix is None:
+        return ColorStage(input_lut=np.stack([second._lut_only[c][first._lut_only[c]] for c in range(3)]))
+    if first.matrix is None:
+        # جدول الأول يصبح جدول إدخال للمصفوفة
+        luts = first._lut_only
+        if second.input_lut is not None:
+            luts = np.stack([second.input_lut[c][luts[c]] for c in range(3)])
+        return ColorStage(luts, second.matrix, second.blend, second.output_lut)
+    if second.matrix is None:
+        # جدول الثاني يصبح جدول إخراج للمصفوفة
+        luts = second._lut_only
+        if first.output_lut is not None:
+            luts = np.stack([luts[c][first.output_lut[c]] for c in range(3)])
+        return ColorStage(first.input_lut, first.matrix, first.blend, luts)
+    return None
+
+
+class FilterChain:
+    """سلسلة فلاتر تُطبق في تمريرة واحدة لكل إطار بعد دمج التحويلات اللونية المتجاورة"""
+
+    def __init__(self, stages: list):
+        self.stages = []
+        for stage in stages:
+            previous = self.stages[-1] if self.stages else None
+            if isinstance(previous, ColorStage) and isinstance(stage, ColorStage):
+                fused = fuse_stages(previous, stage)
+                if fused is not None:
+                    self.stages[-1] = fused
+                    continue
+            self.stages.append(stage)
+
+    def __call__(self, image):
+        for stage in self.stages:
+            image = stage(image)
+        return image
@@ -0,0 +1,462 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import asyncio
+import ctypes
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import uuid
+
+import render_progress
+import workspace
+from ffmpeg_utils import kill_child_processes
+
+# اسم المعالج -> (الوحدة، الصنف) يتم استيرادها داخل عملية العامل فقط
+PROCESSOR_CLASSES = {
+    "video": ("video_processor", "VideoProcessor"),
+    "audio": ("audio_processor", "AudioProcessor"),
+    "export": ("export_processor", "ExportProcessor"),
+    "subtitle": ("subtitle_processor", "SubtitleProcessor"),
+    "content": ("content_library", "ContentLibrary"),
+    "pipeline": ("pipeline_processor", "PipelineProcessor"),
+    "proxy": ("proxy_manager", "ProxyManager"),
+    "thumbnail": ("thumbnail_processor", "ThumbnailProcessor"),
+}
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# أقل فاصل بين تحديثين يُرسلان لنفس المشترك، ومهلة رسالة الإبقاء على الاتصال
+WATCH_INTERVAL = 1.0
+WATCH_KEEPALIVE = 15.0
+
+# المهلة الافتراضية لكل مهمة بالثواني (0 = بلا مهلة)
+DEFAULT_DEADLINE = float(os.environ.get("RENDER_TIMEOUT", 0))
+
+CANCEL_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+_worker_processors = {}
+_progress_queue = None
+_cancel_board = None
+_current_job = None
+
+
+class JobCancelled(BaseException):
+    """تُرفع داخل عملية العامل عند إلغاء المهمة الجارية
+
+    ترث من BaseException حتى تتجاوز معالجات except Exception في المعالجات.
+    """
+
+
+class JobTimeout(JobCancelled):
+    """تُرفع داخل عملية العامل عند تجاوز المهمة مهلتها"""
+
+
+class CancelBoard:
+    """آخر معرفات المهام المطلوب إلغاؤها في ذاكرة مشتركة مع العمال
+
+    الكتابة من حلقة أحداث العملية الرئيسية فقط، والقراءة من معالج الإشارة في
+    العامل بدون قفل؛ الإشارة تُرسل بعد اكتمال الكتابة.
+    """
+
+    ID_SIZE = 32
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.ids = multiprocessing.Array(ctypes.c_char, size * self.ID_SIZE, lock=False)
+        self.next = 0
+
+    def add(self, job_id: str):
+        start = self.next * self.ID_SIZE
+        self.ids[start:start + self.ID_SIZE] = job_id.encode("ascii")[:self.ID_SIZE].ljust(self.ID_SIZE)
+        self.next = (self.next + 1) % self.size
+
+    def __contains__(self, job_id: str) -> bool:
+        key = job_id.encode("ascii")[:self.ID_SIZE].ljust(self.ID_SIZE)
+        raw = bytes(self.ids)
+        return any(
+            raw[i:i + self.ID_SIZE] == key
+            for i in range(0, len(raw), self.ID_SIZE)
+        )
+
+
+def _init_worker(progress_queue, cancel_board):
+    """تهيئة عملية العامل بطابور التقدم ولوحة الإلغاء المشتركين مع العملية الرئيسية"""
+    global _progress_queue, _cancel_board
+    _progress_queue = progress_queue
+    _cancel_board = cancel_board
+    if CANCEL_SIGNAL is not None:
+        signal.signal(CANCEL_SIGNAL, _handle_cancel)
+        signal.signal(signal.SIGALRM, _handle_deadline)
+
+
+def _handle_cancel(signum, frame):
+    # الإشارة قد تصل بعد انتهاء المهمة المقصودة وبدء غيرها على نفس العامل
+    if _current_job is not None and _current_job in _cancel_board:
+        raise JobCancelled()
+
+
+def _handle_deadline(signum, frame):
+    if _current_job is not None:
+        raise JobTimeout()
+
+
+def _get_processor(processor_name: str):
+    """إنشاء المعالج مرة واحدة لكل عملية عامل"""
+    processor = _worker_processors.get(processor_name)
+    if processor is None:
+        module_name, class_name = PROCESSOR_CLASSES[processor_name]
+        module = importlib.import_module(module_name)
+        processor = getattr(module, class_name)()
+        _worker_processors[processor_name] = processor
+    return processor
+
+
+def run_processor_task(
+    processor_name: str,
+    method_name: str,
+    args: tuple,
+    kwargs: dict,
+    job_id: str = None,
+    expires_at: float = None
+):
+    """تنفيذ دالة معالج داخل عملية العامل مع تقارير التقدم والإلغاء والمهلة
+
+    كل مهمة تعمل داخل مجلد عمل مؤقت خاص بها يُحذف عند انتهائها. عند الإلغاء
+    أو انتهاء المهلة تُنهى عمليات ffmpeg الفرعية (والمخرجات الجزئية تُحذف عبر
+    atomic_output)، ويُرجع قاموس نتيجة بدل رفع الاستثناء.
+    """
+    with workspace.job_workspace(job_id):
+        return _run_in_workspace(processor_name, method_name, args, kwargs, job_id, expires_at)
+
+
+def _run_in_workspace(processor_name: str, method_name: str, args: tuple, kwargs: dict,
+                      job_id: str, expires_at: float):
+    global _current_job
+    processor = _get_processor(processor_name)
+    if _progress_queue is None or job_id is None:
+        return getattr(processor, method_name)(*args, **kwargs)
+
+    render_progress.set_reporter(render_progress.ProgressReporter(job_id, _progress_queue))
+    _current_job = job_id
+    try:
+        _progress_queue.put(("started", job_id, os.getpid()))
+        if job_id in _cancel_board:
+            raise JobCancelled()
+        if expires_at is not None and CANCEL_SIGNAL is not None:
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                raise JobTimeout()
+            signal.setitimer(signal.ITIMER_REAL, remaining)
+        render_progress.report(stage="starting", force=True)
+        return getattr(processor, method_name)(*args, **kwargs)
+    except JobCancelled as e:
+        _current_job = None
+        kill_child_processes()
+        if isinstance(e, JobTimeout):
+            return {"success": False, "timed_out": True, "error": "تجاوزت المهمة المهلة المحددة"}
+        return {"success": False, "cancelled": True, "error": "تم إلغاء المهمة"}
+    finally:
+        _current_job = None
+        if CANCEL_SIGNAL is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        render_progress.set_reporter(None)
+
+
+class JobManager:
+    def __init__(self, max_workers: int = None, max_finished_jobs: int = 500, render_cache=None):
+        self.max_workers = max_workers or int(os.environ.get("RENDER_WORKERS", os.cpu_count() or 2))
+        self.max_finished_jobs = max_finished_jobs
+        self.render_cache = render_cache
+        self.executor = None
+        self.progress_queue = None
+        self.cancel_board = None
+        self._progress_thread = None
+        self._loop = None
+        # معرف المهمة -> حدث مشترك بين كل المشتركين يُطلق عند أي تغيير
+        self._watchers = {}
+        self.jobs = {}
+        self._tasks = {}
+        self._pool_futures = {}
+        # معرف المهمة -> pid العامل الذي ينفذها
+        self._worker_pids = {}
+        # مفتاح الذاكرة -> مستقبل يكتمل عند انتهاء العرض الجاري لنفس الطلب
+        self._in_flight = {}
+
+    def _get_executor(self):
+        if self.executor is None:
+            self._loop = asyncio.get_running_loop()
+            self.progress_queue = multiprocessing.Queue()
+            self.cancel_board = CancelBoard()
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                initializer=_init_worker,
+                initargs=(self.progress_queue, self.cancel_board)
+            )
+            self._progress_thread = threading.Thread(
+                target=self._read_progress, args=(self.progress_queue,), daemon=True
+            )
+            self._progress_thread.start()
+        return self.executor
+
+    def _read_progress(self, queue):
+        """خيط يقرأ تحديثات العمال وينقلها إلى حلقة الأحداث"""
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            try:
+                self._loop.call_soon_threadsafe(self._apply_message, *item)
+            except RuntimeError:
+                # حلقة الأحداث أُغلقت
+                break
+
+    def _apply_message(self, kind: str, job_id: str, payload):
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return
+        if kind == "started":
+            self._worker_pids[job_id] = payload
+            if job_id in self.cancel_board:
+                # طُلب الإلغاء قبل معرفة العامل
+                self._signal_worker(payload)
+            return
+        job["progress"] = payload
+        if job["status"] == "queued":
+            job["status"] = "running"
+        self._notify(job_id)
+
+    def _signal_worker(self, pid: int):
+        if CANCEL_SIGNAL is None:
+            return
+        try:
+            os.kill(pid, CANCEL_SIGNAL)
+        except ProcessLookupError:
+            pass
+
+    def _notify(self, job_id: str):
+        event = self._watchers.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def submit(self, processor_name: str, method_name: str, *args, deadline: float = None, **kwargs) -> str:
+        """إضافة مهمة معالجة إلى الطابور وإرجاع معرفها فوراً
+
+        deadline: أقصى مدة بالثواني من لحظة الإرسال (تشمل الانتظار في الطابور)؛
+        الافتراضي RENDER_TIMEOUT.
+        """
+        if processor_name not in PROCESSOR_CLASSES:
+            raise ValueError(f"معالج غير معروف: {processor_name}")
+
+        deadline = deadline or DEFAULT_DEADLINE
+        expires_at = time.time() + deadline if deadline > 0 else None
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = {
+            "id": job_id,
+            "processor": processor_name,
+            "method": method_name,
+            "status": "queued",
+            "created_at": datetime.utcnow().isoformat(),
+            "finished_at": None,
+            "expires_at": datetime.utcfromtimestamp(expires_at).isoformat() if expires_at else None,
+            "progress": None,
+            "result": None,
+            "error": None
+        }
+
+        self._tasks[job_id] = asyncio.create_task(
+            self._run(job_id, processor_name, method_name, args, kwargs, expires_at)
+        )
+        self._prune()
+        return job_id
+
+    def _cache_key(self, processor_name: str, method_name: str, args: tuple, kwargs: dict):
+        module_name, class_name = PROCESSOR_CLASSES[processor_name]
+        processor_class = getattr(importlib.import_module(module_name), class_name)
+        return self.render_cache.make_key(processor_class, method_name, args, kwargs)
+
+    async def _run(self, job_id: str, processor_name: str, method_name: str, args: tuple, kwargs: dict,
+                   expires_at: float = None):
+        job = self.jobs[job_id]
+        loop = asyncio.get_running_loop()
+        key = None
+        try:
+            if self.render_cache is not None:
+                key, output_filename = await loop.run_in_executor(
+                    None, self._cache_key, processor_name, method_name, args, kwargs
+                )
+
+            if key is not None:
+                # انتظار أي عرض جارٍ لنفس الطلب ثم حجز المفتاح
+                while key in self._in_flight:
+                    job["status"] = "waiting"
+                    await asyncio.shield(self._in_flight[key])
+                self._in_flight[key] = loop.create_future()
+
+                cached = await loop.run_in_executor(
+                    None, self.render_cache.lookup, key, output_filename
+                )
+                if cached is not None:
+                    self._finish(job, cached)
+                    return
+                # فك الربط بالملف القديم حتى لا يكتب ffmpeg فوق نسخة محفوظة
+                output_path = self.render_cache.processed_dir / output_filename
+                if output_path.exists():
+                    output_path.unlink()
+
+            future = self._get_executor().submit(
+                run_processor_task, processor_name, method_name, args, kwargs, job_id, expires_at
+            )
+            self._pool_futures[job_id] = future
+            job["status"] = "queued"
+            result = await asyncio.wrap_future(future)
+
+            if key is not None and isinstance(result, dict) and result.get("success"):
+                await loop.run_in_executor(None, self.render_cache.store, key, result)
+            self._finish(job, result)
+        except (asyncio.CancelledError, JobCancelled) as e:
+            # JobCancelled: الإلغاء وصل بعد عودة المعالج وقبل تنظيف حالة العامل
+            job["status"] = "cancelled"
+            job["error"] = "تم إلغاء المهمة"
+            job["finished_at"] = datetime.utcnow().isoformat()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            job["finished_at"] = datetime.utcnow().isoformat()
+        finally:
+            if key is not None:
+                waiter = self._in_flight.pop(key, None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+            self._tasks.pop(job_id, None)
+            self._pool_futures.pop(job_id, None)
+            self._worker_pids.pop(job_id, None)
+            self._notify(job_id)
+
+    def _finish(self, job: dict, result):
+        job["finished_at"] = datetime.utcnow().isoformat()
+        job["result"] = result
+        if isinstance(result, dict) and result.get("cancelled"):
+            job["status"] = "cancelled"
+            job["error"] = result.get("error")
+        elif isinstance(result, dict) and not result.get("success", True):
+            job["status"] = "failed"
+            job["error"] = result.get("error")
+        else:
+            job["status"] = "completed"
+            if job["progress"] is not None:
+                job["progress"] = {**job["progress"], "progress": 1.0, "eta": 0.0}
+
+    def _prune(self):
+        """حذف أقدم المهام المنتهية عند تجاوز الحد"""
+        finished = [
+            job_id for job_id, job in self.jobs.items()
+            if job["status"] in FINISHED_STATUSES
+        ]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str):
+        """الحصول على حالة المهمة"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        # المستقبل داخل المجمع يصبح "قيد التشغيل" عند إرساله إلى عامل
+        future = self._pool_futures.get(job_id)
+        if job["status"] == "queued" and future is not None and future.running():
+            job["status"] = "running"
+        return job
+
+    def list_jobs(self):
+        """قائمة المهام الحالية"""
+        return [self.get(job_id) for job_id in list(self.jobs.keys())]
+
+    def cancel(self, job_id: str) -> bool:
+        """إلغاء مهمة في الطابور أو قيد التشغيل؛ يرجع False إذا انتهت أو لم توجد"""
+        job = self.jobs.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return False
+
+        future = self._pool_futures.get(job_id)
+        if future is None:
+            # ما زالت في حساب المفتاح أو تنتظر عرضاً مماثلاً
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+            return True
+        if future.cancel():
+            # لم تصل إلى عامل بعد
+            return True
+
+        job["status"] = "cancelling"
+        self.cancel_board.add(job_id)
+        pid = self._worker_pids.get(job_id)
+        if pid is not None:
+            self._signal_worker(pid)
+        self._notify(job_id)
+        return True
+
+    async def wait(self, job_id: str):
+        """انتظار انتهاء المهمة دون حجب حلقة الأحداث"""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # إلغاء المهمة نفسها وليس إلغاء المنتظر
+                if not task.cancelled():
+                    raise
+            except Exception:
+                pass
+        job = self.jobs[job_id]
+        if job["result"] is not None:
+            return job["result"]
+        return {"success": False, "error": job["error"]}
+
+    async def watch(self, job_id: str, interval: float = WATCH_INTERVAL):
+        """مولد لحالة المهمة عند كل تغيير، بحد أقصى تحديث واحد كل interval ثانية
+
+        كل المشتركين في نفس المهمة ينتظرون نفس الحدث، فلا تزيد كلفة التحديث
+        بزيادة عددهم. يُرجع None عند انقضاء مهلة الإبقاء على الاتصال دون تغيير.
+        """
+        last = None
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            snapshot = {
+                "id": job_id,
+                "status": job["status"],
+                "progress": job["progress"],
+                "error": job["error"]
+            }
+            if job["status"] in FINISHED_STATUSES:
+                snapshot["result"] = job["result"]
+            if snapshot != last:
+                last = snapshot
+                yield snapshot
+            if job["status"] in FINISHED_STATUSES:
+                return
+
+            event = self._watchers.get(job_id)
+            if event is None:
+                event = self._watchers[job_id] = asyncio.Event()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=WATCH_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            await asyncio.sleep(interval)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self.progress_queue is not None:
+            self.progress_queue.put(None)
+            self.progress_queue = None
@@ -1,27 +1,48 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-import os
+from contextvars import ContextVar
+import asyncio
+import json
+import mimetypes
 import shutil
 from pathlib import Path
-import uuid
 import uvicorn
 
 from video_processor import VideoProcessor
 from subtitle_processor import SubtitleProcessor
-from export_processor import ExportProcessor
+from export_processor import ExportProcessor, STREAMING_PLAYLISTS
 from audio_processor import AudioProcessor
 from content_library import ContentLibrary
+from job_manager import JobManager, FINISHED_STATUSES
+from render_cache import RenderCache
+from upload_manager import UploadManager, UploadError
+from proxy_manager import ProxyManager
+from thumbnail_processor import ThumbnailProcessor
+from file_response import MediaFileResponse, IMMUTABLE_CACHE_CONTROL, make_etag
+from starlette.concurrency import run_in_threadpool
 
-app = FastAPI(title="Video Editor API", version="1.0.0")
+# مهلة الطلب الحالي بالثواني من ترويسة X-Render-Timeout
+render_timeout = ContextVar("render_timeout", default=None)
+
+async def read_render_timeout(x_render_timeout: Optional[float] = Header(None)):
+    """مهلة اختيارية لكل طلب؛ المهام التي تتجاوزها تُلغى وتُحذف مخرجاتها الجزئية"""
+    render_timeout.set(x_render_timeout if x_render_timeout and x_render_timeout > 0 else None)
+
+app = FastAPI(title="Video Editor API", version="1.0.0", dependencies=[Depends(read_render_timeout)])
 
 video_processor = VideoProcessor()
 subtitle_processor = SubtitleProcessor()
 export_processor = ExportProcessor()
 audio_processor = AudioProcessor()
 content_library = ContentLibrary()
+render_cache = RenderCache()
+job_manager = JobManager(render_cache=render_cache)
+upload_manager = UploadManager()
+proxy_manager = ProxyManager()
+thumbnail_processor = ThumbnailProcessor()
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,6 +57,45 @@ PROCESSED_DIR = Path("../processed")
 UPLOAD_DIR.mkdir(exist_ok=True)
 PROCESSED_DIR.mkdir(exist_ok=True)
 
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    job_manager.shutdown()
+
+async def run_render(background: bool, processor: str, method: str, *args, **kwargs):
+    """تشغيل عملية المعالجة في مجمع العمليات دون حجب الخادم"""
+    job_id = job_manager.submit(processor, method, *args, deadline=render_timeout.get(), **kwargs)
+    if background:
+        return {"success": True, "job_id": job_id, "status": "queued"}
+    
+    try:
+        result = await job_manager.wait(job_id)
+    except asyncio.CancelledError:
+        # العميل انقطع قبل انتهاء العرض
+        job_manager.cancel(job_id)
+        raise
+    if not result.get("success"):
+        if result.get("timed_out"):
+            status_code = 504
+        elif job_manager.get(job_id)["status"] == "cancelled":
+            status_code = 409
+        else:
+            status_code = 500
+        raise HTTPException(status_code=status_code, detail=result.get("error"))
+    result["job_id"] = job_id
+    return result
+
+def schedule_proxy(filename: str):
+    """إنشاء نسخة معاينة للفيديو في الخلفية"""
+    mime_type = mimetypes.guess_type(filename)[0] or ""
+    if mime_type.startswith("video/"):
+        job_manager.submit("proxy", "generate_proxy", filename)
+
+def preview_source(filename: str, proxy: bool) -> str:
+    """نسخة المعاينة عند طلبها وجاهزيتها، وإلا الملف الأصلي"""
+    if proxy:
+        return proxy_manager.proxy_filename(filename) or filename
+    return filename
+
 @app.get("/")
 async def root():
     return {"message": "Video Editor API - محرك معالجة الفيديو", "status": "running"}
@@ -51,26 +111,59 @@ async def health_check():
 @app.post("/upload")
 async def upload_video(file: UploadFile = File(...)):
     try:
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        return {
-            "success": True,
-            "filename": unique_filename,
-            "original_name": file.filename,
-            "path": str(file_path),
-            "size": os.path.getsize(file_path)
-        }
+        result = await upload_manager.save_upload(file)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"خطأ في رفع الملف: {str(e)}")
+    
+    await run_in_threadpool(render_cache.remember_hash, result["path"], result["sha256"])
+    schedule_proxy(result["filename"])
+    return result
+
+@app.post("/upload/sessions")
+async def create_upload_session(
+    filename: str = Form(...),
+    size: int = Form(...),
+    sha256: Optional[str] = Form(None)
+):
+    """بدء رفع مجزأ قابل للاستئناف"""
+    try:
+        return await upload_manager.create_session(filename, size, sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.get("/upload/sessions/{session_id}")
+async def get_upload_session(session_id: str):
+    """الإزاحة الحالية لاستئناف الرفع"""
+    try:
+        return await upload_manager.get_status(session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.put("/upload/sessions/{session_id}")
+async def upload_chunk(session_id: str, offset: int, request: Request):
+    """كتابة جزء عند الإزاحة المحددة؛ يمكن إرسال عدة أجزاء بالتوازي"""
+    try:
+        return await upload_manager.write_chunk(session_id, offset, request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@app.post("/upload/sessions/{session_id}/finalize")
+async def finalize_upload_session(session_id: str):
+    """إنهاء الرفع بعد اكتمال كل الأجزاء"""
+    try:
+        result = await upload_manager.finalize(session_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    await run_in_threadpool(render_cache.remember_hash, result["path"], result["sha256"])
+    schedule_proxy(result["filename"])
+    return result
 
 @app.post("/api/video/info")
 async def get_video_info(filename: str = Form(...)):
-    result = video_processor.get_video_info(filename)
+    result = await run_in_threadpool(video_processor.get_video_info, filename)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error"))
     return result
@@ -80,61 +173,95 @@ async def trim_video(
     filename: str = Form(...),
     start_time: float = Form(...),
     end_time: float = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    mode: str = Form("reencode"),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = video_processor.trim_video(filename, start_time, end_time, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    filename = preview_source(filename, proxy)
+    return await run_render(background, "video", "trim_video", filename, start_time, end_time, output_filename, mode=mode)
 
 @app.post("/api/video/concatenate")
 async def concatenate_videos(
     filenames: str = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    mode: str = Form("auto"),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    filename_list = filenames.split(',')
-    result = video_processor.concatenate_videos(filename_list, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    filename_list = [preview_source(filename, proxy) for filename in filenames.split(',')]
+    return await run_render(background, "video", "concatenate_videos", filename_list, output_filename, mode=mode)
 
 @app.post("/api/video/speed")
 async def change_video_speed(
     filename: str = Form(...),
     speed_factor: float = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = video_processor.change_speed(filename, speed_factor, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    filename = preview_source(filename, proxy)
+    return await run_render(background, "video", "change_speed", filename, speed_factor, output_filename)
 
 @app.post("/api/video/rotate")
 async def rotate_video(
     filename: str = Form(...),
     angle: int = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = video_processor.rotate_video(filename, angle, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    filename = preview_source(filename, proxy)
+    return await run_render(background, "video", "rotate_video", filename, angle, output_filename)
 
 @app.post("/api/video/resize")
 async def resize_video(
     filename: str = Form(...),
     width: int = Form(...),
     height: int = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = video_processor.resize_video(filename, width, height, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    filename = preview_source(filename, proxy)
+    return await run_render(background, "video", "resize_video", filename, width, height, output_filename)
+
+@app.post("/api/video/thumbnails")
+async def create_thumbnails(
+    filename: str = Form(...),
+    interval: float = Form(5.0),
+    tile_width: int = Form(160),
+    tile_height: int = Form(90),
+    columns: int = Form(10),
+    rows: int = Form(10),
+    keyframes_only: bool = Form(True),
+    background: bool = Form(False)
+):
+    """شبكات صور مصغرة للخط الزمني مع فهرس JSON؛ interval=0 لشريط الإطارات المفتاحية"""
+    return await run_render(
+        background,
+        "thumbnail",
+        "create_sprite_sheet",
+        filename,
+        interval=interval,
+        tile_width=tile_width,
+        tile_height=tile_height,
+        columns=columns,
+        rows=rows,
+        keyframes_only=keyframes_only
+    )
+
+@app.get("/api/thumbnails/{key}/{sheet}")
+async def get_thumbnail_sheet(key: str, sheet: str):
+    file_path = thumbnail_processor.sheet_path(key, sheet)
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+    # المفتاح مشتق من بصمة المحتوى فلا تتغير الصورة أبداً
+    return FileResponse(file_path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
 
 @app.post("/api/subtitle/parse-srt")
 async def parse_srt_file(filename: str = Form(...)):
-    result = subtitle_processor.load_srt_file(filename)
+    result = await run_in_threadpool(subtitle_processor.load_srt_file, filename)
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error"))
     return result
@@ -146,9 +273,12 @@ async def add_subtitles(
     output_filename: str = Form(...),
     fontsize: int = Form(24),
     color: str = Form("white"),
-    position: str = Form("bottom")
+    position: str = Form("bottom"),
+    engine: str = Form("compositor"),
+    language: str = Form("ar"),
+    background: bool = Form(False)
 ):
-    subtitle_data = subtitle_processor.load_srt_file(subtitle_filename)
+    subtitle_data = await run_in_threadpool(subtitle_processor.load_srt_file, subtitle_filename)
     if not subtitle_data.get("success"):
         raise HTTPException(status_code=500, detail=subtitle_data.get("error"))
     
@@ -158,18 +288,49 @@ async def add_subtitles(
         "bottom": ('center', 'bottom')
     }
     
-    result = subtitle_processor.add_subtitles_to_video(
+    return await run_render(
+        background,
+        "subtitle",
+        "add_subtitles_to_video",
         video_filename,
         subtitle_data["subtitles"],
         output_filename,
         fontsize=fontsize,
         color=color,
-        position=pos_map.get(position, ('center', 'bottom'))
+        position=pos_map.get(position, ('center', 'bottom')),
+        engine=engine,
+        language=language
     )
+
+@app.post("/api/subtitle/mux")
+async def mux_subtitles(
+    video_filename: str = Form(...),
+    subtitle_filenames: str = Form(...),
+    languages: str = Form(...),
+    output_filename: str = Form(...),
+    background: bool = Form(False)
+):
+    """إضافة ترجمات مرنة بعدة لغات دون إعادة ترميز الفيديو"""
+    filename_list = subtitle_filenames.split(',')
+    language_list = languages.split(',')
+    if len(filename_list) != len(language_list):
+        raise HTTPException(status_code=400, detail="عدد اللغات لا يطابق عدد ملفات الترجمة")
     
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    tracks = []
+    for subtitle_filename, language in zip(filename_list, language_list):
+        subtitle_data = await run_in_threadpool(subtitle_processor.load_srt_file, subtitle_filename.strip())
+        if not subtitle_data.get("success"):
+            raise HTTPException(status_code=500, detail=subtitle_data.get("error"))
+        tracks.append({"subtitles": subtitle_data["subtitles"], "language": language.strip()})
+    
+    return await run_render(
+        background,
+        "subtitle",
+        "mux_subtitles",
+        video_filename,
+        tracks,
+        output_filename
+    )
 
 @app.post("/api/export/video")
 async def export_video(
@@ -178,19 +339,29 @@ async def export_video(
     quality: str = Form("1080p"),
     format: str = Form("mp4"),
     fps: Optional[int] = Form(None),
-    audio_bitrate: str = Form("192k")
+    audio_bitrate: str = Form("192k"),
+    segmented: bool = Form(False),
+    segments: Optional[int] = Form(None),
+    qualities: Optional[str] = Form(None),
+    formats: Optional[str] = Form(None),
+    background: bool = Form(False)
 ):
-    result = export_processor.export_video(
-        filename,
+    """qualities/formats: قوائم مفصولة بفواصل لتصدير عدة نسخ من فك ترميز واحد"""
+    return await run_render(
+        background,
+        "export",
+        "export_video",
+        proxy_manager.original_for(filename),
         output_filename,
         quality=quality,
         format=format,
         fps=fps,
-        audio_bitrate=audio_bitrate
+        audio_bitrate=audio_bitrate,
+        segmented=segmented,
+        segments=segments,
+        qualities=qualities.split(',') if qualities else None,
+        formats=formats.split(',') if formats else None
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/export/custom")
 async def export_custom(
@@ -200,10 +371,14 @@ async def export_custom(
     height: int = Form(...),
     bitrate: str = Form("4000k"),
     fps: int = Form(30),
-    format: str = Form("mp4")
+    format: str = Form("mp4"),
+    background: bool = Form(False)
 ):
-    result = export_processor.export_with_custom_settings(
-        filename,
+    return await run_render(
+        background,
+        "export",
+        "export_with_custom_settings",
+        proxy_manager.original_for(filename),
         output_filename,
         width=width,
         height=height,
@@ -211,9 +386,6 @@ async def export_custom(
         fps=fps,
         format=format
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.get("/api/export/qualities")
 async def get_qualities():
@@ -226,12 +398,21 @@ async def get_formats():
 @app.post("/api/audio/extract")
 async def extract_audio(
     filename: str = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    stream_index: int = Form(0),
+    background: bool = Form(False)
 ):
-    result = audio_processor.extract_audio(filename, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    """استخراج الصوت بالنسخ المباشر، أو بإعادة الترميز إذا طُلبت صيغة مختلفة بامتداد output_filename"""
+    if not Path(output_filename).suffix:
+        # تحديد الامتداد هنا حتى يطابق اسم الإخراج مفتاح ذاكرة العرض
+        input_path = UPLOAD_DIR / filename
+        if not input_path.exists():
+            input_path = PROCESSED_DIR / filename
+        if input_path.exists():
+            output_filename = await run_in_threadpool(
+                audio_processor.audio_output_filename, input_path, output_filename, stream_index
+            )
+    return await run_render(background, "audio", "extract_audio", filename, output_filename, stream_index=stream_index)
 
 @app.post("/api/audio/background")
 async def add_background_music(
@@ -239,67 +420,63 @@ async def add_background_music(
     audio_filename: str = Form(...),
     output_filename: str = Form(...),
     music_volume: float = Form(0.3),
-    original_volume: float = Form(1.0)
+    original_volume: float = Form(1.0),
+    background: bool = Form(False)
 ):
-    result = audio_processor.add_background_music(
+    return await run_render(
+        background,
+        "audio",
+        "add_background_music",
         video_filename,
         audio_filename,
         output_filename,
         music_volume=music_volume,
         original_volume=original_volume
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/audio/volume")
 async def adjust_volume(
     filename: str = Form(...),
     output_filename: str = Form(...),
-    volume: float = Form(1.0)
+    volume: float = Form(1.0),
+    background: bool = Form(False)
 ):
-    result = audio_processor.adjust_volume(filename, output_filename, volume=volume)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    return await run_render(background, "audio", "adjust_volume", filename, output_filename, volume=volume)
 
 @app.post("/api/audio/replace")
 async def replace_audio(
     video_filename: str = Form(...),
     audio_filename: str = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    background: bool = Form(False)
 ):
-    result = audio_processor.replace_audio(video_filename, audio_filename, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    return await run_render(background, "audio", "replace_audio", video_filename, audio_filename, output_filename)
 
 @app.post("/api/audio/remove")
 async def remove_audio(
     filename: str = Form(...),
-    output_filename: str = Form(...)
+    output_filename: str = Form(...),
+    background: bool = Form(False)
 ):
-    result = audio_processor.remove_audio(filename, output_filename)
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+    return await run_render(background, "audio", "remove_audio", filename, output_filename)
 
 @app.post("/api/audio/fade")
 async def fade_audio(
     filename: str = Form(...),
     output_filename: str = Form(...),
     fade_in_duration: float = Form(0),
-    fade_out_duration: float = Form(0)
+    fade_out_duration: float = Form(0),
+    background: bool = Form(False)
 ):
-    result = audio_processor.fade_audio(
+    return await run_render(
+        background,
+        "audio",
+        "fade_audio",
         filename,
         output_filename,
         fade_in_duration=fade_in_duration,
         fade_out_duration=fade_out_duration
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/effects/transition")
 async def apply_transition(
@@ -307,35 +484,55 @@ async def apply_transition(
     clip2_filename: str = Form(...),
     output_filename: str = Form(...),
     transition_type: str = Form("fade"),
-    duration: float = Form(1.0)
+    duration: float = Form(1.0),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = content_library.apply_transition(
-        clip1_filename,
-        clip2_filename,
+    return await run_render(
+        background,
+        "content",
+        "apply_transition",
+        preview_source(clip1_filename, proxy),
+        preview_source(clip2_filename, proxy),
         output_filename,
         transition_type=transition_type,
         duration=duration
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/effects/filter")
 async def apply_filter(
     filename: str = Form(...),
     output_filename: str = Form(...),
-    filter_type: str = Form(...),
-    intensity: float = Form(1.0)
+    filter_type: Optional[str] = Form(None),
+    intensity: float = Form(1.0),
+    filters: Optional[str] = Form(None),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
-    result = content_library.apply_filter(
-        filename,
+    """filters: سلسلة JSON مثل [["brightness", 1.2], ["sepia", 1.0]] تُطبق في تمريرة واحدة"""
+    chain = None
+    if filters:
+        try:
+            chain = [
+                (item["filter"], float(item.get("intensity", 1.0))) if isinstance(item, dict)
+                else (item[0], float(item[1]))
+                for item in json.loads(filters)
+            ]
+        except (ValueError, KeyError, IndexError, TypeError):
+            raise HTTPException(status_code=400, detail="صيغة سلسلة الفلاتر غير صالحة")
+    elif not filter_type:
+        raise HTTPException(status_code=400, detail="يجب تحديد فلتر")
+    
+    return await run_render(
+        background,
+        "content",
+        "apply_filter",
+        preview_source(filename, proxy),
         output_filename,
         filter_type=filter_type,
-        intensity=intensity
+        intensity=intensity,
+        chain=chain
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/effects/text")
 async def add_text_overlay(
@@ -346,11 +543,16 @@ async def add_text_overlay(
     position_y: str = Form("bottom"),
     fontsize: int = Form(50),
     color: str = Form("white"),
-    duration: Optional[float] = Form(None)
+    duration: Optional[float] = Form(None),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
     position = (position_x, position_y)
-    result = content_library.add_text_overlay(
-        filename,
+    return await run_render(
+        background,
+        "content",
+        "add_text_overlay",
+        preview_source(filename, proxy),
         output_filename,
         text=text,
         position=position,
@@ -358,9 +560,6 @@ async def add_text_overlay(
         color=color,
         duration=duration
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
 
 @app.post("/api/effects/sticker")
 async def add_sticker(
@@ -371,22 +570,119 @@ async def add_sticker(
     position_y: str = Form("center"),
     width: Optional[int] = Form(None),
     height: Optional[int] = Form(None),
-    duration: Optional[float] = Form(None)
+    duration: Optional[float] = Form(None),
+    proxy: bool = Form(False),
+    background: bool = Form(False)
 ):
     position = (position_x, position_y)
     size = (width, height) if width and height else None
     
-    result = content_library.add_sticker(
-        video_filename,
+    return await run_render(
+        background,
+        "content",
+        "add_sticker",
+        preview_source(video_filename, proxy),
         sticker_filename,
         output_filename,
         position=position,
         size=size,
         duration=duration
     )
-    if not result.get("success"):
-        raise HTTPException(status_code=500, detail=result.get("error"))
-    return result
+
+class PipelineOperation(BaseModel):
+    op: str
+    params: dict = {}
+
+class PipelineRequest(BaseModel):
+    filename: str
+    output_filename: str
+    operations: List[PipelineOperation]
+    proxy: bool = False
+    background: bool = False
+
+@app.post("/api/pipeline")
+async def run_pipeline(request: PipelineRequest):
+    """تنفيذ سلسلة عمليات بترميز واحد في النهاية
+
+    proxy يُستخدم للمعاينة فقط؛ السلسلة التي تنتهي بعملية تصدير تعمل دائماً على الأصل.
+    """
+    operations = [operation.model_dump() for operation in request.operations]
+    filename = proxy_manager.original_for(request.filename)
+    if request.proxy and not (operations and operations[-1]["op"] == "export"):
+        filename = preview_source(filename, True)
+    
+    return await run_render(
+        request.background,
+        "pipeline",
+        "run_pipeline",
+        filename,
+        operations,
+        request.output_filename
+    )
+
+@app.get("/api/proxy/{filename}")
+async def get_proxy(filename: str):
+    """حالة نسخة المعاينة لملف مرفوع"""
+    meta = await run_in_threadpool(proxy_manager.get_proxy, filename)
+    if meta is None:
+        return {"ready": False, "original": filename}
+    return {"ready": True, **meta}
+
+@app.get("/api/jobs")
+async def list_jobs():
+    return {"jobs": job_manager.list_jobs()}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """إلغاء مهمة في الطابور أو قيد التشغيل"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    if not job_manager.cancel(job_id):
+        raise HTTPException(status_code=409, detail="المهمة انتهت بالفعل")
+    return {"success": True, "job_id": job_id, "status": job["status"]}
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """تقدم المهمة عبر Server-Sent Events حتى انتهائها"""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    
+    async def event_stream():
+        async for snapshot in job_manager.watch(job_id):
+            if snapshot is None:
+                yield ": keepalive\n\n"
+                continue
+            event = "done" if snapshot["status"] in FINISHED_STATUSES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/api/jobs/{job_id}/ws")
+async def job_websocket(websocket: WebSocket, job_id: str):
+    """تقدم المهمة عبر WebSocket حتى انتهائها"""
+    await websocket.accept()
+    if job_manager.get(job_id) is None:
+        await websocket.close(code=4404)
+        return
+    try:
+        async for snapshot in job_manager.watch(job_id):
+            if snapshot is not None:
+                await websocket.send_json(snapshot)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 @app.get("/transitions")
 async def get_transitions():
@@ -396,12 +692,65 @@ async def get_transitions():
 async def get_filters():
     return {"filters": content_library.get_available_filters()}
 
-@app.get("/api/download/{filename}")
-async def download_file(filename: str):
+@app.api_route("/api/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(filename: str, request: Request, v: Optional[str] = None):
+    """تنزيل مع دعم Range و ETag؛ الرابط المثبت بـ ?v=<ETag> يُخزن مؤقتاً لمدة طويلة"""
     file_path = PROCESSED_DIR / filename
-    if not file_path.exists():
+    if not file_path.is_file():
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+    
+    cache_control = "no-cache"
+    if v and f'"{v.strip(chr(34))}"' == make_etag(file_path.stat()):
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    return MediaFileResponse(
+        file_path,
+        request.headers,
+        filename=filename,
+        cache_control=cache_control,
+        method=request.method
+    )
+
+STREAMING_MEDIA_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".mpd": "application/dash+xml",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4"
+}
+
+@app.api_route("/api/stream/{file_path:path}", methods=["GET", "HEAD"])
+async def stream_file(file_path: str, request: Request):
+    """ملفات HLS/DASH (قوائم التشغيل والأجزاء) من داخل مجلدات تصدير البث فقط"""
+    processed_root = PROCESSED_DIR.resolve()
+    full_path = (processed_root / file_path).resolve()
+    suffix = full_path.suffix.lower()
+    if processed_root not in full_path.parents or suffix not in STREAMING_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="الملف غير موجود")
+    
+    # المجلد الأعلى يجب أن يكون مجلد تصدير منشوراً (غير مخفي) فيه قائمة تشغيل رئيسية،
+    # وليس ملفاً عادياً في processed/ ولا مجلداً مؤقتاً قيد الكتابة
+    relative = full_path.relative_to(processed_root)
+    output_dir = processed_root / relative.parts[0]
+    if (
+        len(relative.parts) < 2
+        or relative.parts[0].startswith(".")
+        or not any((output_dir / playlist).is_file() for playlist in STREAMING_PLAYLISTS.values())
+        or not full_path.is_file()
+    ):
         raise HTTPException(status_code=404, detail="الملف غير موجود")
-    return FileResponse(file_path, filename=filename)
+    
+    # الأجزاء لا تتغير بعد كتابتها؛ قوائم التشغيل قد يُعاد تصديرها بنفس الاسم
+    if suffix in (".ts", ".m4s"):
+        cache_control = "public, max-age=86400"
+    else:
+        cache_control = "no-cache"
+    return MediaFileResponse(
+        full_path,
+        request.headers,
+        media_type=STREAMING_MEDIA_TYPES.get(suffix),
+        cache_control=cache_control,
+        method=request.method
+    )
 
 @app.post("/youtube")
 async def import_from_youtube(
@@ -461,6 +810,8 @@ async def import_from_youtube(
             }
         }
         
+        schedule_proxy(video_filename)
+        
         if download_subtitles and subtitle_path.exists():
             result["subtitle"] = {
                 "filename": subtitle_filename,
@@ -505,6 +856,8 @@ async def import_from_google_drive(
         if actual_path != final_path:
             actual_path.rename(final_path)
         
+        schedule_proxy(final_filename)
+        
         return {
             "success": True,
             "filename": final_filename,
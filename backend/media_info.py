@@ -0,0 +1,167 @@
+from contextlib import contextmanager
+from pathlib import Path
+import json
+import os
+import sqlite3
+import threading
+
+from ffmpeg_utils import probe_streams, get_keyframe_times
+
+MEMORY_CACHE_SIZE = 2048
+
+_shared_caches = {}
+
+
+def _parse_rate(rate: str) -> float:
+    """تحويل معدل الإطارات من صيغة 30000/1001 إلى رقم"""
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _stream_rotation(stream: dict) -> int:
+    """زاوية التدوير من الوسوم أو من مصفوفة العرض"""
+    rotate = stream.get("tags", {}).get("rotate")
+    if rotate is not None:
+        return int(float(rotate)) % 360
+    for side_data in stream.get("side_data_list", []):
+        if "rotation" in side_data:
+            return int(-float(side_data["rotation"])) % 360
+    return 0
+
+
+class MediaInfoCache:
+    """ذاكرة دائمة لبيانات الوسائط من ffprobe مفتاحها المسار والحجم ووقت التعديل"""
+
+    def __init__(self, db_path: str = "../media_cache.sqlite"):
+        self.db_path = Path(db_path)
+        self._memory = {}
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_info ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, info TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, path) -> dict:
+        """بيانات الملف من الذاكرة، أو من قاعدة البيانات، أو بفحص جديد"""
+        path = str(Path(path).resolve())
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        info = self._memory.get(key)
+        if info is not None:
+            return info
+
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT info FROM media_info WHERE path = ? AND size = ? AND mtime_ns = ?", key
+            ).fetchone()
+        if row is not None:
+            info = json.loads(row[0])
+        else:
+            info = self._probe(path, stat.st_size)
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO media_info (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+                    key + (json.dumps(info),)
+                )
+
+        with self._lock:
+            if len(self._memory) >= MEMORY_CACHE_SIZE:
+                self._memory.pop(next(iter(self._memory)))
+            self._memory[key] = info
+        return info
+
+    def invalidate(self, path):
+        """حذف بيانات ملف من الذاكرة"""
+        path = str(Path(path).resolve())
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == path]:
+                del self._memory[key]
+        with self._connect() as conn:
+            conn.execute("DELETE FROM media_info WHERE path = ?", (path,))
+
+    def _probe(self, path: str, size: int) -> dict:
+        """فحص الحاوية دون فك ترميز الإطارات"""
+        data = probe_streams(path)
+        format_info = data.get("format", {})
+        streams = data.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), None)
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+        info = {
+            "duration": float(format_info.get("duration") or 0),
+            "size": size,
+            "bitrate": int(format_info.get("bit_rate") or 0),
+            "format": format_info.get("format_name"),
+            "has_video": video is not None,
+            "has_audio": audio is not None,
+            "video_codec": video.get("codec_name") if video else None,
+            "audio_codec": audio.get("codec_name") if audio else None,
+            "fps": None,
+            "width": None,
+            "height": None,
+            "rotation": 0,
+            "keyframes": [],
+            "keyframe_count": 0,
+            "streams": [
+                {
+                    "index": s.get("index"),
+                    "type": s.get("codec_type"),
+                    "codec": s.get("codec_name"),
+                    "profile": s.get("profile"),
+                    "pix_fmt": s.get("pix_fmt"),
+                    "width": s.get("width"),
+                    "height": s.get("height"),
+                    "frame_rate": s.get("r_frame_rate"),
+                    "time_base": s.get("time_base"),
+                    "sample_rate": s.get("sample_rate"),
+                    "channels": s.get("channels"),
+                    "bitrate": int(s.get("bit_rate") or 0),
+                    "language": s.get("tags", {}).get("language"),
+                }
+                for s in streams
+            ],
+        }
+
+        if video is not None:
+            rotation = _stream_rotation(video)
+            width, height = video.get("width"), video.get("height")
+            # نفس سلوك VideoFileClip: الأبعاد بعد تطبيق التدوير
+            if rotation in (90, 270):
+                width, height = height, width
+            info.update({
+                "fps": _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate")),
+                "width": width,
+                "height": height,
+                "rotation": rotation,
+            })
+            info["keyframes"] = get_keyframe_times(path)
+            info["keyframe_count"] = len(info["keyframes"])
+            if not info["duration"]:
+                info["duration"] = float(video.get("duration") or 0)
+
+        return info
+
+
+def get_media_cache(db_path: str = "../media_cache.sqlite") -> MediaInfoCache:
+    """نسخة مشتركة من الذاكرة لكل قاعدة بيانات داخل العملية"""
+    key = str(Path(db_path).resolve())
+    cache = _shared_caches.get(key)
+    if cache is None:
+        cache = MediaInfoCache(db_path)
+        _shared_caches[key] = cache
+    return cache
@@ -0,0 +1,230 @@
+from moviepy.editor import VideoFileClip, AudioFileClip, CompositeVideoClip
+from pathlib import Path
+import os
+
+from video_processor import VideoProcessor
+from subtitle_processor import SubtitleProcessor
+from export_processor import ExportProcessor, STREAMING_FORMATS
+from audio_processor import AudioProcessor
+from content_library import ContentLibrary
+from render_progress import render_logger
+from workspace import atomic_output, scratch_path
+
+
+class PipelineProcessor:
+    """تنفيذ سلسلة عمليات على مقطع واحد مع ترميز واحد فقط في النهاية"""
+
+    def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
+        self.upload_dir = Path(upload_dir)
+        self.processed_dir = Path(processed_dir)
+
+        self.video_processor = VideoProcessor(upload_dir, processed_dir)
+        self.subtitle_processor = SubtitleProcessor(upload_dir, processed_dir)
+        self.export_processor = ExportProcessor(upload_dir, processed_dir)
+        self.audio_processor = AudioProcessor(upload_dir, processed_dir)
+        self.content_library = ContentLibrary(upload_dir, processed_dir)
+
+        self.operations = {
+            "trim": self.op_trim,
+            "speed": self.op_speed,
+            "rotate": self.op_rotate,
+            "resize": self.op_resize,
+            "filter": self.op_filter,
+            "text": self.op_text,
+            "sticker": self.op_sticker,
+            "subtitles": self.op_subtitles,
+            "volume": self.op_volume,
+            "fade_audio": self.op_fade_audio,
+            "background_music": self.op_background_music,
+            "replace_audio": self.op_replace_audio,
+            "remove_audio": self.op_remove_audio,
+            "export": self.op_export
+        }
+
+        self.positions = {
+            "top": ('center', 'top'),
+            "center": ('center', 'center'),
+            "bottom": ('center', 'bottom')
+        }
+
+    def _resolve(self, filename: str) -> Path:
+        path = self.upload_dir / filename
+        if not path.exists():
+            path = self.processed_dir / filename
+        if not path.exists():
+            raise FileNotFoundError(f"الملف {filename} غير موجود")
+        return path
+
+    def _position(self, position):
+        if isinstance(position, str):
+            return self.positions.get(position, ('center', 'bottom'))
+        return tuple(position)
+
+    def run_pipeline(self, input_filename: str, operations: list, output_filename: str):
+        """تطبيق العمليات بالترتيب على رسم مقاطع كسول ثم الترميز مرة واحدة"""
+        try:
+            input_path = self._resolve(input_filename)
+            output_path = self.processed_dir / output_filename
+
+            for index, operation in enumerate(operations):
+                if operation.get("op") not in self.operations:
+                    return {"success": False, "error": f"عملية غير مدعومة: {operation.get('op')}"}
+                if operation["op"] == "export" and index != len(operations) - 1:
+                    return {"success": False, "error": "يجب أن تكون عملية التصدير الأخيرة"}
+
+            context = {
+                "resources": [],
+                "write_options": {
+                    "codec": "libx264",
+                    "audio_codec": "aac"
+                }
+            }
+
+            operations = self._merge_filter_operations(operations)
+
+            video = VideoFileClip(str(input_path))
+            context["resources"].append(video)
+            try:
+                clip = video
+                for operation in operations:
+                    clip = self.operations[operation["op"]](clip, context, **operation.get("params", {}))
+
+                with atomic_output(output_path) as tmp_output:
+                    clip.write_videofile(
+                        str(tmp_output),
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        **context["write_options"],
+                        logger=render_logger()
+                    )
+            finally:
+                for resource in reversed(context["resources"]):
+                    resource.close()
+
+            return {
+                "success": True,
+                "output_file": output_filename,
+                "path": str(output_path),
+                "size": os.path.getsize(output_path),
+                "operations": [operation["op"] for operation in operations]
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+    def _merge_filter_operations(self, operations: list) -> list:
+        """دمج عمليات الفلاتر المتتالية في سلسلة واحدة لتُدمج تحويلاتها اللونية"""
+        merged = []
+        for operation in operations:
+            if operation["op"] == "filter":
+                params = operation.get("params", {})
+                chain = params.get("chain") or [(params.get("filter_type"), params.get("intensity", 1.0))]
+                if merged and merged[-1]["op"] == "filter":
+                    merged[-1]["params"]["chain"].extend(tuple(item) for item in chain)
+                    continue
+                operation = {"op": "filter", "params": {"chain": [tuple(item) for item in chain]}}
+            merged.append(operation)
+        return merged
+
+    def op_trim(self, clip, context, start_time: float, end_time: float):
+        """قص"""
+        return clip.subclipped(start_time, end_time)
+
+    def op_speed(self, clip, context, speed_factor: float):
+        """تغيير السرعة"""
+        if speed_factor == 1.0:
+            return clip
+        return clip.with_speed_scaled(speed_factor)
+
+    def op_rotate(self, clip, context, angle: int):
+        """تدوير"""
+        return clip.rotated(angle)
+
+    def op_resize(self, clip, context, width: int, height: int):
+        """تغيير الأبعاد"""
+        return clip.resized((width, height))
+
+    def op_filter(self, clip, context, filter_type: str = None, intensity: float = 1.0, chain: list = None):
+        """فلتر أو سلسلة فلاتر مدمجة من مكتبة المحتوى"""
+        chain = [tuple(item) for item in chain] if chain else [(filter_type, intensity)]
+        if any(name not in self.content_library.filters for name, _ in chain):
+            raise ValueError("الفلتر غير مدعوم")
+        return self.content_library.apply_filter_chain(clip, chain)
+
+    def op_text(self, clip, context, text: str, position=('center', 'bottom'),
+                fontsize: int = 50, color: str = 'white', duration: float = None):
+        """نص فوق الفيديو"""
+        txt_clip = self.content_library.create_text_clip(
+            clip, text, tuple(position), fontsize, color, duration
+        )
+        return CompositeVideoClip([clip, txt_clip])
+
+    def op_sticker(self, clip, context, sticker_filename: str, position=('center', 'center'),
+                   size=None, duration: float = None):
+        """ملصق فوق الفيديو"""
+        sticker = self.content_library.create_sticker_clip(
+            clip, self._resolve(sticker_filename), tuple(position),
+            tuple(size) if size else None, duration
+        )
+        return CompositeVideoClip([clip, sticker])
+
+    def op_subtitles(self, clip, context, subtitle_filename: str, fontsize: int = 24,
+                     color: str = "white", position="bottom", bg_color: str = None):
+        """حرق الترجمات"""
+        subtitle_data = self.subtitle_processor.load_srt_file(subtitle_filename)
+        if not subtitle_data.get("success"):
+            raise ValueError(subtitle_data.get("error"))
+
+        return self.subtitle_processor.composite_subtitles(
+            clip, subtitle_data["subtitles"], fontsize=fontsize, color=color,
+            position=self._position(position), bg_color=bg_color
+        )
+
+    def op_volume(self, clip, context, volume: float = 1.0):
+        """مستوى الصوت"""
+        if clip.audio is None:
+            return clip
+        return clip.with_audio(clip.audio.with_volume_scaled(volume))
+
+    def op_fade_audio(self, clip, context, fade_in_duration: float = 0, fade_out_duration: float = 0):
+        """تلاشي الصوت"""
+        if clip.audio is None:
+            return clip
+        audio = self.audio_processor.apply_audio_fades(
+            clip.audio, clip.duration, fade_in_duration, fade_out_duration
+        )
+        return clip.with_audio(audio)
+
+    def op_background_music(self, clip, context, audio_filename: str,
+                            music_volume: float = 0.3, original_volume: float = 1.0):
+        """موسيقى خلفية"""
+        music = AudioFileClip(str(self._resolve(audio_filename)))
+        context["resources"].append(music)
+        return self.audio_processor.mix_background_music(clip, music, music_volume, original_volume)
+
+    def op_replace_audio(self, clip, context, audio_filename: str):
+        """استبدال الصوت"""
+        audio = AudioFileClip(str(self._resolve(audio_filename)))
+        context["resources"].append(audio)
+        return clip.with_audio(self.audio_processor.fit_audio_duration(audio, clip.duration))
+
+    def op_remove_audio(self, clip, context):
+        """إزالة الصوت"""
+        context["write_options"].pop("audio_codec", None)
+        return clip.without_audio()
+
+    def op_export(self, clip, context, quality: str = "1080p", format: str = "mp4",
+                  fps: int = None, audio_bitrate: str = "192k"):
+        """إعدادات الترميز النهائي (يجب أن تكون آخر عملية)"""
+        if format in STREAMING_FORMATS:
+            raise ValueError("تصدير HLS/DASH غير مدعوم داخل السلسلة؛ استخدم /api/export/video على ناتجها")
+        clip, bitrate = self.export_processor.fit_to_quality(clip, quality)
+        codec, audio_codec = self.export_processor.get_codecs(format)
+        context["write_options"].update({
+            "codec": codec,
+            "bitrate": bitrate,
+            "audio_bitrate": audio_bitrate,
+            "fps": fps if fps else clip.fps
+        })
+        if clip.audio is not None:
+            context["write_options"]["audio_codec"] = audio_codec
+        return clip
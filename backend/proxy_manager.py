@@ -0,0 +1,126 @@
+from pathlib import Path
+import json
+import os
+
+from ffmpeg_utils import run_ffmpeg
+from media_info import get_media_cache
+from workspace import atomic_output
+
+PROXY_DIR_NAME = ".proxies"
+PROXY_HEIGHT = int(os.environ.get("PROXY_HEIGHT", 540))
+# GOP قصير حتى يكون القص والتقديم في المعاينة سريعاً
+PROXY_GOP = int(os.environ.get("PROXY_GOP", 12))
+
+
+class ProxyManager:
+    """نسخ معاينة منخفضة الدقة للملفات المرفوعة
+
+    النسخة تُحفظ في uploads/.proxies/<اسم الملف كاملاً>.mp4 ومعها <اسم الملف>.json
+    بالبيانات؛ الاسم الكامل مع الامتداد حتى لا تتشارك clip.mov و clip.mp4 نسخة واحدة.
+    الاسم النسبي (.proxies/clip.mov.mp4) يعمل مباشرة مع كل المعالجات لأنها تقرأ من مجلد الرفع.
+    """
+
+    def __init__(self, upload_dir: str = "../uploads"):
+        self.upload_dir = Path(upload_dir)
+        self.proxy_dir = self.upload_dir / PROXY_DIR_NAME
+        self.proxy_dir.mkdir(parents=True, exist_ok=True)
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
+
+    def _proxy_name(self, filename: str) -> str:
+        return f"{PROXY_DIR_NAME}/{Path(filename).name}.mp4"
+
+    def _meta_path(self, filename: str) -> Path:
+        """ملف البيانات لاسم أصلي أو لاسم نسخة معاينة (.proxies/<الاسم>.mp4)"""
+        name = Path(filename).name
+        if filename.startswith(PROXY_DIR_NAME + "/") and name.endswith(".mp4"):
+            name = name[:-len(".mp4")]
+        return self.proxy_dir / f"{name}.json"
+
+    def get_proxy(self, filename: str):
+        """بيانات النسخة إن كانت جاهزة وأحدث من الأصل، وإلا None"""
+        if filename.startswith(PROXY_DIR_NAME + "/"):
+            return None
+        meta_path = self._meta_path(filename)
+        original_path = self.upload_dir / filename
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            proxy_path = self.upload_dir / meta["proxy"]
+            if meta["original"] != filename or not proxy_path.exists():
+                return None
+            if proxy_path.stat().st_mtime < original_path.stat().st_mtime:
+                return None
+        except (OSError, ValueError, KeyError):
+            return None
+        return meta
+
+    def proxy_filename(self, filename: str):
+        """اسم النسخة المستخدم مع المعالجات، أو None إن لم تكن جاهزة"""
+        meta = self.get_proxy(filename)
+        return meta["proxy"] if meta else None
+
+    def original_for(self, filename: str) -> str:
+        """إرجاع اسم الملف الأصلي إذا كان الاسم يشير إلى نسخة معاينة"""
+        if not filename.startswith(PROXY_DIR_NAME + "/"):
+            return filename
+        try:
+            meta = json.loads(self._meta_path(filename).read_text(encoding="utf-8"))
+            return meta["original"]
+        except (OSError, ValueError, KeyError):
+            return filename
+
+    def generate_proxy(self, filename: str):
+        """إنشاء نسخة معاينة بدقة منخفضة و GOP قصير"""
+        try:
+            original_path = self.upload_dir / filename
+            if not original_path.exists():
+                return {"success": False, "error": "الملف غير موجود"}
+
+            existing = self.get_proxy(filename)
+            if existing:
+                return {"success": True, **existing}
+
+            info = self.media_cache.get(original_path)
+            if not info.get("has_video"):
+                return {"success": False, "error": "الملف لا يحتوي على فيديو"}
+
+            proxy_name = self._proxy_name(filename)
+            proxy_path = self.upload_dir / proxy_name
+
+            with atomic_output(proxy_path) as tmp_output:
+                run_ffmpeg([
+                    "-i", original_path,
+                    "-map", "0:v:0", "-map", "0:a:0?",
+                    "-vf", f"scale=-2:'min({PROXY_HEIGHT},ih)'",
+                    "-c:v", "libx264",
+                    "-preset", "veryfast",
+                    "-crf", "28",
+                    "-g", str(PROXY_GOP),
+                    "-keyint_min", str(PROXY_GOP),
+                    "-sc_threshold", "0",
+                    "-pix_fmt", "yuv420p",
+                    "-c:a", "aac",
+                    "-b:a", "96k",
+                    "-ac", "2",
+                    "-movflags", "+faststart",
+                    tmp_output
+                ], duration=info.get("duration"), stage="proxy")
+
+            proxy_info = self.media_cache.get(proxy_path)
+            meta = {
+                "original": filename,
+                "proxy": proxy_name,
+                "width": proxy_info.get("width"),
+                "height": proxy_info.get("height"),
+                "original_width": info.get("width"),
+                "original_height": info.get("height"),
+                "duration": proxy_info.get("duration"),
+                "size": os.path.getsize(proxy_path)
+            }
+            meta_path = self._meta_path(filename)
+            tmp_meta = meta_path.with_suffix(".json.tmp")
+            tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+            os.replace(tmp_meta, meta_path)
+
+            return {"success": True, **meta}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
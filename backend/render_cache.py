@@ -0,0 +1,204 @@
+from contextlib import contextmanager
+from pathlib import Path
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+from workspace import atomic_output
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def link_or_copy(source, destination):
+    """ربط صلب للملف، أو نسخه إذا كان على نظام ملفات آخر، مع استبدال ذري للوجهة"""
+    with atomic_output(destination) as tmp_path:
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copy2(source, tmp_path)
+
+
+class RenderCache:
+    """ذاكرة للمخرجات مفتاحها بصمة محتوى المدخلات واسم العملية ومعاملاتها"""
+
+    def __init__(
+        self,
+        upload_dir: str = "../uploads",
+        processed_dir: str = "../processed",
+        budget_bytes: int = None
+    ):
+        self.upload_dir = Path(upload_dir)
+        self.processed_dir = Path(processed_dir)
+        self.cache_dir = self.processed_dir / ".render_cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.budget_bytes = budget_bytes or int(
+            os.environ.get("RENDER_CACHE_BUDGET", 10 * 1024 ** 3)
+        )
+        self.db_path = self.cache_dir / "index.sqlite"
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, object TEXT, size INTEGER, result TEXT, last_access REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_hashes ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _resolve_input(self, filename: str) -> Path:
+        path = self.upload_dir / filename
+        if not path.exists():
+            path = self.processed_dir / filename
+        return path
+
+    def file_hash(self, path) -> str:
+        """بصمة SHA-256 لمحتوى الملف، محفوظة حسب الحجم ووقت التعديل"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (str(path), stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        file_hash = digest.hexdigest()
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns, file_hash)
+            )
+        return file_hash
+
+    def remember_hash(self, path, file_hash: str):
+        """حفظ بصمة محسوبة مسبقاً (مثلاً أثناء الرفع) لتجنب قراءة الملف مرة أخرى"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns, file_hash)
+            )
+
+    def make_key(self, processor_class, method_name: str, args: tuple, kwargs: dict):
+        """حساب مفتاح العملية ومسار الإخراج المطلوب
+
+        المعاملات التي تنتهي بـ filename/filenames تعتبر ملفات إدخال ويُستبدل
+        اسمها ببصمة محتواها، و output_filename لا يدخل في المفتاح.
+        يرجع (None, None) إذا لم يكن للعملية ملف إخراج.
+        """
+        method = getattr(processor_class, method_name)
+        bound = inspect.signature(method).bind(None, *args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        params.pop("self", None)
+
+        output_filename = params.pop("output_filename", None)
+        if output_filename is None:
+            return None, None
+
+        normalized = self._normalize_params(params)
+        payload = json.dumps(
+            {
+                "operation": f"{processor_class.__name__}.{method_name}",
+                "params": normalized,
+                "suffix": Path(output_filename).suffix.lower()
+            },
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest(), output_filename
+
+    def _normalize_params(self, value, name: str = ""):
+        """استبدال أسماء ملفات الإدخال ببصمة محتواها، بما فيها القوائم والقواميس المتداخلة"""
+        if isinstance(value, dict):
+            return {k: self._normalize_params(v, k) for k, v in value.items()}
+        if name.endswith("filename") and isinstance(value, str):
+            try:
+                return self.file_hash(self._resolve_input(value))
+            except (FileNotFoundError, IsADirectoryError):
+                # نفس رسالة المعالجات بدل خطأ يكشف المسار الكامل على الخادم
+                raise ValueError("الملف غير موجود") from None
+        if isinstance(value, (list, tuple)):
+            return [self._normalize_params(v, name.rstrip("s")) for v in value]
+        return value
+
+    def lookup(self, key: str, output_filename: str):
+        """عند وجود المفتاح: ربط المخرج المحفوظ باسم الإخراج المطلوب وإرجاع النتيجة"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT object, result FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            object_path = self.cache_dir / row[0]
+            if not object_path.exists():
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+
+        output_path = self.processed_dir / output_filename
+        link_or_copy(object_path, output_path)
+        return self._rebase_result(json.loads(row[1]), output_filename)
+
+    def store(self, key: str, result: dict):
+        """حفظ مخرج ناجح في الذاكرة ثم إخلاء الأقدم استخداماً عند تجاوز الميزانية"""
+        output_path = Path(result.get("path", ""))
+        if not output_path.is_file():
+            return
+
+        object_name = f"{key}{output_path.suffix}"
+        link_or_copy(output_path, self.cache_dir / object_name)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, object, size, result, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, object_name, output_path.stat().st_size, json.dumps(result), time.time())
+            )
+        self.evict()
+
+    def evict(self):
+        """إخلاء المخرجات الأقدم استخداماً حتى يصبح الحجم ضمن الميزانية"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, object, size FROM entries ORDER BY last_access ASC"
+            ).fetchall()
+            total = sum(row[2] for row in rows)
+            for key, object_name, size in rows:
+                if total <= self.budget_bytes:
+                    break
+                object_path = self.cache_dir / object_name
+                if object_path.exists():
+                    object_path.unlink()
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+
+    def _rebase_result(self, result: dict, output_filename: str) -> dict:
+        """تعديل النتيجة المحفوظة لتشير إلى اسم الإخراج الجديد"""
+        result = dict(result)
+        output_path = self.processed_dir / output_filename
+        result["output_file"] = output_filename
+        result["path"] = str(output_path)
+        result["cached"] = True
+        return result
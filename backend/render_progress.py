@@ -0,0 +1,92 @@
+import time
+
+from proglog import ProgressBarLogger
+
+# أقل فاصل زمني بين تحديثين يرسلهما العامل لنفس المهمة
+REPORT_INTERVAL = 0.5
+
+# مُبلِّغ المهمة الجارية داخل عملية العامل (مهمة واحدة في كل مرة لكل عامل)
+_reporter = None
+
+
+class ProgressReporter:
+    """حساب الإطارات والسرعة والوقت المتبقي وإرسالها إلى العملية الرئيسية عبر طابور"""
+
+    def __init__(self, job_id: str, queue, interval: float = REPORT_INTERVAL):
+        self.job_id = job_id
+        self.queue = queue
+        self.interval = interval
+        self.state = {
+            "stage": None,
+            "frames": None,
+            "total_frames": None,
+            "fps": None,
+            "progress": None,
+            "eta": None
+        }
+        self._stage_started = time.time()
+        self._last_sent = 0.0
+
+    def update(self, stage: str = None, frames: int = None, total_frames: int = None,
+               progress: float = None, force: bool = False):
+        now = time.time()
+        state = self.state
+        if stage is not None and stage != state["stage"]:
+            state.update({"stage": stage, "frames": None, "total_frames": None,
+                          "fps": None, "progress": None, "eta": None})
+            self._stage_started = now
+            force = True
+        if total_frames is not None:
+            state["total_frames"] = total_frames
+        if frames is not None:
+            state["frames"] = frames
+            elapsed = now - self._stage_started
+            if elapsed > 0:
+                state["fps"] = round(frames / elapsed, 2)
+            if state["total_frames"]:
+                progress = frames / state["total_frames"]
+        if progress is not None:
+            progress = min(max(progress, 0.0), 1.0)
+            state["progress"] = round(progress, 4)
+            elapsed = now - self._stage_started
+            if progress > 0:
+                state["eta"] = round(elapsed * (1 - progress) / progress, 1)
+
+        if force or now - self._last_sent >= self.interval:
+            self._last_sent = now
+            try:
+                self.queue.put(("progress", self.job_id, dict(state)))
+            except Exception:
+                pass
+
+
+def set_reporter(reporter):
+    global _reporter
+    _reporter = reporter
+
+
+def reporting() -> bool:
+    return _reporter is not None
+
+
+def report(**kwargs):
+    """تحديث تقدم المهمة الجارية إن وُجدت (لا شيء خارج مجمع العمليات)"""
+    if _reporter is not None:
+        _reporter.update(**kwargs)
+
+
+class MoviePyProgressLogger(ProgressBarLogger):
+    """تحويل أشرطة تقدم moviepy (chunk للصوت و frame_index/t للفيديو) إلى تحديثات"""
+
+    BAR_STAGES = {"chunk": "audio", "frame_index": "video", "t": "video"}
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        stage = self.BAR_STAGES.get(bar)
+        if stage is None or attr != "index":
+            return
+        report(stage=stage, frames=value, total_frames=self.bars[bar].get("total"))
+
+
+def render_logger():
+    """مسجل moviepy المناسب: مسجل التقدم داخل المهام، وشريط التقدم الافتراضي خارجها"""
+    return MoviePyProgressLogger() if _reporter is not None else "bar"
@@ -0,0 +1,175 @@
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+import bisect
+import numpy as np
+
+
+def _load_font(font: str, fontsize: int):
+    try:
+        return ImageFont.truetype(font, fontsize)
+    except (OSError, TypeError, ValueError):
+        return ImageFont.load_default(size=fontsize)
+
+
+class SubtitleCompositor:
+    """حرق الترجمات دون مقطع لكل ترجمة
+
+    كل ترجمة تُرسم مرة واحدة إلى صورة RGBA محفوظة، والترجمات النشطة لكل إطار
+    تُوجد عبر فهرس مرتب بأوقات البداية، ويُمزج فقط المستطيل الذي تغطيه الصورة.
+    """
+
+    def __init__(
+        self,
+        subtitles: list,
+        frame_size: tuple,
+        font: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        fontsize: int = 24,
+        color: str = "white",
+        position: tuple = ('center', 'bottom'),
+        bg_color: str = None,
+        shape_text=None,
+        margin: int = 100
+    ):
+        self.cues = sorted(
+            (cue for cue in subtitles if cue["end"] > cue["start"]),
+            key=lambda cue: cue["start"]
+        )
+        self.starts = [cue["start"] for cue in self.cues]
+        # أطول مدة ترجمة تحدد إلى أي مدى نرجع في الفهرس بحثاً عن ترجمات متداخلة
+        self.max_duration = max((cue["end"] - cue["start"] for cue in self.cues), default=0)
+
+        self.frame_width, self.frame_height = frame_size
+        self.font = _load_font(font, fontsize)
+        self.color = ImageColor.getrgb(color)
+        self.position = position
+        self.bg_color = ImageColor.getrgb(bg_color) if bg_color else None
+        self.shape_text = shape_text
+        self.max_width = max(1, self.frame_width - margin)
+        # صور الترجمات النشطة فقط؛ تُحذف الصورة بمجرد خروج ترجمتها من الإطار
+        self._sprites = {}
+        self._word_widths = {}
+        self._space_width = self.font.getlength(" ")
+
+    def active_cues(self, t: float) -> list:
+        """فهارس الترجمات النشطة عند الزمن t"""
+        index = bisect.bisect_right(self.starts, t) - 1
+        active = []
+        while index >= 0 and self.starts[index] >= t - self.max_duration:
+            if self.cues[index]["end"] > t:
+                active.append(index)
+            index -= 1
+        active.reverse()
+        return active
+
+    def _word_width(self, word: str) -> float:
+        width = self._word_widths.get(word)
+        if width is None:
+            width = self._word_widths[word] = self.font.getlength(word)
+        return width
+
+    def _wrap(self, text: str) -> list:
+        """تقسيم النص إلى أسطر لا تتجاوز العرض المتاح (بالترتيب المنطقي قبل bidi)
+
+        العرض يُقاس بجمع عروض الكلمات غير المشكلة، ولا تُشكل إلا الأسطر النهائية.
+        """
+        lines = []
+        for paragraph in text.split("\n"):
+            current = []
+            current_width = 0.0
+            for word in paragraph.split():
+                word_width = self._word_width(word)
+                if current and current_width + self._space_width + word_width > self.max_width:
+                    lines.append(" ".join(current))
+                    current = [word]
+                    current_width = word_width
+                elif current:
+                    current.append(word)
+                    current_width += self._space_width + word_width
+                else:
+                    current = [word]
+                    current_width = word_width
+            lines.append(" ".join(current))
+        if self.shape_text:
+            lines = [self.shape_text(line) for line in lines]
+        return lines
+
+    def _rasterize(self, text: str):
+        """رسم الترجمة إلى RGB مضروب مسبقاً في الشفافية + معكوس الشفافية"""
+        lines = self._wrap(text)
+        ascent, descent = self.font.getmetrics()
+        line_height = ascent + descent
+        widths = [int(np.ceil(self.font.getlength(line))) for line in lines]
+        pad_x, pad_y = (10, 5) if self.bg_color else (0, 0)
+        width = max(widths, default=1) + 2 * pad_x
+        height = line_height * len(lines) + 2 * pad_y
+
+        image = Image.new("RGBA", (max(width, 1), max(height, 1)), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(image)
+        if self.bg_color:
+            draw.rectangle([0, 0, width, height], fill=self.bg_color + (int(255 * 0.6),))
+        for i, (line, line_width) in enumerate(zip(lines, widths)):
+            x = pad_x + (width - 2 * pad_x - line_width) // 2
+            draw.text((x, pad_y + i * line_height), line, font=self.font, fill=self.color + (255,))
+
+        rgba = np.asarray(image, dtype=np.uint16)
+        alpha = rgba[..., 3:4]
+        premultiplied = rgba[..., :3] * alpha
+        inverse_alpha = 255 - alpha
+        return premultiplied, inverse_alpha
+
+    def _sprite(self, index: int):
+        sprite = self._sprites.get(index)
+        if sprite is None:
+            sprite = self._rasterize(self.cues[index]["text"])
+            self._sprites[index] = sprite
+        return sprite
+
+    def _place(self, width: int, height: int):
+        x, y = self.position
+        if x == 'center':
+            x = (self.frame_width - width) // 2
+        elif x == 'left':
+            x = 0
+        elif x == 'right':
+            x = self.frame_width - width
+        if y == 'center':
+            y = (self.frame_height - height) // 2
+        elif y == 'top':
+            y = 0
+        elif y == 'bottom':
+            y = self.frame_height - height
+        return int(x), int(y)
+
+    def composite(self, frame: np.ndarray, t: float) -> np.ndarray:
+        """مزج الترجمات النشطة داخل مستطيلاتها فقط"""
+        active = self.active_cues(t)
+        if not active:
+            self._sprites.clear()
+            return frame
+
+        frame = np.array(frame, dtype=np.uint8, copy=True)
+        for index in active:
+            premultiplied, inverse_alpha = self._sprite(index)
+            height, width = inverse_alpha.shape[:2]
+            x, y = self._place(width, height)
+
+            # قص الصورة عند حدود الإطار
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + width, self.frame_width), min(y + height, self.frame_height)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            sx, sy = x0 - x, y0 - y
+
+            region = frame[y0:y1, x0:x1, :3]
+            blended = region.astype(np.uint16)
+            blended *= inverse_alpha[sy:sy + y1 - y0, sx:sx + x1 - x0]
+            blended += premultiplied[sy:sy + y1 - y0, sx:sx + x1 - x0]
+            blended //= 255
+            region[...] = blended
+
+        # كل الترجمات النشطة لها صور الآن، فأي صورة زائدة تخص ترجمة انتهت
+        if len(self._sprites) > len(active):
+            self._sprites = {index: self._sprites[index] for index in active}
+        return frame
+
+    def __call__(self, get_frame, t):
+        return self.composite(get_frame(t), t)
@@ -0,0 +1,187 @@
+import re
+
+# وسوم WebVTT داخل النص مثل <c> و <00:00:01.000> و <v Speaker>
+VTT_TAG_PATTERN = re.compile(r"<[^>]*>")
+# كتل التنسيق في ASS مثل {\an8\b1}
+ASS_OVERRIDE_PATTERN = re.compile(r"\{[^}]*\}")
+
+VTT_SKIPPED_BLOCKS = ("NOTE", "STYLE", "REGION")
+
+
+def parse_timestamp(value: str) -> float:
+    """تحويل وقت SRT/WebVTT/ASS إلى ثوانٍ بالحساب حرفاً حرفاً
+
+    يقبل 00:00:01,500 و 00:01.500 و 0:00:01.50
+    """
+    value = value.strip()
+    # المسار السريع للصيغة الثابتة HH:MM:SS,mmm
+    if len(value) == 12 and value[2] == ":" and value[5] == ":" and value[8] in ",.":
+        try:
+            return (int(value[0:2]) * 3600 + int(value[3:5]) * 60 + int(value[6:8])
+                    + int(value[9:12]) / 1000)
+        except ValueError:
+            pass
+
+    total = 0
+    field = 0
+    fraction = 0
+    scale = 1
+    in_fraction = False
+    for char in value:
+        digit = ord(char) - 48
+        if 0 <= digit <= 9:
+            if in_fraction:
+                fraction = fraction * 10 + digit
+                scale *= 10
+            else:
+                field = field * 10 + digit
+        elif char == ":" and not in_fraction:
+            total = total * 60 + field
+            field = 0
+        elif char in ",." and not in_fraction:
+            in_fraction = True
+        else:
+            raise ValueError(f"وقت غير صالح: {value}")
+    return total * 60 + field + fraction / scale
+
+
+def _parse_timing(line: str):
+    """سطر التوقيت: البداية --> النهاية [إعدادات اختيارية]"""
+    start, _, rest = line.partition("-->")
+    end = rest.split(None, 1)[0] if rest.strip() else ""
+    return parse_timestamp(start), parse_timestamp(end)
+
+
+def _make_cue(index: int, start: float, end: float, text_lines: list) -> dict:
+    text = "\n".join(text_lines).strip()
+    return {
+        "index": index,
+        "start": start,
+        "end": end,
+        "text": text,
+        "duration": end - start
+    }
+
+
+def iter_text_cues(lines, strip_tags: bool = False):
+    """محلل حالات سطري لـ SRT و WebVTT يُرجع الترجمات تباعاً
+
+    يتحمل نهايات CRLF، وغياب السطر الفارغ الأخير، وترجمات متلاصقة دون سطر فارغ.
+    """
+    cue = None
+    pending_index = None
+    skipping = False
+    count = 0
+
+    for line in lines:
+        line = line.rstrip("\r\n")
+        stripped = line.strip()
+
+        if not stripped:
+            if cue is not None:
+                yield _make_cue(*cue)
+                cue = None
+            pending_index = None
+            skipping = False
+            continue
+
+        if skipping:
+            continue
+
+        if "-->" in line:
+            try:
+                start, end = _parse_timing(line)
+            except ValueError:
+                if cue is not None:
+                    cue[3].append(line)
+                continue
+            if cue is not None:
+                # ترجمة جديدة دون سطر فارغ: السطر الرقمي الأخير هو رقمها
+                text_lines = cue[3]
+                if text_lines and text_lines[-1].strip().isdigit():
+                    pending_index = int(text_lines.pop())
+                yield _make_cue(*cue)
+            count += 1
+            cue = (pending_index if pending_index is not None else count, start, end, [])
+            pending_index = None
+            continue
+
+        if cue is None:
+            if stripped.isdigit():
+                pending_index = int(stripped)
+            elif stripped.startswith(VTT_SKIPPED_BLOCKS):
+                skipping = True
+            continue
+
+        cue[3].append(VTT_TAG_PATTERN.sub("", line) if strip_tags else line)
+
+    if cue is not None:
+        yield _make_cue(*cue)
+
+
+def iter_ass_cues(lines):
+    """قراءة أسطر Dialogue من قسم [Events] في ملف ASS/SSA"""
+    in_events = False
+    fields = ["layer", "start", "end", "style", "name",
+              "marginl", "marginr", "marginv", "effect", "text"]
+    count = 0
+
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_events = stripped.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+
+        key, _, value = stripped.partition(":")
+        key = key.strip().lower()
+        if key == "format":
+            fields = [field.strip().lower() for field in value.split(",")]
+        elif key == "dialogue":
+            values = value.split(",", len(fields) - 1)
+            if len(values) < len(fields):
+                continue
+            row = dict(zip(fields, values))
+            text = ASS_OVERRIDE_PATTERN.sub("", row["text"])
+            text = text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+            count += 1
+            yield _make_cue(
+                count, parse_timestamp(row["start"]), parse_timestamp(row["end"]), text.split("\n")
+            )
+
+
+def iter_cues(lines, format: str = None):
+    """اكتشاف الصيغة من أول سطر غير فارغ ثم تحليل الأسطر كمولد"""
+    lines = iter(lines)
+    buffered = []
+    if format is None:
+        for line in lines:
+            buffered.append(line)
+            head = line.strip().lstrip("\ufeff")
+            if not head:
+                continue
+            if head.startswith("WEBVTT"):
+                format = "vtt"
+            elif head.startswith("[") or head.lower().startswith("scripttype"):
+                format = "ass"
+            else:
+                format = "srt"
+            break
+
+    if buffered:
+        buffered[0] = buffered[0].lstrip("\ufeff")
+
+    def chained():
+        yield from buffered
+        yield from lines
+
+    if format in ("ass", "ssa"):
+        return iter_ass_cues(chained())
+    return iter_text_cues(chained(), strip_tags=(format == "vtt"))
+
+
+def iter_subtitle_file(path, format: str = None):
+    """قراءة ملف ترجمة سطراً سطراً دون تحميله كاملاً في الذاكرة"""
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        yield from iter_cues(f, format)
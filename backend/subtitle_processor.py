@@ -1,59 +1,51 @@
 from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
-from arabic_reshaper import reshape
-from bidi.algorithm import get_display
 from pathlib import Path
-import re
+from PIL import ImageColor, ImageFont
+
+from ffmpeg_utils import run_ffmpeg
+from media_info import get_media_cache
+from subtitle_compositor import SubtitleCompositor
+from subtitle_parser import iter_cues, iter_subtitle_file, parse_timestamp
+from text_shaping import is_arabic, shape_cues, shape_text
+from render_progress import render_logger
+from workspace import Workspace, atomic_output, scratch_path
+
+# محاذاة ASS (لوحة الأرقام) حسب الموضع الرأسي
+ASS_ALIGNMENT = {"bottom": 2, "center": 5, "top": 8}
+
+# ترميز مسار الترجمة المرنة حسب الحاوية
+SOFT_SUBTITLE_CODECS = {
+    ".mp4": "mov_text",
+    ".m4v": "mov_text",
+    ".mov": "mov_text",
+    ".webm": "webvtt",
+    ".mkv": "srt"
+}
+
+# رموز اللغات ISO 639-2 التي تتطلبها حاويات MP4/MOV
+LANGUAGE_CODES = {
+    "ar": "ara", "en": "eng", "fr": "fra", "de": "deu", "es": "spa",
+    "tr": "tur", "fa": "fas", "ur": "urd", "ru": "rus", "zh": "zho",
+    "ja": "jpn", "ko": "kor", "it": "ita", "pt": "por", "hi": "hin"
+}
 
 class SubtitleProcessor:
     def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
         self.upload_dir = Path(upload_dir)
         self.processed_dir = Path(processed_dir)
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
     
     def fix_arabic_text(self, text: str) -> str:
         """إصلاح النص العربي ليعرض بشكل صحيح"""
-        try:
-            reshaped_text = reshape(text)
-            bidi_text = get_display(reshaped_text)
-            return bidi_text
-        except:
-            return text
+        return shape_text(text)
     
     def parse_srt(self, srt_content: str) -> list:
-        """تحليل ملف SRT وإرجاع قائمة الترجمات"""
-        subtitles = []
-        pattern = r'(\d+)\n(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})\n((?:.*\n?)*?)(?=\n\d+\n|\Z)'
-        
-        matches = re.finditer(pattern, srt_content, re.MULTILINE)
-        
-        for match in matches:
-            index = int(match.group(1))
-            start_time = self.srt_time_to_seconds(match.group(2))
-            end_time = self.srt_time_to_seconds(match.group(3))
-            text = match.group(4).strip()
-            
-            subtitles.append({
-                "index": index,
-                "start": start_time,
-                "end": end_time,
-                "text": text,
-                "duration": end_time - start_time
-            })
-        
-        return subtitles
+        """تحليل محتوى ترجمة (SRT أو WebVTT أو ASS) وإرجاع قائمة الترجمات"""
+        return list(iter_cues(srt_content.splitlines()))
     
     def srt_time_to_seconds(self, time_str: str) -> float:
         """تحويل وقت SRT (00:00:00,000) إلى ثواني"""
-        hours, minutes, seconds = time_str.split(':')
-        seconds, milliseconds = seconds.split(',')
-        
-        total_seconds = (
-            int(hours) * 3600 +
-            int(minutes) * 60 +
-            int(seconds) +
-            int(milliseconds) / 1000
-        )
-        
-        return total_seconds
+        return parse_timestamp(time_str)
     
     def add_subtitles_to_video(
         self, 
@@ -64,65 +56,67 @@ class SubtitleProcessor:
         fontsize: int = 24,
         color: str = "white",
         position: tuple = ('center', 'bottom'),
-        bg_color: str = None
+        bg_color: str = None,
+        engine: str = "compositor",
+        language: str = "ar"
     ):
-        """إضافة الترجمات إلى الفيديو"""
+        """إضافة الترجمات إلى الفيديو
+
+        engine: compositor (صور مرسومة مسبقاً مع فهرس زمني)، libass (فلتر subtitles
+        الأصلي في ffmpeg مع تشكيل HarfBuzz)، moviepy (TextClip لكل ترجمة)،
+        soft (مسار ترجمة منفصل دون إعادة ترميز الفيديو)
+        """
         try:
             input_path = self.upload_dir / input_filename
             output_path = self.processed_dir / output_filename
             
-            video = VideoFileClip(str(input_path))
+            if engine == "soft":
+                result = self.mux_subtitles(
+                    input_filename, [{"subtitles": subtitles, "language": language}], output_filename
+                )
+                if result.get("success"):
+                    result["engine"] = engine
+                return result
             
-            subtitle_clips = []
+            if engine == "libass":
+                self.burn_subtitles_libass(
+                    input_path, subtitles, output_path, font=font, fontsize=fontsize,
+                    color=color, position=position, bg_color=bg_color
+                )
+                return {
+                    "success": True,
+                    "output_file": output_filename,
+                    "path": str(output_path),
+                    "subtitles_count": len(subtitles),
+                    "engine": engine
+                }
             
-            for subtitle in subtitles:
-                text = subtitle['text']
-                
-                if self.is_arabic(text):
-                    text = self.fix_arabic_text(text)
-                
-                # Try using specified font, fallback to default if not found
-                try:
-                    txt_clip = TextClip(
-                        text=text,
-                        font=font,
-                        font_size=fontsize,
-                        color=color,
-                        method='caption',
-                        size=(video.w - 100, None)
-                    )
-                except:
-                    # Fallback to default font
-                    txt_clip = TextClip(
-                        text=text,
-                        font_size=fontsize,
-                        color=color,
-                        method='caption',
-                        size=(video.w - 100, None)
-                    )
-                
-                if bg_color:
-                    txt_clip = txt_clip.on_color(
-                        size=(txt_clip.w + 20, txt_clip.h + 10),
-                        color=bg_color,
-                        col_opacity=0.6
-                    )
-                
-                txt_clip = txt_clip.with_start(subtitle['start'])
-                txt_clip = txt_clip.with_duration(subtitle['duration'])
-                txt_clip = txt_clip.with_position(position)
-                
-                subtitle_clips.append(txt_clip)
+            video = VideoFileClip(str(input_path))
             
-            final_video = CompositeVideoClip([video] + subtitle_clips)
+            if engine == "compositor":
+                final_video = self.composite_subtitles(
+                    video, subtitles, font=font, fontsize=fontsize,
+                    color=color, position=position, bg_color=bg_color
+                )
+            elif engine == "moviepy":
+                subtitle_clips = self.create_subtitle_clips(
+                    video, subtitles, font=font, fontsize=fontsize,
+                    color=color, position=position, bg_color=bg_color
+                )
+                final_video = CompositeVideoClip([video] + subtitle_clips)
+            else:
+                video.close()
+                return {"success": False, "error": "محرك الترجمة غير مدعوم"}
             
-            final_video.write_videofile(
-                str(output_path),
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True
-            )
+            with atomic_output(output_path) as tmp_output:
+                final_video.write_videofile(
+                    str(tmp_output),
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=scratch_path('temp-audio.m4a'),
+                    remove_temp=True,
+                    logger=render_logger()
+                )
             
             video.close()
             final_video.close()
@@ -131,24 +125,280 @@ class SubtitleProcessor:
                 "success": True,
                 "output_file": output_filename,
                 "path": str(output_path),
-                "subtitles_count": len(subtitles)
+                "subtitles_count": len(subtitles),
+                "engine": engine
+            }
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def seconds_to_ass_time(self, seconds: float) -> str:
+        """تحويل الثواني إلى وقت ASS (H:MM:SS.cc)"""
+        centiseconds = int(round(seconds * 100))
+        hours, centiseconds = divmod(centiseconds, 360000)
+        minutes, centiseconds = divmod(centiseconds, 6000)
+        secs, centiseconds = divmod(centiseconds, 100)
+        return f"{hours}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+    
+    def ass_color(self, color: str, opacity: float = 1.0) -> str:
+        """تحويل اللون إلى صيغة ASS &HAABBGGRR"""
+        r, g, b = ImageColor.getrgb(color)[:3]
+        alpha = int(round(255 * (1 - opacity)))
+        return f"&H{alpha:02X}{b:02X}{g:02X}{r:02X}"
+    
+    def build_ass_script(
+        self,
+        subtitles: list,
+        width: int,
+        height: int,
+        font: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        fontsize: int = 24,
+        color: str = "white",
+        position: tuple = ('center', 'bottom'),
+        bg_color: str = None
+    ) -> str:
+        """إنشاء ملف ASS من الترجمات؛ النص العربي يبقى بترتيبه المنطقي ليشكله libass"""
+        try:
+            font_name = ImageFont.truetype(font, fontsize).getname()[0]
+        except (OSError, TypeError, ValueError):
+            font_name = "DejaVu Sans"
+        
+        alignment = ASS_ALIGNMENT.get(position[1], 2)
+        # BorderStyle=3 يرسم صندوقاً خلف النص بلون BackColour/OutlineColour
+        border_style = 3 if bg_color else 1
+        box_color = self.ass_color(bg_color, 0.6) if bg_color else "&H80000000"
+        
+        lines = [
+            "[Script Info]",
+            "ScriptType: v4.00+",
+            f"PlayResX: {width}",
+            f"PlayResY: {height}",
+            "WrapStyle: 0",
+            "ScaledBorderAndShadow: yes",
+            "",
+            "[V4+ Styles]",
+            "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, "
+            "BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, "
+            "BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding",
+            f"Style: Default,{font_name},{fontsize},{self.ass_color(color)},&H000000FF,"
+            f"{box_color},{box_color},0,0,0,0,100,100,0,0,{border_style},"
+            f"{5 if bg_color else 1},0,{alignment},50,50,10,1",
+            "",
+            "[Events]",
+            "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+        ]
+        for subtitle in subtitles:
+            text = subtitle['text'].replace('\\', '\\\\').replace('{', '\\{').replace('}', '\\}')
+            text = text.replace('\r', '').replace('\n', '\\N')
+            lines.append(
+                f"Dialogue: 0,{self.seconds_to_ass_time(subtitle['start'])},"
+                f"{self.seconds_to_ass_time(subtitle['end'])},Default,,0,0,0,,{text}"
+            )
+        return "\n".join(lines) + "\n"
+    
+    def burn_subtitles_libass(
+        self,
+        input_path,
+        subtitles: list,
+        output_path,
+        font: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        fontsize: int = 24,
+        color: str = "white",
+        position: tuple = ('center', 'bottom'),
+        bg_color: str = None
+    ):
+        """حرق الترجمات بفلتر subtitles في ffmpeg (libass + HarfBuzz) مع نسخ الصوت"""
+        info = self.media_cache.get(input_path)
+        script = self.build_ass_script(
+            subtitles, info["width"], info["height"], font=font, fontsize=fontsize,
+            color=color, position=position, bg_color=bg_color
+        )
+        
+        with Workspace(prefix="subtitles-") as scratch:
+            ass_path = scratch.file("subtitles.ass")
+            ass_path.write_text(script, encoding="utf-8")
+            
+            subtitles_filter = (
+                f"subtitles=filename='{self.escape_filter_path(ass_path)}'"
+                f":fontsdir='{self.escape_filter_path(Path(font).parent)}'"
+            )
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg([
+                    "-i", input_path,
+                    "-map", "0:v:0", "-map", "0:a?",
+                    "-vf", subtitles_filter,
+                    "-c:v", "libx264",
+                    "-pix_fmt", "yuv420p",
+                    "-c:a", "copy",
+                    tmp_output
+                ], duration=info.get("duration"), stage="subtitles")
+    
+    def escape_filter_path(self, path) -> str:
+        """تهريب المسار داخل وسيط فلتر ffmpeg"""
+        path = str(Path(path).resolve())
+        return path.replace('\\', '\\\\').replace(':', '\\:').replace("'", "\\'")
+    
+    def seconds_to_vtt_time(self, seconds: float) -> str:
+        """تحويل الثواني إلى وقت WebVTT (00:00:00.000)"""
+        milliseconds = int(round(seconds * 1000))
+        hours, milliseconds = divmod(milliseconds, 3600000)
+        minutes, milliseconds = divmod(milliseconds, 60000)
+        secs, milliseconds = divmod(milliseconds, 1000)
+        return f"{hours:02d}:{minutes:02d}:{secs:02d}.{milliseconds:03d}"
+    
+    def build_webvtt(self, subtitles: list) -> str:
+        """كتابة الترجمات بصيغة WebVTT (يحولها ffmpeg إلى mov_text عند الحاجة)"""
+        blocks = ["WEBVTT"]
+        for subtitle in subtitles:
+            if subtitle['end'] <= subtitle['start']:
+                continue
+            # سطر فارغ داخل النص ينهي الكتلة في WebVTT
+            text = "\n".join(line for line in subtitle['text'].splitlines() if line.strip())
+            text = text.replace("-->", "->")
+            blocks.append(
+                f"{self.seconds_to_vtt_time(subtitle['start'])} --> "
+                f"{self.seconds_to_vtt_time(subtitle['end'])}\n{text}"
+            )
+        return "\n\n".join(blocks) + "\n"
+    
+    def mux_subtitles(self, input_filename: str, tracks: list, output_filename: str):
+        """إضافة مسارات ترجمة مرنة بنسخ الفيديو والصوت كما هي
+        
+        tracks: قائمة من {"subtitles": [...], "language": "ar", "title": "..."}
+        """
+        try:
+            input_path = self.upload_dir / input_filename
+            output_path = self.processed_dir / output_filename
+            
+            if not tracks:
+                return {"success": False, "error": "لا توجد ترجمات لإضافتها"}
+            
+            subtitle_codec = SOFT_SUBTITLE_CODECS.get(output_path.suffix.lower())
+            if subtitle_codec is None:
+                return {"success": False, "error": "الحاوية لا تدعم الترجمات المرنة"}
+            
+            with Workspace(prefix="subtitles-") as scratch:
+                inputs = ["-i", input_path]
+                maps = ["-map", "0:v", "-map", "0:a?"]
+                metadata = []
+                languages = []
+                for i, track in enumerate(tracks):
+                    track_path = scratch.file(f"track_{i}.vtt")
+                    track_path.write_text(self.build_webvtt(track["subtitles"]), encoding="utf-8")
+                    inputs += ["-i", track_path]
+                    maps += ["-map", f"{i + 1}:0"]
+                    
+                    language = track.get("language") or "und"
+                    language = LANGUAGE_CODES.get(language.lower(), language.lower())
+                    languages.append(language)
+                    metadata += [f"-metadata:s:s:{i}", f"language={language}"]
+                    if track.get("title"):
+                        metadata += [f"-metadata:s:s:{i}", f"title={track['title']}"]
+                    metadata += [f"-disposition:s:{i}", "default" if i == 0 else "0"]
+                
+                with atomic_output(output_path) as tmp_output:
+                    run_ffmpeg(
+                        inputs + maps +
+                        ["-c", "copy", "-c:s", subtitle_codec] +
+                        metadata +
+                        [tmp_output],
+                        duration=self.media_cache.get(input_path).get("duration"),
+                        stage="mux"
+                    )
+            
+            return {
+                "success": True,
+                "output_file": output_filename,
+                "path": str(output_path),
+                "subtitle_codec": subtitle_codec,
+                "languages": languages,
+                "subtitles_count": sum(len(track["subtitles"]) for track in tracks)
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def composite_subtitles(
+        self,
+        video,
+        subtitles: list,
+        font: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        fontsize: int = 24,
+        color: str = "white",
+        position: tuple = ('center', 'bottom'),
+        bg_color: str = None
+    ):
+        """حرق الترجمات عبر SubtitleCompositor كتحويل واحد على المقطع"""
+        compositor = SubtitleCompositor(
+            subtitles,
+            (video.w, video.h),
+            font=font,
+            fontsize=fontsize,
+            color=color,
+            position=position,
+            bg_color=bg_color,
+            shape_text=shape_text
+        )
+        return video.transform(compositor)
+    
+    def create_subtitle_clips(
+        self,
+        video,
+        subtitles: list,
+        font: str = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        fontsize: int = 24,
+        color: str = "white",
+        position: tuple = ('center', 'bottom'),
+        bg_color: str = None
+    ) -> list:
+        """إنشاء مقاطع النصوص لكل ترجمة"""
+        subtitle_clips = []
+        
+        for subtitle in shape_cues(subtitles):
+            text = subtitle['text']
+            
+            # Try using specified font, fallback to default if not found
+            try:
+                txt_clip = TextClip(
+                    text=text,
+                    font=font,
+                    font_size=fontsize,
+                    color=color,
+                    method='caption',
+                    size=(video.w - 100, None)
+                )
+            except:
+                # Fallback to default font
+                txt_clip = TextClip(
+                    text=text,
+                    font_size=fontsize,
+                    color=color,
+                    method='caption',
+                    size=(video.w - 100, None)
+                )
+            
+            if bg_color:
+                txt_clip = txt_clip.on_color(
+                    size=(txt_clip.w + 20, txt_clip.h + 10),
+                    color=bg_color,
+                    col_opacity=0.6
+                )
+            
+            txt_clip = txt_clip.with_start(subtitle['start'])
+            txt_clip = txt_clip.with_duration(subtitle['duration'])
+            txt_clip = txt_clip.with_position(position)
+            
+            subtitle_clips.append(txt_clip)
+        
+        return subtitle_clips
+    
     def is_arabic(self, text: str) -> bool:
         """التحقق إذا كان النص يحتوي على أحرف عربية"""
-        arabic_pattern = re.compile(r'[\u0600-\u06FF]')
-        return bool(arabic_pattern.search(text))
+        return is_arabic(text)
     
     def load_srt_file(self, filename: str) -> list:
-        """تحميل ملف SRT"""
+        """تحميل ملف ترجمة (SRT أو WebVTT أو ASS)"""
         try:
             file_path = self.upload_dir / filename
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            subtitles = self.parse_srt(content)
+            subtitles = list(iter_subtitle_file(file_path))
             return {
                 "success": True,
                 "subtitles": subtitles,
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# الوحدات تُستورد بأسمائها مباشرة كما في main.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,62 @@
+import inspect
+from pathlib import Path
+
+import pytest
+
+import export_processor
+from export_processor import ExportProcessor
+
+
+@pytest.fixture
+def processor(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    (uploads / "input.mp4").write_bytes(b"source")
+    processor = ExportProcessor(str(uploads), str(tmp_path / "processed"))
+    (tmp_path / "processed").mkdir()
+    info = {
+        "duration": 240.0, "width": 1920, "height": 1080, "has_audio": True,
+        "keyframes": [float(k) for k in range(0, 240, 2)],
+    }
+    monkeypatch.setattr(processor.media_cache, "get", lambda path: info)
+    return processor
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    calls = []
+
+    def fake_run_ffmpeg(args, **kwargs):
+        calls.append([str(arg) for arg in args])
+        Path(args[-1]).write_bytes(b"out")
+
+    monkeypatch.setattr(export_processor, "run_ffmpeg", fake_run_ffmpeg)
+    return calls
+
+
+def test_segment_encoders_share_cores(processor, commands, monkeypatch):
+    monkeypatch.setattr(export_processor.os, "cpu_count", lambda: 8)
+    result = processor.export_video("input.mp4", "out.mp4", segmented=True, segments=4)
+
+    assert result["success"] and result["segmented"]
+    segment_commands = [cmd for cmd in commands if "-an" in cmd]
+    assert len(segment_commands) == len(result["segments"]) == 4
+    for cmd in segment_commands:
+        assert cmd[cmd.index("-threads") + 1] == "2"
+
+
+def test_threads_never_below_one(processor, commands, monkeypatch):
+    monkeypatch.setattr(export_processor.os, "cpu_count", lambda: 2)
+    processor.export_video("input.mp4", "out.mp4", segmented=True, segments=4)
+    for cmd in (cmd for cmd in commands if "-an" in cmd):
+        assert cmd[cmd.index("-threads") + 1] == "1"
+
+
+def test_segments_start_on_keyframes(processor):
+    ranges = processor.split_at_keyframes([0.0, 50.0, 100.0, 150.0, 200.0], 240.0, 4)
+    assert ranges[0][0] == 0.0 and ranges[-1][1] == 240.0
+    assert all(start in (0.0, 50.0, 100.0, 150.0, 200.0) for start, _ in ranges)
+
+
+def test_export_video_has_no_progress_callback():
+    assert "on_progress" not in inspect.signature(ExportProcessor.export_video).parameters
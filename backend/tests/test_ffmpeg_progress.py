@@ -0,0 +1,79 @@
+from pathlib import Path
+
+import pytest
+
+import audio_processor
+import subtitle_processor
+import video_processor
+from audio_processor import AudioProcessor
+from subtitle_processor import SubtitleProcessor
+from video_processor import VideoProcessor
+
+INFO = {
+    "duration": 12.0, "width": 640, "height": 360, "has_audio": True,
+    "keyframes": [0.0, 2.0, 4.0, 6.0, 8.0, 10.0],
+    "streams": [{"type": "video", "codec": "h264", "pix_fmt": "yuv420p", "profile": "High"}],
+}
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    uploads, processed = tmp_path / "uploads", tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    (uploads / "input.mp4").write_bytes(b"source")
+    return str(uploads), str(processed)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    def fake_run_ffmpeg(args, duration=None, stage="encode"):
+        calls.append((duration, stage, [str(arg) for arg in args]))
+        Path(args[-1]).write_bytes(b"out")
+
+    for module in (video_processor, audio_processor, subtitle_processor):
+        monkeypatch.setattr(module, "run_ffmpeg", fake_run_ffmpeg)
+    return calls
+
+
+def make(cls, dirs, monkeypatch):
+    processor = cls(*dirs)
+    monkeypatch.setattr(processor.media_cache, "get", lambda path: INFO)
+    return processor
+
+
+def test_keyframe_trim_reports_span(dirs, calls, monkeypatch):
+    processor = make(VideoProcessor, dirs, monkeypatch)
+    assert processor.trim_video("input.mp4", 3.0, 9.0, "out.mp4", mode="keyframe")["success"]
+    assert [call[0] for call in calls] == [pytest.approx(7.0)]
+
+
+def test_smart_trim_reports_every_step(dirs, calls, monkeypatch):
+    processor = make(VideoProcessor, dirs, monkeypatch)
+    assert processor.trim_video("input.mp4", 3.0, 9.0, "out.mp4", mode="smart")["success"]
+    assert [call[0] for call in calls] == [
+        pytest.approx(1.0), pytest.approx(4.0), pytest.approx(1.0), pytest.approx(6.0)
+    ]
+
+
+@pytest.mark.parametrize("method, kwargs", [
+    ("adjust_volume", {"volume": 0.5}),
+    ("remove_audio", {}),
+    ("fade_audio", {"fade_in_duration": 1, "fade_out_duration": 1}),
+])
+def test_audio_copies_report_progress_without_trimming(dirs, calls, monkeypatch, method, kwargs):
+    processor = make(AudioProcessor, dirs, monkeypatch)
+    result = getattr(processor, method)("input.mp4", output_filename="out.mp4", **kwargs)
+    assert result["success"] and result["mode"] == "copy"
+    duration, _, args = calls[-1]
+    assert duration == 12.0
+    assert "-t" not in args
+
+
+def test_soft_subtitle_mux_reports_progress(dirs, calls, monkeypatch):
+    processor = make(SubtitleProcessor, dirs, monkeypatch)
+    tracks = [{"subtitles": [{"start": 0, "end": 1, "text": "hi"}], "language": "en"}]
+    assert processor.mux_subtitles("input.mp4", tracks, "out.mkv")["success"]
+    assert calls[-1][0] == 12.0
@@ -0,0 +1,111 @@
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+import pytest
+
+from file_response import MediaFileResponse, content_disposition, parse_range
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    ("bytes=0-99", 1000, [(0, 99)]),
+    ("bytes=900-", 1000, [(900, 999)]),
+    ("bytes=-100", 1000, [(900, 999)]),
+    ("bytes=-5000", 1000, [(0, 999)]),
+    ("bytes=0-2000", 1000, [(0, 999)]),
+    ("bytes=0-9,5-19,30-39", 1000, [(0, 19), (30, 39)]),
+    ("bytes=0-9,10-19", 1000, [(0, 19)]),
+    ("bytes=9999999-", 1000, []),
+    ("bytes=1000-1001", 1000, []),
+    ("bytes=-0", 1000, []),
+    ("bytes=-5", 0, []),
+    ("bytes=0-", 0, []),
+    ("items=0-9", 1000, None),
+    ("bytes=", 1000, None),
+    ("bytes=abc-def", 1000, None),
+    ("bytes=50-10", 1000, None),
+    ("bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(17)), 1000, None),
+])
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+
+def test_content_disposition_ascii():
+    assert content_disposition("a.mp4") == 'attachment; filename="a.mp4"'
+
+
+def test_content_disposition_arabic_is_latin1_encodable():
+    header = content_disposition("فيديو.mp4")
+    header.encode("latin-1")
+    assert header == (
+        "attachment; filename=\"download.mp4\"; "
+        "filename*=utf-8''%D9%81%D9%8A%D8%AF%D9%8A%D9%88.mp4"
+    )
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = FastAPI()
+
+    @app.api_route("/{name}", methods=["GET", "HEAD"])
+    async def download(name: str, request: Request):
+        return MediaFileResponse(tmp_path / name, request.headers, filename=name, method=request.method)
+
+    (tmp_path / "data.bin").write_bytes(bytes(range(256)) * 4)
+    (tmp_path / "empty.bin").write_bytes(b"")
+    (tmp_path / "فيديو.mp4").write_bytes(b"x" * 10)
+    return TestClient(app)
+
+
+def test_full_and_range(client):
+    full = client.get("/data.bin")
+    assert full.status_code == 200
+    assert len(full.content) == 1024
+    assert full.headers["accept-ranges"] == "bytes"
+
+    partial = client.get("/data.bin", headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.headers["content-range"] == "bytes 10-19/1024"
+    assert partial.content == full.content[10:20]
+
+
+def test_multipart_ranges(client):
+    response = client.get("/data.bin", headers={"Range": "bytes=0-1,100-101"})
+    assert response.status_code == 206
+    assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert b"Content-Range: bytes 100-101/1024" in response.content
+
+
+def test_unsatisfiable_range(client):
+    response = client.get("/data.bin", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
+
+
+def test_empty_file_range_is_unsatisfiable(client):
+    response = client.get("/empty.bin", headers={"Range": "bytes=-5"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */0"
+    assert client.get("/empty.bin").status_code == 200
+
+
+def test_conditional_requests(client):
+    etag = client.get("/data.bin").headers["etag"]
+    assert client.get("/data.bin", headers={"If-None-Match": etag}).status_code == 304
+    # If-Range بعلامة قديمة يتجاهل Range ويرسل الملف كاملاً
+    stale = client.get("/data.bin", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    fresh = client.get("/data.bin", headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert fresh.status_code == 206
+
+
+def test_head_has_no_body(client):
+    response = client.head("/data.bin")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == "1024"
+    assert response.content == b""
+
+
+def test_arabic_download_name(client):
+    response = client.get("/فيديو.mp4")
+    assert response.status_code == 200
+    assert "filename*=utf-8''%D9%81" in response.headers["content-disposition"]
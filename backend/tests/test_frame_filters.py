@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+
+from frame_filters import (
+    ColorStage, ContrastStage, FilterChain, brightness_stage, grayscale_stage, invert_stage, sepia_stage
+)
+
+SEPIA_MATRIX = np.array([
+    [0.393, 0.769, 0.189],
+    [0.349, 0.686, 0.168],
+    [0.272, 0.534, 0.131]
+])
+
+
+# التطبيقات القديمة في ContentLibrary قبل محرك الجداول
+def old_brightness(image, intensity):
+    return np.clip(image * (1 + (intensity - 1)), 0, 255).astype('uint8')
+
+
+def old_contrast(image, intensity):
+    mean = np.mean(image)
+    return np.clip((image - mean) * intensity + mean, 0, 255).astype('uint8')
+
+
+def old_grayscale(image, intensity):
+    gray = np.dot(image[..., :3], [0.299, 0.587, 0.114])
+    gray_rgb = np.stack([gray, gray, gray], axis=-1)
+    return (image * (1 - intensity) + gray_rgb * intensity).astype('uint8')
+
+
+def old_sepia(image, intensity):
+    sepia_img = np.clip(np.dot(image[..., :3], SEPIA_MATRIX.T), 0, 255)
+    return (image * (1 - intensity) + sepia_img * intensity).astype('uint8')
+
+
+def old_invert(image, intensity):
+    return (image * (1 - intensity) + (255 - image) * intensity).astype('uint8')
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(7)
+    return rng.integers(0, 256, size=(48, 64, 3), dtype=np.uint8)
+
+
+def assert_close(actual, expected, tolerance=1):
+    assert actual.dtype == np.uint8 and actual.shape == expected.shape
+    assert np.abs(actual.astype(int) - expected.astype(int)).max() <= tolerance
+
+
+@pytest.mark.parametrize("intensity", [0.0, 0.5, 1.0, 1.7])
+def test_brightness_matches_old_filter_exactly(image, intensity):
+    np.testing.assert_array_equal(brightness_stage(intensity)(image), old_brightness(image, intensity))
+
+
+@pytest.mark.parametrize("intensity", [0.5, 1.0, 1.5])
+def test_contrast_matches_old_filter(image, intensity):
+    assert_close(ContrastStage(intensity)(image), old_contrast(image, intensity))
+
+
+@pytest.mark.parametrize("stage, old", [
+    (grayscale_stage, old_grayscale),
+    (sepia_stage, old_sepia),
+    (invert_stage, old_invert),
+])
+@pytest.mark.parametrize("intensity", [0.0, 0.3, 1.0])
+def test_color_stages_match_old_filters(image, stage, old, intensity):
+    assert_close(stage(intensity)(image), old(image, intensity))
+
+
+def test_fused_chain_matches_sequential_old_filters(image):
+    chain = FilterChain([brightness_stage(1.2), sepia_stage(0.8), invert_stage(0.4)])
+    assert len(chain.stages) == 1
+    expected = old_invert(old_sepia(old_brightness(image, 1.2), 0.8), 0.4)
+    assert_close(chain(image), expected, tolerance=2)
+
+
+def test_two_matrices_are_not_fused(image):
+    chain = FilterChain([grayscale_stage(1.0), sepia_stage(1.0)])
+    assert len(chain.stages) == 2
+    assert_close(chain(image), old_sepia(old_grayscale(image, 1.0), 1.0), tolerance=2)
+
+
+def test_contrast_breaks_fusion():
+    chain = FilterChain([brightness_stage(1.1), ContrastStage(1.2), brightness_stage(0.9)])
+    assert [type(stage) for stage in chain.stages] == [ColorStage, ContrastStage, ColorStage]
+
+
+def test_buffers_follow_frame_size(image):
+    stage = sepia_stage(1.0)
+    first = stage(image).copy()
+    small = stage(image[:10, :10])
+    assert small.shape == (10, 10, 3)
+    np.testing.assert_array_equal(stage(image), first)
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    from pipeline_processor import PipelineProcessor
+    return PipelineProcessor(str(tmp_path / "uploads"), str(tmp_path / "processed"))
+
+
+def test_merge_filter_operations_fuses_adjacent_filters(pipeline):
+    operations = [
+        {"op": "trim", "params": {"start_time": 0, "end_time": 5}},
+        {"op": "filter", "params": {"filter_type": "brightness", "intensity": 1.2}},
+        {"op": "filter", "params": {"chain": [["sepia", 0.5], ["invert", 0.1]]}},
+        {"op": "filter", "params": {"filter_type": "grayscale"}},
+        {"op": "resize", "params": {"width": 640, "height": 360}},
+        {"op": "filter", "params": {"filter_type": "blur", "intensity": 0.2}},
+    ]
+    merged = pipeline._merge_filter_operations(operations)
+    assert [operation["op"] for operation in merged] == ["trim", "filter", "resize", "filter"]
+    assert merged[1]["params"] == {"chain": [
+        ("brightness", 1.2), ("sepia", 0.5), ("invert", 0.1), ("grayscale", 1.0)
+    ]}
+    assert merged[3]["params"] == {"chain": [("blur", 0.2)]}
+    # الطلب الأصلي لا يتغير
+    assert operations[1]["params"] == {"filter_type": "brightness", "intensity": 1.2}
+    assert operations[2]["params"]["chain"] == [["sepia", 0.5], ["invert", 0.1]]
+
+
+def test_merge_filter_operations_without_filters(pipeline):
+    operations = [{"op": "trim", "params": {"start_time": 0, "end_time": 1}}, {"op": "remove_audio"}]
+    assert pipeline._merge_filter_operations(operations) == operations
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import uuid
+
+import pytest
+
+import job_manager
+from job_manager import CancelBoard, JobCancelled
+
+
+def test_added_ids_are_members():
+    board = CancelBoard(size=4)
+    first, second = uuid.uuid4().hex, uuid.uuid4().hex
+    board.add(first)
+    assert first in board
+    assert second not in board
+    board.add(second)
+    assert first in board and second in board
+
+
+def test_oldest_ids_are_overwritten():
+    board = CancelBoard(size=3)
+    ids = [uuid.uuid4().hex for _ in range(4)]
+    for job_id in ids:
+        board.add(job_id)
+    assert ids[0] not in board
+    assert all(job_id in board for job_id in ids[1:])
+
+
+def test_short_ids_do_not_match_prefixes():
+    board = CancelBoard(size=2)
+    board.add("abc")
+    assert "abc" in board
+    assert "ab" not in board
+    assert "abcd" not in board
+
+
+def _child_sees(board, job_id, results):
+    results.put(job_id in board)
+
+
+def test_board_is_shared_with_child_processes():
+    context = multiprocessing.get_context("fork")
+    board = CancelBoard(size=4)
+    job_id = uuid.uuid4().hex
+    results = context.Queue()
+    board.add(job_id)
+    process = context.Process(target=_child_sees, args=(board, job_id, results))
+    process.start()
+    process.join(10)
+    assert results.get(timeout=5) is True
+
+
+def test_cancel_signal_ignored_for_other_jobs(monkeypatch):
+    board = CancelBoard(size=4)
+    cancelled, running = uuid.uuid4().hex, uuid.uuid4().hex
+    board.add(cancelled)
+    monkeypatch.setattr(job_manager, "_cancel_board", board)
+
+    monkeypatch.setattr(job_manager, "_current_job", running)
+    job_manager._handle_cancel(None, None)
+
+    monkeypatch.setattr(job_manager, "_current_job", None)
+    job_manager._handle_cancel(None, None)
+
+    monkeypatch.setattr(job_manager, "_current_job", cancelled)
+    with pytest.raises(JobCancelled):
+        job_manager._handle_cancel(None, None)
+
+
+def test_cancel_stops_segmented_export_promptly(tmp_path, monkeypatch):
+    import signal
+    import subprocess
+    import time
+
+    import export_processor
+    from export_processor import ExportProcessor
+    from job_manager import JobTimeout
+
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    (uploads / "input.mp4").write_bytes(b"source")
+    (tmp_path / "processed").mkdir()
+    processor = ExportProcessor(str(uploads), str(tmp_path / "processed"))
+    info = {
+        "duration": 240.0, "width": 1280, "height": 720, "has_audio": True,
+        "keyframes": [float(k) for k in range(0, 240, 2)],
+    }
+    monkeypatch.setattr(processor.media_cache, "get", lambda path: info)
+
+    children = []
+
+    def slow_ffmpeg(args, **kwargs):
+        process = subprocess.Popen(["sleep", "5"])
+        children.append(process.pid)
+        process.wait()
+
+    monkeypatch.setattr(export_processor, "run_ffmpeg", slow_ffmpeg)
+    monkeypatch.setattr(job_manager, "_current_job", "job")
+    previous = signal.signal(signal.SIGALRM, job_manager._handle_deadline)
+    started = time.monotonic()
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 0.5)
+        with pytest.raises(JobTimeout):
+            processor.export_video("input.mp4", "out.mp4", segmented=True, segments=4)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+    assert time.monotonic() - started < 2
+    assert len(children) == 5
+    for pid in children:
+        with pytest.raises(OSError):
+            os.kill(pid, 0)
+    assert not (tmp_path / "processed" / "out.mp4").exists()
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import proxy_manager
+from proxy_manager import ProxyManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    manager = ProxyManager(str(uploads))
+    info = {"has_video": True, "width": 1920, "height": 1080, "duration": 3.0}
+    monkeypatch.setattr(manager.media_cache, "get", lambda path: info)
+
+    def fake_run_ffmpeg(args, **kwargs):
+        source = args[args.index("-i") + 1]
+        args[-1].write_bytes(b"proxy of " + source.name.encode())
+
+    monkeypatch.setattr(proxy_manager, "run_ffmpeg", fake_run_ffmpeg)
+    return manager
+
+
+def test_same_stem_different_extensions_do_not_collide(manager):
+    for name in ("clip.mov", "clip.mp4"):
+        (manager.upload_dir / name).write_bytes(name.encode())
+
+    mov = manager.generate_proxy("clip.mov")
+    mp4 = manager.generate_proxy("clip.mp4")
+
+    assert mov["success"] and mp4["success"]
+    assert mov["proxy"] != mp4["proxy"]
+    assert (manager.upload_dir / mov["proxy"]).read_bytes() == b"proxy of clip.mov"
+    assert (manager.upload_dir / mp4["proxy"]).read_bytes() == b"proxy of clip.mp4"
+    assert manager.proxy_filename("clip.mov") == mov["proxy"]
+    assert manager.proxy_filename("clip.mp4") == mp4["proxy"]
+    assert manager.original_for(mov["proxy"]) == "clip.mov"
+    assert manager.original_for(mp4["proxy"]) == "clip.mp4"
+
+
+def test_stale_proxy_is_ignored(manager):
+    original = manager.upload_dir / "clip.mp4"
+    original.write_bytes(b"v1")
+    proxy = manager.generate_proxy("clip.mp4")["proxy"]
+    proxy_path = manager.upload_dir / proxy
+    os.utime(proxy_path, (0, 0))
+    assert manager.proxy_filename("clip.mp4") is None
+
+
+def test_original_names_pass_through(manager):
+    assert manager.original_for("clip.mp4") == "clip.mp4"
+    assert manager.get_proxy(".proxies/clip.mp4.mp4") is None
@@ -0,0 +1,103 @@
+import pytest
+
+from render_cache import RenderCache
+
+
+class FakeProcessor:
+    def trim(self, input_filename: str, output_filename: str, start: float = 0, mode: str = "accurate"):
+        pass
+
+    def concat(self, input_filenames: list, output_filename: str):
+        pass
+
+    def overlay(self, input_filename: str, layers: list, output_filename: str):
+        pass
+
+    def info(self, input_filename: str):
+        pass
+
+
+@pytest.fixture
+def cache(tmp_path):
+    uploads = tmp_path / "uploads"
+    processed = tmp_path / "processed"
+    uploads.mkdir()
+    processed.mkdir()
+    (uploads / "a.mp4").write_bytes(b"same content")
+    (uploads / "copy_of_a.mp4").write_bytes(b"same content")
+    (uploads / "b.mp4").write_bytes(b"other content")
+    (processed / "rendered.mp4").write_bytes(b"same content")
+    (uploads / "logo.png").write_bytes(b"png")
+    return RenderCache(str(uploads), str(processed))
+
+
+def key(cache, method, *args, **kwargs):
+    return cache.make_key(FakeProcessor, method, args, kwargs)
+
+
+def test_positional_keyword_and_default_arguments_share_a_key(cache):
+    first, output = key(cache, "trim", "a.mp4", "out.mp4")
+    assert output == "out.mp4"
+    assert key(cache, "trim", input_filename="a.mp4", output_filename="out.mp4", start=0)[0] == first
+    assert key(cache, "trim", "a.mp4", "out.mp4", 0, "accurate")[0] == first
+
+
+def test_inputs_are_keyed_by_content_not_name(cache):
+    first = key(cache, "trim", "a.mp4", "out.mp4")[0]
+    assert key(cache, "trim", "copy_of_a.mp4", "out.mp4")[0] == first
+    assert key(cache, "trim", "rendered.mp4", "out.mp4")[0] == first
+    assert key(cache, "trim", "b.mp4", "out.mp4")[0] != first
+
+
+def test_output_name_ignored_but_suffix_counts(cache):
+    first = key(cache, "trim", "a.mp4", "out.mp4")[0]
+    assert key(cache, "trim", "a.mp4", "another.MP4")[0] == first
+    assert key(cache, "trim", "a.mp4", "out.webm")[0] != first
+
+
+def test_parameters_and_operation_change_the_key(cache):
+    first = key(cache, "trim", "a.mp4", "out.mp4")[0]
+    assert key(cache, "trim", "a.mp4", "out.mp4", start=1)[0] != first
+    assert key(cache, "trim", "a.mp4", "out.mp4", mode="copy")[0] != first
+    assert key(cache, "concat", ["a.mp4"], "out.mp4")[0] != first
+
+
+def test_filename_lists_are_hashed_in_order(cache):
+    first = key(cache, "concat", ["a.mp4", "b.mp4"], "out.mp4")[0]
+    assert key(cache, "concat", ["copy_of_a.mp4", "b.mp4"], "out.mp4")[0] == first
+    assert key(cache, "concat", ["b.mp4", "a.mp4"], "out.mp4")[0] != first
+
+
+def test_nested_filenames_are_hashed(cache):
+    (cache.upload_dir / "logo_copy.png").write_bytes(b"png")
+    first = key(cache, "overlay", "a.mp4", [{"sticker_filename": "logo.png", "x": 1}], "out.mp4")[0]
+    same = key(cache, "overlay", "a.mp4", [{"sticker_filename": "logo_copy.png", "x": 1}], "out.mp4")[0]
+    assert same == first
+
+
+def test_hash_follows_file_changes(cache):
+    first = key(cache, "trim", "b.mp4", "out.mp4")[0]
+    path = cache.upload_dir / "b.mp4"
+    path.write_bytes(b"edited content!")
+    assert key(cache, "trim", "b.mp4", "out.mp4")[0] != first
+
+
+def test_operations_without_output_are_not_cached(cache):
+    assert key(cache, "info", "a.mp4") == (None, None)
+
+
+@pytest.mark.parametrize("args", [
+    ("missing.mp4", "out.mp4"),
+    ("", "out.mp4"),
+])
+def test_missing_input_raises_processor_error(cache, args):
+    with pytest.raises(ValueError) as error:
+        key(cache, "trim", *args)
+    assert str(error.value) == "الملف غير موجود"
+
+
+def test_missing_nested_sidecar_raises_processor_error(cache):
+    with pytest.raises(ValueError) as error:
+        key(cache, "overlay", "a.mp4", [{"subtitle_filename": "missing.srt"}], "out.mp4")
+    assert str(error.value) == "الملف غير موجود"
+    assert str(cache.upload_dir) not in str(error.value)
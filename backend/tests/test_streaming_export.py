@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from export_processor import ExportProcessor
+
+
+@pytest.fixture
+def processed(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "PROCESSED_DIR", tmp_path)
+    (tmp_path / "plain.mp4").write_bytes(b"plain")
+    (tmp_path / "notes.txt").write_bytes(b"notes")
+    show = tmp_path / "show"
+    (show / "720p").mkdir(parents=True)
+    (show / "master.m3u8").write_text("#EXTM3U\n")
+    (show / "720p" / "index.m3u8").write_text("#EXTM3U\n")
+    (show / "720p" / "segment_00000.ts").write_bytes(b"ts")
+    (show / "secret.json").write_text("{}")
+    pending = tmp_path / ".show-abc"
+    pending.mkdir()
+    (pending / "master.m3u8").write_text("#EXTM3U\n")
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "clip.mp4").write_bytes(b"clip")
+    return tmp_path
+
+
+@pytest.fixture
+def client(processed):
+    return TestClient(main.app)
+
+
+@pytest.mark.parametrize("path", ["show/master.m3u8", "show/720p/index.m3u8", "show/720p/segment_00000.ts"])
+def test_stream_serves_published_streaming_files(client, path):
+    assert client.get(f"/api/stream/{path}").status_code == 200
+
+
+@pytest.mark.parametrize("path", [
+    "plain.mp4",
+    "notes.txt",
+    "show/secret.json",
+    ".show-abc/master.m3u8",
+    "other/clip.mp4",
+    "show/missing.ts",
+    "show/../plain.mp4",
+])
+def test_stream_rejects_everything_else(client, path):
+    assert client.get(f"/api/stream/{path}").status_code == 404
+
+
+def test_publish_directory_replaces_old_tree(tmp_path):
+    processor = ExportProcessor(str(tmp_path / "uploads"), str(tmp_path))
+    output_dir = tmp_path / "show"
+    output_dir.mkdir()
+    (output_dir / "old.ts").write_bytes(b"old")
+    new_dir = tmp_path / ".show-new"
+    new_dir.mkdir()
+    (new_dir / "new.ts").write_bytes(b"new")
+
+    processor._publish_directory(new_dir, output_dir)
+
+    assert [path.name for path in output_dir.iterdir()] == ["new.ts"]
+    assert sorted(path.name for path in tmp_path.iterdir() if path.is_dir()) == ["show"]
+
+
+def test_publish_directory_restores_old_tree_on_failure(tmp_path):
+    processor = ExportProcessor(str(tmp_path / "uploads"), str(tmp_path))
+    output_dir = tmp_path / "show"
+    output_dir.mkdir()
+    (output_dir / "old.ts").write_bytes(b"old")
+    missing = tmp_path / ".show-missing"
+
+    with pytest.raises(FileNotFoundError):
+        processor._publish_directory(missing, output_dir)
+    assert (output_dir / "old.ts").read_bytes() == b"old"
@@ -0,0 +1,61 @@
+import numpy as np
+
+from subtitle_compositor import SubtitleCompositor
+from text_shaping import shape_text
+
+
+def cues(n, duration=1.0, text="hello world"):
+    return [{"start": i * duration, "end": (i + 1) * duration, "text": f"{text} {i}"} for i in range(n)]
+
+
+def test_active_cues_with_overlap():
+    compositor = SubtitleCompositor(
+        [{"start": 0, "end": 10, "text": "long"}, {"start": 2, "end": 3, "text": "short"}],
+        (320, 240),
+    )
+    assert compositor.active_cues(2.5) == [0, 1]
+    assert compositor.active_cues(5) == [0]
+    assert compositor.active_cues(10) == []
+
+
+def test_sprites_evicted_after_cue_end():
+    compositor = SubtitleCompositor(cues(200, duration=0.5), (320, 240))
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for step in range(0, 200 * 5):
+        compositor.composite(frame, step * 0.1)
+        assert len(compositor._sprites) <= 1
+    compositor.composite(frame, 1000)
+    assert compositor._sprites == {}
+
+
+def test_composite_draws_only_while_active():
+    compositor = SubtitleCompositor([{"start": 1, "end": 2, "text": "HELLO"}], (320, 240))
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    assert compositor.composite(frame, 0.5) is frame
+    drawn = compositor.composite(frame, 1.5)
+    assert drawn.any()
+    assert not frame.any()
+
+
+def test_wrap_respects_width_and_keeps_words():
+    compositor = SubtitleCompositor([], (200, 100), fontsize=20, margin=20)
+    text = "one two three four five six seven eight nine ten"
+    lines = compositor._wrap(text)
+    assert len(lines) > 1
+    assert " ".join(lines).split() == text.split()
+    for line in lines:
+        if " " in line:
+            assert compositor.font.getlength(line) <= compositor.max_width + 1
+
+
+def test_wrap_shapes_only_final_lines():
+    calls = []
+
+    def shaper(text):
+        calls.append(text)
+        return shape_text(text)
+
+    compositor = SubtitleCompositor([], (200, 100), fontsize=20, shape_text=shaper, margin=20)
+    lines = compositor._wrap("مرحبا بكم في محرر الفيديو العربي الجديد\nسطر ثان")
+    assert len(calls) == len(lines)
+    assert lines == [shape_text(line) for line in calls]
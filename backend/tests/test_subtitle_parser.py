@@ -0,0 +1,97 @@
+import pytest
+
+from subtitle_parser import iter_cues, iter_subtitle_file, parse_timestamp
+
+
+def parse(text, format=None):
+    return list(iter_cues(text.splitlines(keepends=True), format))
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("00:00:01,500", 1.5),
+    ("01:02:03.250", 3723.25),
+    ("00:01.500", 1.5),
+    ("0:00:01.50", 1.5),
+    ("  00:00:02,000 ", 2.0),
+    ("90", 90.0),
+])
+def test_parse_timestamp(value, expected):
+    assert parse_timestamp(value) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("value", ["00:00:01,5x0", "1:2:3.4.5", "abc"])
+def test_parse_timestamp_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_srt_basic_with_crlf_and_no_trailing_blank():
+    cues = parse("1\r\n00:00:01,000 --> 00:00:02,000\r\nHello\r\nWorld\r\n\r\n2\r\n00:00:03,000 --> 00:00:04,500\r\nBye")
+    assert [(c["index"], c["start"], c["end"], c["text"]) for c in cues] == [
+        (1, 1.0, 2.0, "Hello\nWorld"),
+        (2, 3.0, 4.5, "Bye"),
+    ]
+    assert cues[1]["duration"] == pytest.approx(1.5)
+
+
+def test_srt_cues_without_blank_separator():
+    cues = parse("1\n00:00:01,000 --> 00:00:02,000\nFirst\n2\n00:00:02,000 --> 00:00:03,000\nSecond\n")
+    assert [(c["index"], c["text"]) for c in cues] == [(1, "First"), (2, "Second")]
+
+
+def test_srt_bom_and_missing_index():
+    cues = parse("﻿00:00:01,000 --> 00:00:02,000\nNo index\n")
+    assert cues[0]["index"] == 1 and cues[0]["text"] == "No index"
+
+
+def test_srt_invalid_timing_line_is_text():
+    cues = parse("1\n00:00:01,000 --> 00:00:02,000\nuse --> arrows\n")
+    assert cues[0]["text"] == "use --> arrows"
+
+
+def test_vtt_strips_tags_and_skips_blocks():
+    cues = parse(
+        "WEBVTT\n\nNOTE this is\na comment\n\nSTYLE\n::cue { color: red }\n\n"
+        "intro\n00:01.000 --> 00:02.000 align:start position:10%\n<v Bob>Hi <b>there</b></v>\n\n"
+        "00:00:03.000 --> 00:00:04.000\n<c.yellow>مرحبا</c>\n"
+    )
+    assert [(c["start"], c["end"], c["text"]) for c in cues] == [
+        (1.0, 2.0, "Hi there"),
+        (3.0, 4.0, "مرحبا"),
+    ]
+
+
+def test_ass_dialogue_with_format_and_overrides():
+    cues = parse(
+        "[Script Info]\nScriptType: v4.00+\n\n[V4+ Styles]\nFormat: Name, Fontname\n\n"
+        "[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+        "Dialogue: 0,0:00:01.00,0:00:02.50,Default,,0,0,0,,{\\an8}Hello, world\\NSecond\\hline\n"
+        "Comment: 0,0:00:03.00,0:00:04.00,Default,,0,0,0,,ignored\n"
+        "Dialogue: broken\n"
+    )
+    assert len(cues) == 1
+    assert cues[0]["start"] == 1.0 and cues[0]["end"] == 2.5
+    assert cues[0]["text"] == "Hello, world\nSecond line"
+
+
+def test_ass_custom_field_order():
+    cues = parse(
+        "[Events]\nFormat: Start, End, Text\nDialogue: 0:00:05.00,0:00:06.00,a, b, c\n"
+    )
+    assert cues[0]["start"] == 5.0 and cues[0]["text"] == "a, b, c"
+
+
+def test_explicit_format_overrides_detection():
+    cues = parse("00:00:01.000 --> 00:00:02.000\n<i>x</i>\n", format="vtt")
+    assert cues[0]["text"] == "x"
+
+
+def test_iter_subtitle_file_streams_from_disk(tmp_path):
+    path = tmp_path / "subs.srt"
+    path.write_bytes("﻿1\n00:00:01,000 --> 00:00:02,000\nمرحبا\n".encode("utf-8"))
+    assert [c["text"] for c in iter_subtitle_file(path)] == ["مرحبا"]
+
+
+def test_empty_input():
+    assert parse("") == []
+    assert parse("\n\n") == []
@@ -0,0 +1,30 @@
+from text_shaping import is_arabic, shape_cues, shape_text, shape_texts
+
+
+def test_is_arabic():
+    assert is_arabic("مرحبا")
+    assert is_arabic("hello ﻣﺮﺣﺒﺎ")
+    assert not is_arabic("hello")
+
+
+def test_latin_text_unchanged():
+    assert shape_text("hello world") == "hello world"
+
+
+def test_arabic_text_reshaped_for_display():
+    shaped = shape_text("مرحبا")
+    assert shaped != "مرحبا"
+    assert is_arabic(shaped)
+
+
+def test_shape_texts_keeps_order_and_duplicates():
+    texts = ["مرحبا", "hi", "مرحبا"]
+    assert shape_texts(texts) == [shape_text(text) for text in texts]
+
+
+def test_shape_cues_copies_cues():
+    cues = [{"start": 0, "end": 1, "text": "مرحبا"}]
+    shaped = shape_cues(cues)
+    assert shaped[0]["text"] == shape_text("مرحبا")
+    assert cues[0]["text"] == "مرحبا"
+    assert shaped[0]["start"] == 0 and shaped[0]["end"] == 1
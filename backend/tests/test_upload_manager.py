@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+import upload_manager
+from upload_manager import UploadError, UploadManager, _merge_ranges
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def body(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.mark.parametrize("ranges, expected", [
+    ([], []),
+    ([[0, 10]], [[0, 10]]),
+    ([[10, 20], [0, 10]], [[0, 20]]),
+    ([[0, 10], [5, 15]], [[0, 15]]),
+    ([[0, 10], [20, 30]], [[0, 10], [20, 30]]),
+    ([[20, 30], [0, 10], [10, 20]], [[0, 30]]),
+    ([[0, 30], [5, 10]], [[0, 30]]),
+])
+def test_merge_ranges(ranges, expected):
+    assert _merge_ranges(ranges) == expected
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return UploadManager(str(tmp_path))
+
+
+def test_sequential_upload_hashes_while_streaming(manager):
+    data = os.urandom(300_000)
+
+    async def scenario():
+        session = await manager.create_session("a.mp4", len(data), hashlib.sha256(data).hexdigest())
+        sid = session["session_id"]
+        status = await manager.write_chunk(sid, 0, body(data[:100_000], data[100_000:200_000]))
+        assert status["offset"] == 200_000
+        meta = await manager._load(sid)
+        assert meta["hashed_offset"] == 200_000
+        await manager.write_chunk(sid, 200_000, body(data[200_000:]))
+        return await manager.finalize(sid)
+
+    result = run(scenario())
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    with open(result["path"], "rb") as f:
+        assert f.read() == data
+
+
+def test_out_of_order_chunks_catch_up_from_disk(manager):
+    data = os.urandom(90_000)
+
+    async def scenario():
+        sid = (await manager.create_session("a.bin", len(data)))["session_id"]
+        await manager.write_chunk(sid, 60_000, body(data[60_000:]))
+        await manager.write_chunk(sid, 30_000, body(data[30_000:60_000]))
+        assert (await manager._load(sid))["hashed_offset"] == 0
+        await manager.write_chunk(sid, 0, body(data[:30_000]))
+        assert (await manager._load(sid))["hashed_offset"] == len(data)
+        return await manager.finalize(sid)
+
+    assert run(scenario())["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_duplicate_chunk_at_hashed_offset_is_hashed_once(manager):
+    data = os.urandom(40_000)
+
+    async def scenario():
+        sid = (await manager.create_session("a.bin", len(data)))["session_id"]
+        await asyncio.gather(
+            manager.write_chunk(sid, 0, body(data[:20_000])),
+            manager.write_chunk(sid, 0, body(data[:20_000])),
+        )
+        await manager.write_chunk(sid, 20_000, body(data[20_000:]))
+        return await manager.finalize(sid)
+
+    assert run(scenario())["sha256"] == hashlib.sha256(data).hexdigest()
+
+
+def test_hash_mismatch_rejected(manager):
+    async def scenario():
+        sid = (await manager.create_session("a.bin", 4, "0" * 64))["session_id"]
+        await manager.write_chunk(sid, 0, body(b"abcd"))
+        await manager.finalize(sid)
+
+    with pytest.raises(UploadError) as error:
+        run(scenario())
+    assert error.value.status_code == 422
+
+
+def test_chunk_past_end_rejected(manager):
+    async def scenario():
+        sid = (await manager.create_session("a.bin", 4))["session_id"]
+        await manager.write_chunk(sid, 2, body(b"abc"))
+
+    with pytest.raises(UploadError) as error:
+        run(scenario())
+    assert error.value.status_code == 413
+
+
+def test_incomplete_finalize_rejected(manager):
+    async def scenario():
+        sid = (await manager.create_session("a.bin", 10))["session_id"]
+        await manager.write_chunk(sid, 0, body(b"abc"))
+        await manager.finalize(sid)
+
+    with pytest.raises(UploadError) as error:
+        run(scenario())
+    assert error.value.status_code == 409
+
+
+def test_write_after_finalize_is_upload_error(manager):
+    async def scenario():
+        sid = (await manager.create_session("a.bin", 3))["session_id"]
+        await manager.write_chunk(sid, 0, body(b"abc"))
+        session = await manager._load(sid)
+        await manager.finalize(sid)
+        # كتابة بدأت قبل الإنهاء وفتحت الملف بعده
+        manager._load = lambda _sid: _return(session)
+        await manager.write_chunk(sid, 0, body(b"abc"))
+
+    async def _return(value):
+        return value
+
+    with pytest.raises(UploadError) as error:
+        run(scenario())
+    assert error.value.status_code == 404
+
+
+def test_expired_sessions_are_removed(manager, monkeypatch):
+    async def scenario():
+        old = (await manager.create_session("old.bin", 10))["session_id"]
+        fresh = (await manager.create_session("new.bin", 10))["session_id"]
+        past = time.time() - upload_manager.SESSION_TTL - 10
+        for path in (manager._meta_path(old), manager._data_path(old)):
+            os.utime(path, (past, past))
+        removed = await manager.cleanup_expired(force=True)
+        return old, fresh, removed
+
+    old, fresh, removed = run(scenario())
+    assert removed == 1
+    assert not manager._meta_path(old).exists()
+    assert not manager._data_path(old).exists()
+    assert manager._meta_path(fresh).exists()
@@ -0,0 +1,51 @@
+import os
+from pathlib import Path
+
+import pytest
+
+import workspace
+from workspace import Workspace, atomic_output, disk_scratch
+
+
+def test_disk_scratch_is_outside_output_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "DISK_SCRATCH_ROOT", None)
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    with disk_scratch(processed) as scratch:
+        scratch = Path(scratch)
+        assert scratch.parent == tmp_path / ".scratch"
+        assert processed not in scratch.parents
+        (scratch / "segment.ts").write_bytes(b"x")
+    assert not scratch.exists()
+    assert list(processed.iterdir()) == []
+
+
+def test_disk_scratch_root_override(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "DISK_SCRATCH_ROOT", str(tmp_path / "big"))
+    with disk_scratch(tmp_path / "processed") as scratch:
+        assert Path(scratch).parent == tmp_path / "big"
+
+
+def test_workspaces_are_isolated(tmp_path):
+    with Workspace(root=str(tmp_path)) as first, Workspace(root=str(tmp_path)) as second:
+        assert first.path != second.path
+        assert first.file("../escape.wav").parent == first.path
+    assert not first.path.exists() and not second.path.exists()
+
+
+def test_atomic_output_renames_on_success(tmp_path):
+    target = tmp_path / "out.mp4"
+    with atomic_output(target) as tmp_output:
+        assert tmp_output.parent == tmp_path and tmp_output.suffix == ".mp4"
+        tmp_output.write_bytes(b"done")
+    assert target.read_bytes() == b"done"
+    assert os.listdir(tmp_path) == ["out.mp4"]
+
+
+def test_atomic_output_removes_partial_on_failure(tmp_path):
+    target = tmp_path / "out.mp4"
+    with pytest.raises(RuntimeError):
+        with atomic_output(target) as tmp_output:
+            tmp_output.write_bytes(b"half")
+            raise RuntimeError("boom")
+    assert os.listdir(tmp_path) == []
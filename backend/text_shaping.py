@@ -0,0 +1,45 @@
+from arabic_reshaper import reshape
+from bidi.algorithm import get_display
+from functools import lru_cache
+import os
+import re
+
+SHAPING_CACHE_SIZE = int(os.environ.get("SHAPING_CACHE_SIZE", 16384))
+
+# العربية وملحقاتها وأشكال العرض (FB50-FDFF و FE70-FEFF)
+ARABIC_PATTERN = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+
+
+def is_arabic(text: str) -> bool:
+    """التحقق إذا كان النص يحتوي على أحرف عربية"""
+    return ARABIC_PATTERN.search(text) is not None
+
+
+@lru_cache(maxsize=SHAPING_CACHE_SIZE)
+def shape_text(text: str) -> str:
+    """تشكيل الحروف العربية وترتيبها للعرض، محفوظ حسب النص"""
+    if not is_arabic(text):
+        return text
+    try:
+        return get_display(reshape(text))
+    except Exception:
+        return text
+
+
+def shape_texts(texts) -> list:
+    """تشكيل قائمة نصوص دفعة واحدة؛ النصوص المكررة تُشكل مرة واحدة"""
+    shaped = {}
+    result = []
+    for text in texts:
+        value = shaped.get(text)
+        if value is None:
+            value = shaped[text] = shape_text(text)
+        result.append(value)
+    return result
+
+
+def shape_cues(subtitles: list) -> list:
+    """نسخة من قائمة الترجمات بنصوص جاهزة للعرض"""
+    shaped = shape_texts(subtitle["text"] for subtitle in subtitles)
+    return [dict(subtitle, text=text) for subtitle, text in zip(subtitles, shaped)]
+
@@ -0,0 +1,158 @@
+from pathlib import Path
+import hashlib
+import json
+import math
+import os
+import shutil
+import tempfile
+
+from ffmpeg_utils import run_ffmpeg
+from media_info import get_media_cache
+from render_cache import RenderCache
+
+THUMBNAIL_DIR_NAME = ".thumbnails"
+MAX_TILES = 100000
+
+
+class ThumbnailProcessor:
+    """صور مصغرة للخط الزمني مجمعة في شبكات (sprite sheets) مع فهرس JSON
+
+    كل النتائج تُحفظ حسب بصمة محتوى الملف والمعاملات، فيُعاد استخدامها مباشرة.
+    """
+
+    def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
+        self.upload_dir = Path(upload_dir)
+        self.processed_dir = Path(processed_dir)
+        self.thumbnail_dir = self.processed_dir / THUMBNAIL_DIR_NAME
+        self.thumbnail_dir.mkdir(parents=True, exist_ok=True)
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
+        self.render_cache = RenderCache(upload_dir, processed_dir)
+
+    def _resolve(self, filename: str) -> Path:
+        path = self.upload_dir / filename
+        if not path.exists():
+            path = self.processed_dir / filename
+        if not path.exists():
+            raise FileNotFoundError(f"الملف {filename} غير موجود")
+        return path
+
+    def sheet_path(self, key: str, sheet: str) -> Path:
+        """مسار صورة شبكة داخل مجلد نتيجة محفوظة"""
+        return self.thumbnail_dir / Path(key).name / Path(sheet).name
+
+    def create_sprite_sheet(
+        self,
+        filename: str,
+        interval: float = 5.0,
+        tile_width: int = 160,
+        tile_height: int = 90,
+        columns: int = 10,
+        rows: int = 10,
+        keyframes_only: bool = True
+    ):
+        """إنشاء شبكات الصور المصغرة في تمريرة فك ترميز واحدة
+
+        interval: الفاصل بالثواني بين الصور؛ 0 يعني صورة لكل إطار مفتاحي (شريط الإطارات المفتاحية).
+        keyframes_only: فك ترميز الإطارات المفتاحية فقط (-skip_frame nokey) وأخذ أقرب إطار
+        مفتاحي سابق لكل نقطة زمنية، وهو أسرع بكثير من فك ترميز كل الإطارات.
+        """
+        try:
+            if tile_width <= 0 or tile_height <= 0 or columns <= 0 or rows <= 0 or interval < 0:
+                return {"success": False, "error": "معاملات الصور المصغرة غير صالحة"}
+
+            input_path = self._resolve(filename)
+            params = {
+                "interval": interval,
+                "tile_width": tile_width,
+                "tile_height": tile_height,
+                "columns": columns,
+                "rows": rows,
+                "keyframes_only": keyframes_only or interval == 0
+            }
+            payload = json.dumps(
+                {"hash": self.render_cache.file_hash(input_path), "params": params}, sort_keys=True
+            )
+            key = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+            index_path = self.thumbnail_dir / key / "index.json"
+            if index_path.exists():
+                index = json.loads(index_path.read_text(encoding="utf-8"))
+                return {"success": True, "cached": True, **index}
+
+            info = self.media_cache.get(input_path)
+            if not info.get("has_video"):
+                return {"success": False, "error": "الملف لا يحتوي على فيديو"}
+            duration = info.get("duration") or 0
+
+            if interval == 0:
+                times = list(info.get("keyframes") or [0.0])
+            else:
+                times = [i * interval for i in range(max(1, math.ceil(duration / interval)))]
+            times = times[:MAX_TILES]
+
+            filters = []
+            if interval > 0:
+                filters.append(f"fps=1/{interval}")
+            filters += [
+                f"scale={tile_width}:{tile_height}:force_original_aspect_ratio=decrease",
+                f"pad={tile_width}:{tile_height}:(ow-iw)/2:(oh-ih)/2",
+                f"tile={columns}x{rows}"
+            ]
+
+            tmp_dir = Path(tempfile.mkdtemp(prefix=".tmp-", dir=self.thumbnail_dir))
+            try:
+                input_args = ["-skip_frame", "nokey"] if params["keyframes_only"] else []
+                run_ffmpeg(
+                    input_args + [
+                        "-i", input_path,
+                        "-map", "0:v:0",
+                        "-an", "-sn",
+                        "-vf", ",".join(filters),
+                        "-vsync", "vfr",
+                        "-frames:v", str(math.ceil(len(times) / (columns * rows))),
+                        "-q:v", "5",
+                        tmp_dir / "sheet_%04d.jpg"
+                    ],
+                    duration=duration,
+                    stage="thumbnails"
+                )
+
+                sheets = sorted(path.name for path in tmp_dir.glob("sheet_*.jpg"))
+                per_sheet = columns * rows
+                times = times[:len(sheets) * per_sheet]
+                index = {
+                    "key": key,
+                    "filename": filename,
+                    "duration": duration,
+                    "count": len(times),
+                    **params,
+                    "sheets": [
+                        {"filename": sheet, "url": f"/api/thumbnails/{key}/{sheet}"}
+                        for sheet in sheets
+                    ],
+                    "thumbnails": [
+                        {
+                            "time": round(t, 3),
+                            "sheet": i // per_sheet,
+                            "x": (i % per_sheet) % columns * tile_width,
+                            "y": (i % per_sheet) // columns * tile_height,
+                            "width": tile_width,
+                            "height": tile_height
+                        }
+                        for i, t in enumerate(times)
+                    ]
+                }
+                (tmp_dir / "index.json").write_text(json.dumps(index), encoding="utf-8")
+
+                try:
+                    os.rename(tmp_dir, self.thumbnail_dir / key)
+                except OSError:
+                    # طلب آخر أنشأ نفس النتيجة أولاً
+                    shutil.rmtree(tmp_dir, ignore_errors=True)
+            except BaseException:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+            return {"success": True, "cached": False, **index}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
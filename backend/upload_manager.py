@@ -0,0 +1,295 @@
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+
+import aiofiles
+import aiofiles.os
+
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", 10 * 1024 ** 3))
+CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+# الجلسات التي لم تُكتب ولم تُحدّث خلال هذه المدة تُحذف مع ملفها الجزئي
+SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", 24 * 3600))
+CLEANUP_INTERVAL = 600
+
+
+class UploadError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _merge_ranges(ranges: list) -> list:
+    """دمج المدى المستلمة المتداخلة أو المتجاورة"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class UploadManager:
+    """رفع مجزأ قابل للاستئناف: جلسة، ثم أجزاء بإزاحات، ثم إنهاء"""
+
+    def __init__(self, upload_dir: str = "../uploads"):
+        self.upload_dir = Path(upload_dir)
+        self.sessions_dir = self.upload_dir / ".sessions"
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+        self._locks = {}
+        # بصمة الجزء المتصل من بداية الملف لكل جلسة (داخل الذاكرة فقط)
+        self._hashers = {}
+        # عدد عمليات الكتابة الجارية لكل جلسة، حتى لا تُنهى جلسة أثناء الكتابة فيها
+        self._writers = {}
+        self._last_cleanup = 0.0
+
+    def _meta_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.json"
+
+    def _data_path(self, session_id: str) -> Path:
+        return self.sessions_dir / f"{session_id}.part"
+
+    def _lock(self, session_id: str) -> asyncio.Lock:
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+
+    async def _load(self, session_id: str) -> dict:
+        try:
+            async with aiofiles.open(self._meta_path(session_id), "r", encoding="utf-8") as f:
+                return json.loads(await f.read())
+        except (FileNotFoundError, ValueError):
+            raise UploadError("جلسة الرفع غير موجودة", 404)
+
+    async def _save(self, session: dict):
+        tmp_path = self._meta_path(session["id"]).with_suffix(".json.tmp")
+        async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+            await f.write(json.dumps(session))
+        await aiofiles.os.replace(tmp_path, self._meta_path(session["id"]))
+
+    async def create_session(self, filename: str, size: int, sha256: str = None) -> dict:
+        """إنشاء جلسة رفع وحجز مساحة الملف"""
+        if size <= 0:
+            raise UploadError("حجم الملف غير صالح")
+        if size > MAX_UPLOAD_SIZE:
+            raise UploadError("حجم الملف يتجاوز الحد المسموح", 413)
+
+        await self.cleanup_expired()
+        session_id = uuid.uuid4().hex
+        session = {
+            "id": session_id,
+            "original_name": filename,
+            "size": size,
+            "expected_sha256": sha256,
+            "ranges": [],
+            "hashed_offset": 0
+        }
+
+        # ملف بحجم كامل حتى يمكن كتابة الأجزاء المتوازية في أماكنها
+        async with aiofiles.open(self._data_path(session_id), "wb") as f:
+            await f.truncate(size)
+        await self._save(session)
+        self._hashers[session_id] = hashlib.sha256()
+
+        return {"session_id": session_id, "chunk_size": CHUNK_SIZE, "size": size}
+
+    def _status(self, session: dict) -> dict:
+        ranges = session["ranges"]
+        offset = ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+        received = sum(end - start for start, end in ranges)
+        return {
+            "session_id": session["id"],
+            "size": session["size"],
+            "offset": offset,
+            "received": received,
+            "ranges": ranges,
+            "complete": offset == session["size"]
+        }
+
+    async def get_status(self, session_id: str) -> dict:
+        """الإزاحة الحالية (نهاية الجزء المتصل من البداية) والمدى المستلمة"""
+        return self._status(await self._load(session_id))
+
+    async def write_chunk(self, session_id: str, offset: int, stream) -> dict:
+        """كتابة جزء عند إزاحة محددة من تيار بايتات غير متزامن
+
+        إذا بدأ الجزء عند نهاية الجزء المحسوبة بصمته تُحدَّث نسخة من البصمة مع كل
+        كتلة مستلمة، فلا يُحتفظ بأي جزء من الجسم في الذاكرة.
+        """
+        session = await self._load(session_id)
+        if offset < 0 or offset >= session["size"]:
+            raise UploadError("إزاحة غير صالحة", 416)
+
+        hasher = self._hashers.get(session_id)
+        hasher = hasher.copy() if hasher is not None and offset == session["hashed_offset"] else None
+
+        position = offset
+        self._writers[session_id] = self._writers.get(session_id, 0) + 1
+        try:
+            async with aiofiles.open(self._data_path(session_id), "r+b") as f:
+                await f.seek(offset)
+                async for data in stream:
+                    if not data:
+                        continue
+                    if position + len(data) > session["size"]:
+                        raise UploadError("الجزء يتجاوز حجم الملف", 413)
+                    await f.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+                    position += len(data)
+        except FileNotFoundError:
+            # الجلسة أُنهيت أو انتهت صلاحيتها أثناء الكتابة
+            raise UploadError("جلسة الرفع غير موجودة", 404)
+        finally:
+            self._writers[session_id] -= 1
+            if not self._writers[session_id]:
+                del self._writers[session_id]
+
+        async with self._lock(session_id):
+            session = await self._load(session_id)
+            session["ranges"] = _merge_ranges(session["ranges"] + [[offset, position]])
+            await self._advance_hash(session, offset, position, hasher)
+            await self._save(session)
+            return self._status(session)
+
+    async def _advance_hash(self, session: dict, offset: int, end: int, hasher):
+        """تحديث البصمة بشكل تزايدي كلما امتد الجزء المتصل من البداية
+
+        hasher: نسخة البصمة التي حُدّثت أثناء استلام الجزء [offset, end)؛ تُعتمد فقط
+        إذا لم يسبقها جزء آخر بدأ من نفس الإزاحة.
+        """
+        if session["id"] not in self._hashers:
+            # بعد إعادة تشغيل الخادم: تُحسب البصمة عند الإنهاء
+            return
+
+        if hasher is not None and offset == session["hashed_offset"] and end > offset:
+            self._hashers[session["id"]] = hasher
+            session["hashed_offset"] = end
+        hasher = self._hashers[session["id"]]
+
+        # الأجزاء التي وصلت مبكراً تُقرأ من القرص عند اتصالها بالبداية
+        status = self._status(session)
+        if status["offset"] > session["hashed_offset"]:
+            async with aiofiles.open(self._data_path(session["id"]), "rb") as f:
+                await f.seek(session["hashed_offset"])
+                remaining = status["offset"] - session["hashed_offset"]
+                while remaining > 0:
+                    block = await f.read(min(READ_SIZE, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+                    session["hashed_offset"] += len(block)
+
+    async def cleanup_expired(self, force: bool = False) -> int:
+        """حذف الجلسات المهجورة (بلا كتابة أو تحديث خلال SESSION_TTL) وملفاتها الجزئية"""
+        now = time.time()
+        if not force and now - self._last_cleanup < CLEANUP_INTERVAL:
+            return 0
+        self._last_cleanup = now
+
+        removed = 0
+        for meta_path in self.sessions_dir.glob("*.json"):
+            session_id = meta_path.stem
+            lock = self._locks.get(session_id)
+            if session_id in self._writers or (lock is not None and lock.locked()):
+                continue
+            data_path = self._data_path(session_id)
+            try:
+                last_activity = max(
+                    path.stat().st_mtime for path in (meta_path, data_path) if path.exists()
+                )
+            except (OSError, ValueError):
+                continue
+            if now - last_activity < SESSION_TTL:
+                continue
+            for path in (data_path, meta_path):
+                try:
+                    await aiofiles.os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._locks.pop(session_id, None)
+            self._hashers.pop(session_id, None)
+            removed += 1
+        return removed
+
+    async def finalize(self, session_id: str) -> dict:
+        """التحقق من اكتمال الملف وبصمته ثم نقله إلى مجلد الرفع"""
+        async with self._lock(session_id):
+            session = await self._load(session_id)
+            if not self._status(session)["complete"]:
+                raise UploadError("الرفع غير مكتمل", 409)
+            if session_id in self._writers:
+                raise UploadError("توجد أجزاء قيد الكتابة", 409)
+
+            hasher = self._hashers.get(session_id)
+            if hasher is None or session["hashed_offset"] != session["size"]:
+                hasher = hashlib.sha256()
+                async with aiofiles.open(self._data_path(session_id), "rb") as f:
+                    while True:
+                        block = await f.read(READ_SIZE)
+                        if not block:
+                            break
+                        hasher.update(block)
+            sha256 = hasher.hexdigest()
+
+            expected = session.get("expected_sha256")
+            if expected and expected.lower() != sha256:
+                raise UploadError("بصمة الملف غير مطابقة", 422)
+
+            file_extension = os.path.splitext(session["original_name"])[1]
+            unique_filename = f"{uuid.uuid4()}{file_extension}"
+            file_path = self.upload_dir / unique_filename
+            await aiofiles.os.replace(self._data_path(session_id), file_path)
+            await aiofiles.os.remove(self._meta_path(session_id))
+
+        self._locks.pop(session_id, None)
+        self._hashers.pop(session_id, None)
+
+        return {
+            "success": True,
+            "filename": unique_filename,
+            "original_name": session["original_name"],
+            "path": str(file_path),
+            "size": session["size"],
+            "sha256": sha256
+        }
+
+    async def save_upload(self, upload_file) -> dict:
+        """حفظ ملف مرفوع دفعة واحدة بكتابة غير حاجبة مع حساب البصمة والحجم"""
+        file_extension = os.path.splitext(upload_file.filename)[1]
+        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        file_path = self.upload_dir / unique_filename
+
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(file_path, "wb") as f:
+                while True:
+                    data = await upload_file.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    size += len(data)
+                    if size > MAX_UPLOAD_SIZE:
+                        raise UploadError("حجم الملف يتجاوز الحد المسموح", 413)
+                    hasher.update(data)
+                    await f.write(data)
+        except Exception:
+            if file_path.exists():
+                file_path.unlink()
+            raise
+
+        return {
+            "success": True,
+            "filename": unique_filename,
+            "original_name": upload_file.filename,
+            "path": str(file_path),
+            "size": size,
+            "sha256": hasher.hexdigest()
+        }
@@ -1,6 +1,19 @@
 from moviepy.editor import VideoFileClip, concatenate_videoclips, CompositeVideoClip
 from pathlib import Path
-import os
+from collections import Counter
+import bisect
+
+from ffmpeg_utils import run_ffmpeg, write_concat_list
+from media_info import get_media_cache
+from render_progress import render_logger
+from workspace import atomic_output, disk_scratch, scratch_path
+
+# الترميزات التي يمكن لـ libx264 إنتاج مقاطع متوافقة معها عند القص الذكي
+SMART_CUT_CODECS = {"h264"}
+
+# المرمّزات المستخدمة لتوحيد المقاطع المختلفة مع صيغة الأغلبية قبل الدمج
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265", "vp9": "libvpx-vp9", "mpeg4": "mpeg4"}
+AUDIO_ENCODERS = {"aac": "aac", "opus": "libopus", "mp3": "libmp3lame", "vorbis": "libvorbis"}
 
 class VideoProcessor:
     def __init__(self, upload_dir: str = "../uploads", processed_dir: str = "../processed"):
@@ -8,63 +21,305 @@ class VideoProcessor:
         self.processed_dir = Path(processed_dir)
         self.upload_dir.mkdir(exist_ok=True)
         self.processed_dir.mkdir(exist_ok=True)
+        self.media_cache = get_media_cache(str(self.upload_dir.parent / "media_cache.sqlite"))
     
-    def trim_video(self, input_filename: str, start_time: float, end_time: float, output_filename: str):
-        """قص الفيديو من start_time إلى end_time"""
+    def trim_video(
+        self,
+        input_filename: str,
+        start_time: float,
+        end_time: float,
+        output_filename: str,
+        mode: str = "reencode"
+    ):
+        """قص الفيديو من start_time إلى end_time
+
+        mode: reencode (إعادة ترميز كاملة)، smart (نسخ المجموعات الكاملة
+        وإعادة ترميز أطراف القص فقط)، keyframe (نسخ بدون ترميز مع المحاذاة
+        إلى أقرب إطار مفتاحي)
+        """
         try:
             input_path = self.upload_dir / input_filename
             output_path = self.processed_dir / output_filename
             
+            if mode == "keyframe":
+                return self._trim_keyframe(input_path, start_time, end_time, output_path, output_filename)
+            if mode == "smart":
+                result = self._trim_smart(input_path, start_time, end_time, output_path, output_filename)
+                if result is not None:
+                    return result
+            elif mode != "reencode":
+                return {"success": False, "error": "وضع القص غير مدعوم"}
+            
             with VideoFileClip(str(input_path)) as video:
                 trimmed = video.subclipped(start_time, end_time)
-                trimmed.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    trimmed.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
                 "output_file": output_filename,
-                "path": str(output_path)
+                "path": str(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def concatenate_videos(self, input_filenames: list, output_filename: str):
-        """دمج عدة مقاطع فيديو"""
-        try:
-            clips = []
-            for filename in input_filenames:
-                input_path = self.upload_dir / filename
-                clip = VideoFileClip(str(input_path))
-                clips.append(clip)
+    def _trim_keyframe(self, input_path, start_time, end_time, output_path, output_filename):
+        """قص بدون إعادة ترميز: البداية تُحاذى إلى الإطار المفتاحي السابق"""
+        keyframes = self.media_cache.get(input_path)["keyframes"]
+        index = bisect.bisect_right(keyframes, start_time + 1e-3) - 1
+        actual_start = keyframes[index] if index >= 0 else 0.0
+        
+        with atomic_output(output_path) as tmp_output:
+            run_ffmpeg([
+                "-ss", f"{actual_start:.6f}",
+                "-i", input_path,
+                "-t", f"{end_time - actual_start:.6f}",
+                "-map", "0:v:0", "-map", "0:a:0?",
+                "-c", "copy",
+                "-avoid_negative_ts", "make_zero",
+                "-movflags", "+faststart",
+                tmp_output
+            ], duration=end_time - actual_start, stage="trim")
+        
+        return {
+            "success": True,
+            "output_file": output_filename,
+            "path": str(output_path),
+            "mode": "keyframe",
+            "start_time": actual_start,
+            "end_time": end_time
+        }
+    
+    def _trim_smart(self, input_path, start_time, end_time, output_path, output_filename):
+        """قص ذكي: نسخ كل مجموعة GOP كاملة داخل المدى وإعادة ترميز الأطراف فقط
+        
+        يرجع None إذا تعذر القص الذكي ليتم الرجوع لإعادة الترميز الكاملة
+        """
+        info = self.media_cache.get(input_path)
+        video_stream = next((s for s in info["streams"] if s["type"] == "video"), None)
+        if video_stream is None or video_stream["codec"] not in SMART_CUT_CODECS:
+            return None
+        
+        keyframes = info["keyframes"]
+        first_key = bisect.bisect_left(keyframes, start_time - 1e-3)
+        last_key = bisect.bisect_right(keyframes, end_time + 1e-3) - 1
+        if first_key >= len(keyframes) or last_key < 0 or keyframes[first_key] >= keyframes[last_key]:
+            # لا توجد مجموعة GOP كاملة داخل المدى
+            return None
+        copy_start = keyframes[first_key]
+        copy_end = keyframes[last_key]
+        
+        # إعدادات ترميز الأطراف لتطابق المسار المنسوخ
+        encode_args = ["-c:v", "libx264", "-pix_fmt", video_stream["pix_fmt"] or "yuv420p"]
+        profile = (video_stream["profile"] or "").lower()
+        if profile in ("baseline", "main", "high"):
+            encode_args += ["-profile:v", profile]
+        
+        with disk_scratch(self.processed_dir) as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            segments = []
             
-            final_clip = concatenate_videoclips(clips, method="compose")
-            output_path = self.processed_dir / output_filename
+            if copy_start - start_time > 1e-3:
+                head = tmp_dir / "head.ts"
+                run_ffmpeg(["-ss", f"{start_time:.6f}", "-i", input_path,
+                            "-t", f"{copy_start - start_time:.6f}",
+                            "-map", "0:v:0", "-an"] + encode_args + [head],
+                           duration=copy_start - start_time, stage="trim_head")
+                segments.append(head)
             
-            final_clip.write_videofile(
-                str(output_path),
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile='temp-audio.m4a',
-                remove_temp=True
-            )
+            middle = tmp_dir / "middle.ts"
+            run_ffmpeg(["-ss", f"{copy_start:.6f}", "-i", input_path,
+                        "-t", f"{copy_end - copy_start:.6f}",
+                        "-map", "0:v:0", "-an", "-c:v", "copy", middle],
+                       duration=copy_end - copy_start, stage="trim_copy")
+            segments.append(middle)
             
-            for clip in clips:
-                clip.close()
-            final_clip.close()
+            if end_time - copy_end > 1e-3:
+                tail = tmp_dir / "tail.ts"
+                run_ffmpeg(["-ss", f"{copy_end:.6f}", "-i", input_path,
+                            "-t", f"{end_time - copy_end:.6f}",
+                            "-map", "0:v:0", "-an"] + encode_args + [tail],
+                           duration=end_time - copy_end, stage="trim_tail")
+                segments.append(tail)
+            
+            concat_list = write_concat_list(segments, tmp_dir / "segments.txt")
+            
+            # دمج الفيديو مع الصوت المنسوخ من نفس المدى
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg([
+                    "-f", "concat", "-safe", "0", "-i", concat_list,
+                    "-ss", f"{start_time:.6f}", "-t", f"{end_time - start_time:.6f}", "-i", input_path,
+                    "-map", "0:v:0", "-map", "1:a:0?",
+                    "-c", "copy",
+                    "-movflags", "+faststart",
+                    tmp_output
+                ], duration=end_time - start_time, stage="trim")
+        
+        return {
+            "success": True,
+            "output_file": output_filename,
+            "path": str(output_path),
+            "mode": "smart",
+            "copied_range": [copy_start, copy_end]
+        }
+    
+    def concatenate_videos(self, input_filenames: list, output_filename: str, mode: str = "auto"):
+        """دمج عدة مقاطع فيديو
+
+        mode: auto (نسخ المسارات عند تطابق الصيغ وتوحيد المختلف منها فقط)،
+        reencode (إعادة ترميز كاملة)
+        """
+        try:
+            if mode == "auto":
+                result = self._concatenate_copy(input_filenames, output_filename)
+                if result is not None:
+                    return result
+            elif mode != "reencode":
+                return {"success": False, "error": "وضع الدمج غير مدعوم"}
+            
+            clips = []
+            final_clip = None
+            output_path = self.processed_dir / output_filename
+            try:
+                for filename in input_filenames:
+                    input_path = self.upload_dir / filename
+                    clips.append(VideoFileClip(str(input_path)))
+                
+                final_clip = concatenate_videoclips(clips, method="compose")
+                with atomic_output(output_path) as tmp_output:
+                    final_clip.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
+            finally:
+                # إغلاق القارئات حتى عند الفشل أو الإلغاء، وإلا تبقى عمليات ffmpeg مفتوحة
+                for clip in clips:
+                    clip.close()
+                if final_clip is not None:
+                    final_clip.close()
             
             return {
                 "success": True,
                 "output_file": output_filename,
-                "path": str(output_path)
+                "path": str(output_path),
+                "mode": "reencode"
             }
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def _stream_signature(self, info: dict) -> tuple:
+        """بصمة معاملات الترميز التي يجب أن تتطابق لنسخ المسارات عند الدمج"""
+        streams = info["streams"]
+        video = next((s for s in streams if s["type"] == "video"), {})
+        audio = next((s for s in streams if s["type"] == "audio"), None)
+        signature = (
+            video.get("codec"),
+            video.get("profile"),
+            video.get("width"),
+            video.get("height"),
+            video.get("pix_fmt"),
+            video.get("frame_rate"),
+            video.get("time_base"),
+        )
+        if audio is None:
+            return signature + (None, None, None)
+        return signature + (audio["codec"], audio["sample_rate"], audio["channels"])
+    
+    def _normalize_for_concat(self, input_path, output_path, signature: tuple):
+        """إعادة ترميز مقطع ليطابق بصمة الأغلبية"""
+        (v_codec, profile, width, height, pix_fmt, frame_rate, time_base,
+         a_codec, sample_rate, channels) = signature
+        
+        args = ["-i", input_path]
+        info = self.media_cache.get(input_path)
+        has_audio = info["has_audio"]
+        if a_codec and not has_audio:
+            # إضافة صمت للمقاطع التي لا تحتوي على صوت
+            layout = "mono" if channels == 1 else "stereo"
+            args += ["-f", "lavfi", "-i", f"anullsrc=r={sample_rate}:cl={layout}", "-shortest"]
+        
+        args += [
+            "-map", "0:v:0",
+            "-vf", (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                    f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1"),
+            "-r", frame_rate,
+            "-c:v", VIDEO_ENCODERS[v_codec],
+            "-pix_fmt", pix_fmt,
+            "-video_track_timescale", time_base.split("/")[1],
+        ]
+        if profile and v_codec == "h264" and profile.lower() in ("baseline", "main", "high"):
+            args += ["-profile:v", profile.lower()]
+        
+        if a_codec:
+            args += [
+                "-map", "1:a:0" if not has_audio else "0:a:0",
+                "-c:a", AUDIO_ENCODERS[a_codec],
+                "-ar", sample_rate,
+                "-ac", channels,
+            ]
+        else:
+            args += ["-an"]
+        
+        run_ffmpeg(args + [output_path], duration=info["duration"], stage="normalize")
+    
+    def _concatenate_copy(self, input_filenames: list, output_filename: str):
+        """دمج سريع عبر concat demuxer بنسخ المسارات دون إعادة ترميز
+        
+        يرجع None إذا تعذر توحيد الصيغ ليتم الرجوع لإعادة الترميز الكاملة
+        """
+        input_paths = [self.upload_dir / filename for filename in input_filenames]
+        infos = [self.media_cache.get(path) for path in input_paths]
+        signatures = [self._stream_signature(info) for info in infos]
+        majority, _ = Counter(signatures).most_common(1)[0]
+        
+        if majority[0] not in VIDEO_ENCODERS or (majority[7] and majority[7] not in AUDIO_ENCODERS):
+            return None
+        
+        output_path = self.processed_dir / output_filename
+        normalized = 0
+        
+        with disk_scratch(self.processed_dir) as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            parts = []
+            for index, (path, signature) in enumerate(zip(input_paths, signatures)):
+                if signature == majority:
+                    parts.append(path)
+                    continue
+                normalized_path = tmp_dir / f"part_{index}{output_path.suffix or '.mp4'}"
+                self._normalize_for_concat(path, normalized_path, majority)
+                parts.append(normalized_path)
+                normalized += 1
+            
+            concat_list = write_concat_list(parts, tmp_dir / "inputs.txt")
+            with atomic_output(output_path) as tmp_output:
+                run_ffmpeg([
+                    "-f", "concat", "-safe", "0", "-i", concat_list,
+                    "-map", "0:v:0", "-map", "0:a:0?",
+                    "-c", "copy",
+                    "-movflags", "+faststart",
+                    tmp_output
+                ], duration=sum(info["duration"] or 0 for info in infos), stage="concat")
+        
+        return {
+            "success": True,
+            "output_file": output_filename,
+            "path": str(output_path),
+            "mode": "copy",
+            "normalized_inputs": normalized
+        }
+    
     def change_speed(self, input_filename: str, speed_factor: float, output_filename: str):
         """تغيير سرعة الفيديو"""
         try:
@@ -77,13 +332,15 @@ class VideoProcessor:
                 else:
                     new_video = video
                 
-                new_video.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    new_video.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -101,13 +358,15 @@ class VideoProcessor:
             
             with VideoFileClip(str(input_path)) as video:
                 rotated = video.rotated(angle)
-                rotated.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    rotated.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -125,13 +384,15 @@ class VideoProcessor:
             
             with VideoFileClip(str(input_path)) as video:
                 resized = video.resized(newsize=(width, height))
-                resized.write_videofile(
-                    str(output_path),
-                    codec='libx264',
-                    audio_codec='aac',
-                    temp_audiofile='temp-audio.m4a',
-                    remove_temp=True
-                )
+                with atomic_output(output_path) as tmp_output:
+                    resized.write_videofile(
+                        str(tmp_output),
+                        codec='libx264',
+                        audio_codec='aac',
+                        temp_audiofile=scratch_path('temp-audio.m4a'),
+                        remove_temp=True,
+                        logger=render_logger()
+                    )
             
             return {
                 "success": True,
@@ -146,14 +407,9 @@ class VideoProcessor:
         try:
             input_path = self.upload_dir / filename
             
-            with VideoFileClip(str(input_path)) as video:
-                return {
-                    "success": True,
-                    "duration": video.duration,
-                    "fps": video.fps,
-                    "width": video.w,
-                    "height": video.h,
-                    "size": os.path.getsize(input_path)
-                }
+            info = self.media_cache.get(input_path)
+            result = {key: value for key, value in info.items() if key != "keyframes"}
+            result["success"] = True
+            return result
         except Exception as e:
             return {"success": False, "error": str(e)}
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+from pathlib import Path
+import atexit
+import os
+import secrets
+import shutil
+import tempfile
+
+# جذر مجلدات العمل المؤقتة؛ يمكن وضعه على tmpfs (مثل /dev/shm/video-editor)
+# للملفات الوسيطة الصغيرة. الافتراضي مجلد النظام المؤقت.
+SCRATCH_ROOT = os.environ.get("RENDER_SCRATCH_DIR") or None
+
+# جذر الملفات الوسيطة الكبيرة (أجزاء الفيديو) على القرص؛ الافتراضي .scratch
+# بجانب processed/ وليس داخله، لأن processed/ يُخدم للعامة
+DISK_SCRATCH_ROOT = os.environ.get("RENDER_DISK_SCRATCH_DIR") or None
+
+# مجلد المهمة الجارية داخل عملية العامل
+_current = None
+# مجلد احتياطي للاستدعاءات خارج المهام (مثل الاستدعاء المباشر للمعالجات)
+_fallback = None
+
+
+class Workspace:
+    """مجلد عمل مؤقت معزول لمهمة واحدة
+
+    يُنشأ ذرياً بـ mkdtemp باسم فريد فلا تتشارك مهمتان أي ملف وسيط،
+    ويُحذف بالكامل عند الإغلاق.
+    """
+
+    def __init__(self, prefix: str = "job-", root: str = None):
+        root = root or SCRATCH_ROOT
+        if root:
+            Path(root).mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix=prefix, dir=root))
+
+    def file(self, name: str) -> Path:
+        """مسار ملف داخل مجلد العمل"""
+        return self.path / Path(name).name
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cleanup()
+
+
+@contextmanager
+def job_workspace(job_id: str = None):
+    """تفعيل مجلد عمل خاص بالمهمة طوال تنفيذها ثم حذفه"""
+    global _current
+    previous = _current
+    with Workspace(prefix=f"job-{job_id}-" if job_id else "job-") as workspace:
+        _current = workspace
+        try:
+            yield workspace
+        finally:
+            _current = previous
+
+
+def current() -> Workspace:
+    """مجلد عمل المهمة الجارية، أو مجلد احتياطي للعملية خارج المهام"""
+    global _fallback
+    if _current is not None:
+        return _current
+    if _fallback is None:
+        _fallback = Workspace(prefix="proc-")
+        atexit.register(_fallback.cleanup)
+    return _fallback
+
+
+def scratch_path(name: str) -> str:
+    """مسار ملف وسيط (مثل الصوت المؤقت لـ moviepy) داخل مجلد عمل المهمة"""
+    return str(current().file(name))
+
+
+def disk_scratch(output_dir) -> tempfile.TemporaryDirectory:
+    """مجلد مؤقت على القرص لملفات وسيطة كبيرة، خارج المجلدات التي يخدمها الخادم"""
+    root = Path(DISK_SCRATCH_ROOT or Path(output_dir).parent / ".scratch")
+    root.mkdir(parents=True, exist_ok=True)
+    return tempfile.TemporaryDirectory(prefix="job-", dir=root)
+
+
+@contextmanager
+def atomic_output(path):
+    """الكتابة إلى ملف مؤقت بجانب المسار النهائي ثم إعادة تسميته ذرياً
+
+    الملف المؤقت في نفس المجلد (ونفس نظام الملفات) ومخفي، ويحتفظ بالامتداد
+    حتى يستنتج ffmpeg الصيغة منه. عند أي فشل أو إلغاء يُحذف ولا يظهر للقراء
+    ملف نصف مكتوب.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.stem}.{secrets.token_hex(4)}.partial{path.suffix}")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise